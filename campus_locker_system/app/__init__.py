@@ -1,6 +1,7 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail # Add this
+from werkzeug.middleware.proxy_fix import ProxyFix
 from .config import Config
 from datetime import datetime
 import datetime as dt
@@ -38,10 +39,29 @@ def create_app(config_class=Config):
     # Configure SQLAlchemy
     # NFR-01: Performance - Database optimization for fast locker assignment
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Performance optimization
-    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    engine_options = {
         'pool_pre_ping': True,
-        'pool_recycle': 3600
+        'pool_recycle': app.config.get('DB_POOL_RECYCLE', 1800)
     }
+    # In-memory SQLite runs on a StaticPool, which takes no sizing arguments
+    if ':memory:' not in app.config.get('SQLALCHEMY_DATABASE_URI', ''):
+        engine_options['pool_size'] = app.config.get('DB_POOL_SIZE', 20)
+        engine_options['max_overflow'] = app.config.get('DB_MAX_OVERFLOW', 40)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+    # NFR-03: Security - Behind nginx every request arrives from the proxy; trust PROXY_FIX_X_FOR
+    # X-Forwarded-For hops so request.remote_addr is the real client for rate limiting and auditing.
+    # Off by default: a client talking to the app directly could otherwise pick its own address
+    proxy_hops = app.config.get('PROXY_FIX_X_FOR', 0)
+    if proxy_hops > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops)
+
+    # NFR-03: Security - pin_lookup rows are keyed on PIN_LOOKUP_KEY. SECRET_KEY is regenerated on every
+    # deploy, so deriving the lookup from it would strand every PIN issued before the restart
+    if not app.config.get('PIN_LOOKUP_KEY'):
+        if app.config.get('REQUIRE_PIN_LOOKUP_KEY', False):
+            raise RuntimeError("PIN_LOOKUP_KEY is not set; refusing to derive PIN lookups from the rotating SECRET_KEY")
+        app.logger.warning("⚠️ PIN_LOOKUP_KEY is not set; PIN lookups fall back to SECRET_KEY and break when it changes")
 
     # Initialize extensions
     db.init_app(app)
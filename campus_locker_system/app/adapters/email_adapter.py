@@ -4,6 +4,9 @@ Email Adapter - External email service interface and implementation
 This adapter provides a clean interface to external email services,
 abstracting away implementation details like Flask-Mail from the business logic.
 """
+import smtplib
+import threading
+import time
 from abc import ABC, abstractmethod
 from typing import Tuple, Optional
 from dataclasses import dataclass
@@ -11,6 +14,9 @@ from flask import current_app
 from flask_mail import Message
 from app import mail
 
+# NFR-01: Performance - Each sending thread (request or notification worker) keeps its own SMTP session
+_smtp_local = threading.local()
+
 
 @dataclass
 class EmailMessage:
@@ -64,8 +70,14 @@ class FlaskMailAdapter(EmailAdapterInterface):
             if message.html_body:
                 msg.html = message.html_body
             
-            # Send via Flask-Mail
-            mail.send(msg)
+            # Send via Flask-Mail over this thread's pooled SMTP session
+            try:
+                self._get_connection().send(msg)
+                _smtp_local.last_used = time.monotonic()
+            except Exception:
+                # The session may be half-closed; the next send (or retry) opens a fresh one
+                self._close_connection()
+                raise
             
             return True, f"Email sent successfully to {message.to}"
             
@@ -74,6 +86,40 @@ class FlaskMailAdapter(EmailAdapterInterface):
             current_app.logger.error(error_msg)
             return False, error_msg
     
+    @staticmethod
+    def _get_connection():
+        """
+        NFR-01: Performance - Reuse this thread's SMTP session instead of a connect/STARTTLS/login per email.
+        A session idle for longer than SMTP_KEEPALIVE_SECONDS is probed with NOOP and reopened if the server dropped it.
+        """
+        connection = getattr(_smtp_local, 'connection', None)
+        idle_seconds = time.monotonic() - getattr(_smtp_local, 'last_used', 0.0)
+        
+        if connection is not None and connection.host is not None \
+                and idle_seconds > current_app.config.get('SMTP_KEEPALIVE_SECONDS', 30):
+            try:
+                connection.host.noop()
+            except (smtplib.SMTPException, OSError):
+                FlaskMailAdapter._close_connection()
+                connection = None
+        
+        if connection is None:
+            connection = mail.connect()
+            connection.__enter__()
+            _smtp_local.connection = connection
+        return connection
+    
+    @staticmethod
+    def _close_connection() -> None:
+        """Drop this thread's SMTP session, ignoring errors from a server that is already gone"""
+        connection = getattr(_smtp_local, 'connection', None)
+        _smtp_local.connection = None
+        if connection is not None and connection.host is not None:
+            try:
+                connection.host.close()
+            except Exception:
+                pass
+    
     def is_configured(self) -> bool:
         """Check if Flask-Mail is configured"""
         try:
@@ -49,6 +49,19 @@ class LockerManager:
         
         return locker
     
+    @staticmethod
+    def claim_available_locker(preferred_size: str):
+        """
+        Find an available locker of the preferred size and mark it occupied in the same statement
+        FR-01: Assign Locker - Atomic claim prevents two deposits from taking the same locker
+        FR-08: Out of Service - Only free lockers can be claimed
+        """
+        if not LockerManager.is_valid_size(preferred_size):
+            return None
+        
+        from app.persistence.repositories.locker_repository import LockerRepository
+        return LockerRepository.claim_available_locker_by_size(preferred_size)
+    
     @staticmethod
     def can_transition_status(current_status: str, new_status: str) -> bool:
         """Business rules for locker status transitions"""
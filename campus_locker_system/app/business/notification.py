@@ -1,10 +1,16 @@
 # Notification domain business rules and logic
+import re
 from dataclasses import dataclass
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import datetime as dt
 from enum import Enum
 
+# Stricter pattern that rejects consecutive dots and other invalid patterns, compiled once at import
+_EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9._%+-]*[a-zA-Z0-9]@[a-zA-Z0-9][a-zA-Z0-9.-]*[a-zA-Z0-9]\.[a-zA-Z]{2,}$')
+# Business rule: domains that never receive notifications
+_BLOCKED_DOMAINS = frozenset({'noreply.example.com', 'blocked.domain.com'})
+
 class NotificationType(Enum):
     """Types of notifications supported by the system"""
     PARCEL_READY_FOR_PICKUP = "parcel_ready_for_pickup"  # Initial notification without PIN
@@ -430,15 +436,12 @@ Campus Locker System""",
     @staticmethod
     def validate_email_address(email: str) -> bool:
         """Basic email validation business rule"""
-        import re
-        # Stricter pattern that rejects consecutive dots and other invalid patterns
-        pattern = r'^[a-zA-Z0-9][a-zA-Z0-9._%+-]*[a-zA-Z0-9]@[a-zA-Z0-9][a-zA-Z0-9.-]*[a-zA-Z0-9]\.[a-zA-Z]{2,}$'
         if not email or len(email) < 5:  # Minimum valid email like a@b.co
             return False
         # Check for consecutive dots
         if '..' in email:
             return False
-        return bool(re.match(pattern, email))
+        return bool(_EMAIL_PATTERN.match(email))
     
     @classmethod
     def is_delivery_allowed(cls, email: str) -> bool:
@@ -448,10 +451,7 @@ Campus Locker System""",
             return False
         
         # Add business rules for blocked domains, addresses, etc.
-        blocked_domains = ['noreply.example.com', 'blocked.domain.com']
-        domain = email.split('@')[1].lower()
-        
-        return domain not in blocked_domains
+        return email.rpartition('@')[2].lower() not in _BLOCKED_DOMAINS
     
     @classmethod
     def create_parcel_missing_admin_email(cls, parcel_id: int, locker_id: int, recipient_email: str) -> FormattedEmail:
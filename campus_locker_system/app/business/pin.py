@@ -24,6 +24,7 @@ Status: ✅ PRODUCTION READY - Security verified and cryptographically sound
 
 # PIN domain business rules and logic
 import hashlib
+import hmac
 import os
 from datetime import datetime, timedelta
 from flask import current_app
@@ -33,6 +34,9 @@ import string
 import bcrypt
 from typing import Tuple, Optional
 
+# NFR-03: Security - Well-formed stand-in hash that no PIN matches, verified when pickup finds no candidate
+_DUMMY_PIN_HASH = ("00" * 16) + ":" + ("00" * 64)
+
 class PinManager:
     """
     Business logic for PIN management
@@ -67,11 +71,36 @@ class PinManager:
             stored_hash = bytes.fromhex(stored_hash_hex)
             # NFR-03: Security - Use same PBKDF2 parameters for consistent timing
             provided_hash = hashlib.pbkdf2_hmac('sha256', provided_pin.encode('utf-8'), salt, 100000, dklen=64)
-            return provided_hash == stored_hash
+            # NFR-03: Security - Constant-time comparison, no early exit on the first differing byte
+            return hmac.compare_digest(provided_hash, stored_hash)
         except (ValueError, AttributeError):
             # NFR-03: Security - Graceful error handling without information leakage
             return False
+
+    @staticmethod
+    def verify_pin_against_dummy(provided_pin):
+        """
+        NFR-03: Security - Run one full PBKDF2 verification that never matches, so a pickup
+        attempt costs the same whether or not a candidate parcel exists for the PIN
+        """
+        PinManager.verify_pin(_DUMMY_PIN_HASH, provided_pin)
+        return False
     
+    @staticmethod
+    def generate_pin_lookup(pin):
+        """
+        NFR-01: Performance - Deterministic, indexable lookup key for a PIN, so pickup can
+        fetch the candidate parcel directly instead of verifying every deposited parcel
+        NFR-03: Security - Keyed HMAC-SHA256, the database alone does not reveal the PIN.
+        The key is PIN_LOOKUP_KEY, not SECRET_KEY; SECRET_KEY is only a development fallback
+        (create_app refuses to start without PIN_LOOKUP_KEY when REQUIRE_PIN_LOOKUP_KEY is set)
+        """
+        try:
+            key = current_app.config.get('PIN_LOOKUP_KEY') or current_app.config['SECRET_KEY']
+            return hmac.new(key.encode('utf-8'), pin.encode('utf-8'), hashlib.sha256).hexdigest()
+        except (AttributeError, KeyError, TypeError):
+            return None
+
     @staticmethod
     def is_pin_expired(otp_expiry):
         """
@@ -84,12 +113,12 @@ class PinManager:
         return datetime.now(dt.UTC) > otp_expiry
     
     @staticmethod
-    def generate_expiry_time(hours=None):
-        """NFR-03: Security - Generate configurable PIN expiry time for time-limited access"""
+    def generate_expiry_time(hours=None, now=None):
+        """NFR-03: Security - Generate configurable PIN expiry time for time-limited access, counted from now"""
         if hours is None:
             # Get from Flask app config, default to 24 hours if not configured
             hours = current_app.config.get('PIN_EXPIRY_HOURS', 24)
-        return datetime.now(dt.UTC) + timedelta(hours=hours)
+        return (now or datetime.now(dt.UTC)) + timedelta(hours=hours)
     
     @staticmethod
     def get_pin_expiry_hours():
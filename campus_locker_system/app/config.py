@@ -22,6 +22,12 @@ class Config:
 
     # Audit database configuration
     AUDIT_DB_FILENAME = 'campus_locker_audit.db'
+    AUDIT_LOGGING_ENABLED = os.environ.get('AUDIT_LOGGING_ENABLED', 'True').lower() == 'true'  # FR-07: keep on in production
+    AUDIT_ASYNC_ENABLED = os.environ.get('AUDIT_ASYNC_ENABLED', 'True').lower() == 'true'  # Write audit events from a background thread
+    AUDIT_WRITER_BATCH_SIZE = int(os.environ.get('AUDIT_WRITER_BATCH_SIZE', 100))  # Events per audit INSERT/commit
+    AUDIT_WRITER_FLUSH_SECONDS = float(os.environ.get('AUDIT_WRITER_FLUSH_SECONDS', 0.5))  # Max wait to fill a batch
+    AUDIT_QUEUE_MAX_SIZE = int(os.environ.get('AUDIT_QUEUE_MAX_SIZE', 10000))  # Full queue falls back to inline writes
+    AUDIT_SAMPLING_WINDOW_SECONDS = int(os.environ.get('AUDIT_SAMPLING_WINDOW_SECONDS', 60))  # Repeated failures per client collapse per window (0 logs all)
     AUDIT_SQLALCHEMY_DATABASE_URI = os.environ.get('AUDIT_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, '..', 'databases', AUDIT_DB_FILENAME) # In databases folder
 
@@ -38,6 +44,15 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@campuslocker.local')
 
+    # NFR-01: Performance - Background email delivery keeps SMTP latency out of request handling
+    NOTIFICATION_ASYNC_ENABLED = os.environ.get('NOTIFICATION_ASYNC_ENABLED', 'True').lower() == 'true'
+    NOTIFICATION_WORKER_THREADS = int(os.environ.get('NOTIFICATION_WORKER_THREADS', 2))
+    NOTIFICATION_MAX_RETRIES = int(os.environ.get('NOTIFICATION_MAX_RETRIES', 5))
+    NOTIFICATION_RETRY_BACKOFF_SECONDS = float(os.environ.get('NOTIFICATION_RETRY_BACKOFF_SECONDS', 2))
+    NOTIFICATION_QUEUE_MAX_SIZE = int(os.environ.get('NOTIFICATION_QUEUE_MAX_SIZE', 500))  # Queued or retrying emails before new ones are refused
+    NOTIFICATION_SHUTDOWN_TIMEOUT_SECONDS = float(os.environ.get('NOTIFICATION_SHUTDOWN_TIMEOUT_SECONDS', 10))  # Time at exit to finish queued emails; the rest are audited as failed
+    SMTP_KEEPALIVE_SECONDS = int(os.environ.get('SMTP_KEEPALIVE_SECONDS', 30))  # Idle time before a pooled SMTP session is re-checked with NOOP
+
     # Admin notification configuration
     ADMIN_NOTIFICATION_EMAIL = os.environ.get('ADMIN_NOTIFICATION_EMAIL', 'admin@campuslocker.local')
 
@@ -47,10 +62,15 @@ class Config:
 
     # Parcel Lifecycle Configuration
     PARCEL_MAX_PICKUP_DAYS = 7
+    OVERDUE_PROCESSING_CHUNK_SIZE = int(os.environ.get('OVERDUE_PROCESSING_CHUNK_SIZE', 500))  # Parcels per overdue transaction
+    REMINDER_PROCESSING_BATCH_SIZE = int(os.environ.get('REMINDER_PROCESSING_BATCH_SIZE', 500))  # Parcels loaded per reminder fetch
     PARCEL_MAX_PIN_REISSUE_DAYS = 7
 
     # PIN Configuration
     PIN_EXPIRY_HOURS = int(os.environ.get('PIN_EXPIRY_HOURS', 24))  # PIN validity in hours
+    PIN_LOOKUP_KEY = os.environ.get('PIN_LOOKUP_KEY')  # Persistent HMAC key for the indexed pickup lookup column; must survive SECRET_KEY rotation
+    # Refuse to start without PIN_LOOKUP_KEY (production default); otherwise fall back to SECRET_KEY with a warning
+    REQUIRE_PIN_LOOKUP_KEY = os.environ.get('REQUIRE_PIN_LOOKUP_KEY', str(os.environ.get('FLASK_ENV') == 'production')).lower() == 'true'
     
     # FR-04: Send Reminder After 24h of Occupancy - Configurable timing
     REMINDER_HOURS_AFTER_DEPOSIT = int(os.environ.get('REMINDER_HOURS_AFTER_DEPOSIT', 24))  # Hours to wait before sending reminder
@@ -83,13 +103,22 @@ class Config:
         'module': 'sqlite3'  # Ensure consistent SQLite behavior
     }
     
+    # NFR-01: Performance - Connection pool sizing so concurrent requests reuse pooled connections
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 20))  # Persistent connections per engine
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 40))  # Extra connections allowed under burst load
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # Seconds before a pooled connection is replaced
+
     # NFR-02: Reliability - Database crash safety and reliability features
     ENABLE_SQLITE_WAL_MODE = os.environ.get('ENABLE_SQLITE_WAL_MODE', 'true').lower() == 'true'
-    SQLITE_SYNCHRONOUS_MODE = os.environ.get('SQLITE_SYNCHRONOUS_MODE', 'NORMAL')  # NORMAL, FULL, OFF
+    SQLITE_SYNCHRONOUS_MODE = os.environ.get('SQLITE_SYNCHRONOUS_MODE', 'NORMAL')  # OFF, NORMAL, FULL or EXTRA
     
     # Email-based PIN Generation Configuration (Only System)
     PIN_GENERATION_TOKEN_EXPIRY_HOURS = int(os.environ.get('PIN_GENERATION_TOKEN_EXPIRY', 24))  # hours
     MAX_PIN_GENERATIONS_PER_DAY = int(os.environ.get('MAX_PIN_GENERATIONS_PER_DAY', 3))
+    PIN_LOOKUP_RPM = int(os.environ.get('PIN_LOOKUP_RPM', 60))  # PIN link/re-issue requests per client IP per minute across all workers (0 disables)
+    RATE_LIMITER_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))  # Worker processes (gunicorn reads the same variable); each keeps 1/N of every limit
+    RATE_LIMITER_MAX_KEYS = int(os.environ.get('RATE_LIMITER_MAX_KEYS', 10000))  # Client buckets kept in memory
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))  # Reverse proxies (nginx) in front of the app; keep 0 when clients can reach it directly
 
     LOG_DIR = os.environ.get('LOG_DIR') or os.path.abspath(os.path.join(basedir, '..', 'logs'))
 
@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 import datetime as dt
 import bcrypt # Added bcrypt import
 import uuid
-from sqlalchemy import TypeDecorator, DateTime
+from sqlalchemy import TypeDecorator, DateTime, Index, CheckConstraint, text
 # Removed imports of Parcel and Locker from business layer, as they will be defined here.
 # from app.business.parcel import Parcel 
 # from app.business.locker import Locker
@@ -55,6 +55,7 @@ class Parcel(db.Model):
     locker_id = db.Column(db.Integer, db.ForeignKey('locker.id'), nullable=True)  # Allow null for detached missing parcels
     pin_hash = db.Column(db.String(128), nullable=True)  # SHA-256 hash - now nullable for email-based PIN generation
     otp_expiry = db.Column(UTCDateTime, nullable=True)  # Now nullable for email-based PIN generation
+    pin_lookup = db.Column(db.String(64), nullable=True)  # Keyed HMAC-SHA256 of the PIN alone, indexed for pickup lookup
     recipient_email = db.Column(db.String(120), nullable=False)
     # Possible statuses: 'deposited', 'picked_up', 'missing', 'expired', 'retracted_by_sender', 'pickup_disputed', 'awaiting_return', 'return_to_sender'
     status = db.Column(db.String(50), nullable=False, default='deposited')
@@ -70,6 +71,24 @@ class Parcel(db.Model):
     # FR-04: Send Reminder After 24h of Occupancy - Track reminder sent status
     reminder_sent_at = db.Column(UTCDateTime, nullable=True)  # When the 24h reminder was sent
 
+    # NFR-01: Performance - Indexes for the hot status queries (pickup, overdue and reminder scans)
+    # and for resolving emailed PIN generation tokens
+    __table_args__ = (
+        # Per-locker lookups by status (occupancy checks, locker parcel listings)
+        Index('ix_parcel_status_locker_id', 'status', 'locker_id'),
+        Index('ix_parcel_pin_generation_token', 'pin_generation_token'),
+        Index('ix_parcel_status_pin_lookup', 'status', 'pin_lookup'),
+        # Overdue scan - status equality plus deposited_at range; status is a bound parameter,
+        # which SQLite cannot match against a partial index
+        Index('ix_parcel_status_deposited_at', 'status', 'deposited_at'),
+        # FR-04: Reminder scan - equality columns first (status, reminder_sent_at IS NULL), range column last
+        Index('ix_parcel_reminder_scan', 'status', 'reminder_sent_at', 'deposited_at'),
+        # FR-05: Re-issue lookup - case-insensitive recipient email equality within a locker
+        Index('ix_parcel_email_lower_locker_status', text('lower(recipient_email)'), 'locker_id', 'status'),
+        # Status values are stored without surrounding whitespace, so callers can compare them as-is
+        CheckConstraint('status = TRIM(status)', name='ck_parcel_status_trimmed'),
+    )
+
     def __repr__(self):
         return f'<Parcel {self.id} in Locker {self.locker_id} - Status: {self.status}>'
     
@@ -78,15 +97,19 @@ class Parcel(db.Model):
         Generate new PIN generation token with expiry
         Follows hexagonal architecture: Domain model generates and returns business value
         """
-        self.pin_generation_token = str(uuid.uuid4())
-        self.pin_generation_token_expiry = datetime.now(dt.UTC) + timedelta(hours=expiry_hours)
+        self.pin_generation_token, self.pin_generation_token_expiry = Parcel.new_pin_token(expiry_hours)
         return self.pin_generation_token
     
-    def is_pin_token_valid(self):
-        """Check if PIN generation token is still valid"""
+    @staticmethod
+    def new_pin_token(expiry_hours=1, now=None):
+        """Create a (token, expiry) pair without assigning it, for callers that write it with a single UPDATE"""
+        return str(uuid.uuid4()), (now or datetime.now(dt.UTC)) + timedelta(hours=expiry_hours)
+    
+    def is_pin_token_valid(self, now=None):
+        """Check if PIN generation token is still valid (as of now, defaulting to the current time)"""
         if not self.pin_generation_token or not self.pin_generation_token_expiry:
             return False
-        return datetime.now(dt.UTC) < self.pin_generation_token_expiry
+        return (now or datetime.now(dt.UTC)) < self.pin_generation_token_expiry
     
     def can_reissue_pin(self):
         """Check if PIN can be reissued based on business rules"""
@@ -97,13 +120,13 @@ class Parcel(db.Model):
             return True
         return False
     
-    def can_generate_pin(self, max_daily_generations: int = 3):
+    def can_generate_pin(self, max_daily_generations: int = 3, now=None):
         """
         Domain business rule: Check if PIN generation is allowed based on daily limits
         Follows hexagonal architecture: Business rules contained in domain model
         """
         # If it's a new day, reset is allowed
-        if self.last_pin_generation and (datetime.now(dt.UTC) - self.last_pin_generation).days >= 1:
+        if self.last_pin_generation and ((now or datetime.now(dt.UTC)) - self.last_pin_generation).days >= 1:
             return True
         # Check if within daily generation limit (handle None values)
         current_count = self.pin_generation_count or 0
@@ -1,4 +1,5 @@
 from typing import Optional
+from sqlalchemy import exists, select
 from app import db
 from app.persistence.models import AdminUser as PersistenceAdminUser
 from flask import current_app
@@ -13,6 +14,15 @@ class AdminRepository:
             current_app.logger.error(f"Error fetching admin by username '{username}' from repository: {str(e)}")
             return None
 
+    @staticmethod
+    def username_exists(username: str) -> bool:
+        """Checks whether a username is taken with a scalar EXISTS query, without loading the admin row."""
+        try:
+            return bool(db.session.scalar(select(exists().where(PersistenceAdminUser.username == username))))
+        except Exception as e:
+            current_app.logger.error(f"Error checking admin username '{username}' in repository: {str(e)}")
+            return False
+
     @staticmethod
     def get_by_id(admin_id: int) -> Optional[PersistenceAdminUser]:
         """Fetches a persistence admin user by ID."""
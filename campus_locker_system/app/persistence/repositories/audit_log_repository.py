@@ -22,31 +22,64 @@ class AuditLogRepository:
 
     @staticmethod
     def create_and_save_log(action: str, details: Optional[Dict[str, Any]] = None, 
-                              admin_id: Optional[int] = None, admin_username: Optional[str] = None) -> bool:
+                              admin_id: Optional[int] = None, admin_username: Optional[str] = None,
+                              commit: bool = True) -> bool:
         """Creates a new AuditLog entry and saves it using the repository.
            This combines creation and saving for convenience.
+           With commit=False the entry is only added to the session, so the caller's commit persists it.
         """
         try:
-            details_json = None
-            if details is not None:
-                try:
-                    details_json = json.dumps(details)
-                except TypeError as te:
-                    current_app.logger.error(f"AuditLog details serialization error for action '{action}': {str(te)}. Storing as raw string.")
-                    details_json = str(details) # Fallback to string representation
-
             log_entry = PersistenceAuditLog(
                 timestamp=datetime.now(dt.UTC),
                 action=action,
-                details=details_json, # Pass the JSON string
+                details=AuditLogRepository._serialize_details(action, details), # Pass the JSON string
                 admin_id=admin_id,
                 admin_username=admin_username
             )
+            if not commit:
+                db.session.add(log_entry)
+                return True
             return AuditLogRepository.save_log(log_entry)
         except Exception as e:
             current_app.logger.error(f"Error creating and saving audit log for action '{action}': {str(e)}")
             return False
 
+    @staticmethod
+    def create_and_save_logs_bulk(entries: List[Dict[str, Any]]) -> bool:
+        """Creates many AuditLog entries with a single bulk INSERT and one commit.
+           Each entry is a dict with 'action' and optional 'details', 'admin_id', 'admin_username'
+           and 'timestamp' (defaults to now, for entries written when they are recorded).
+        """
+        if not entries:
+            return True
+        try:
+            timestamp = datetime.now(dt.UTC)
+            rows = [{
+                'timestamp': entry.get('timestamp') or timestamp,
+                'action': entry['action'],
+                'details': AuditLogRepository._serialize_details(entry['action'], entry.get('details')),
+                'admin_id': entry.get('admin_id'),
+                'admin_username': entry.get('admin_username')
+            } for entry in entries]
+            db.session.bulk_insert_mappings(PersistenceAuditLog, rows)
+            db.session.commit()
+            return True
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error bulk saving {len(entries)} audit logs in repository: {str(e)}")
+            return False
+
+    @staticmethod
+    def _serialize_details(action: str, details: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Serializes audit details to JSON, falling back to str() for non-serializable values."""
+        if details is None:
+            return None
+        try:
+            return json.dumps(details)
+        except TypeError as te:
+            current_app.logger.error(f"AuditLog details serialization error for action '{action}': {str(te)}. Storing as raw string.")
+            return str(details) # Fallback to string representation
+
     @staticmethod
     def get_paginated_logs(page: int, per_page: int):
         """Fetches paginated audit logs, ordered by timestamp descending."""
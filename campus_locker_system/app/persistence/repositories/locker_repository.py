@@ -1,7 +1,8 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
 from app import db
 from app.persistence.models import Locker as PersistenceLocker # Assuming your model is named Locker
 from flask import current_app
+from sqlalchemy import case, select, update
 
 class LockerRepository:
     @staticmethod
@@ -62,6 +63,29 @@ class LockerRepository:
             current_app.logger.error(f"Error finding available locker of size '{size}' with locking: {str(e)}")
             return None
 
+    @staticmethod
+    def claim_available_locker_by_size(size: str) -> Optional[PersistenceLocker]:
+        """
+        Atomically marks one free locker of the given size as occupied and returns it, without committing.
+        NFR-01: Performance - Check and claim happen in a single UPDATE ... RETURNING, so an exhausted size
+        fails fast in one round trip and no separate UPDATE is flushed for the claimed locker.
+        """
+        try:
+            free_locker_id = (select(PersistenceLocker.id)
+                              .where(PersistenceLocker.size == size, PersistenceLocker.status == 'free')
+                              .order_by(PersistenceLocker.id)
+                              .limit(1)
+                              .scalar_subquery())
+            return db.session.scalars(
+                update(PersistenceLocker)
+                .where(PersistenceLocker.id == free_locker_id, PersistenceLocker.status == 'free')
+                .values(status='occupied')
+                .returning(PersistenceLocker)
+            ).one_or_none()
+        except Exception as e:
+            current_app.logger.error(f"Error claiming available locker of size '{size}' in repository: {str(e)}")
+            return None
+
     @staticmethod
     def get_count_by_status(status: str) -> int:
         """Returns the total count of lockers with a specific status."""
@@ -80,6 +104,48 @@ class LockerRepository:
             current_app.logger.error(f"Error fetching lockers by size '{size}' and status '{status}': {str(e)}")
             return []
 
+    @staticmethod
+    def release_if_in_service(locker_id: int) -> None:
+        """Sets a locker to 'free' in a single UPDATE unless it is out of service, without committing."""
+        try:
+            db.session.execute(
+                update(PersistenceLocker)
+                .where(PersistenceLocker.id == locker_id, PersistenceLocker.status != 'out_of_service')
+                .values(status='free')
+            )
+        except Exception as e:
+            current_app.logger.error(f"Error releasing locker ID '{locker_id}' in repository: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_statuses(locker_ids: List[int]) -> Dict[int, str]:
+        """Returns {locker_id: status} for the given lockers in one SELECT."""
+        if not locker_ids:
+            return {}
+        try:
+            rows = db.session.execute(
+                select(PersistenceLocker.id, PersistenceLocker.status).where(PersistenceLocker.id.in_(locker_ids))
+            ).all()
+            return {row.id: row.status for row in rows}
+        except Exception as e:
+            current_app.logger.error(f"Error fetching statuses for {len(locker_ids)} lockers in repository: {str(e)}")
+            raise
+
+    @staticmethod
+    def set_statuses_bulk(statuses_by_id: Dict[int, str]) -> None:
+        """Sets each locker to its own target status in a single UPDATE ... CASE, without committing."""
+        if not statuses_by_id:
+            return
+        try:
+            db.session.execute(
+                update(PersistenceLocker)
+                .where(PersistenceLocker.id.in_(list(statuses_by_id)))
+                .values(status=case(statuses_by_id, value=PersistenceLocker.id))
+            )
+        except Exception as e:
+            current_app.logger.error(f"Error setting statuses for {len(statuses_by_id)} lockers in repository: {str(e)}")
+            raise
+
     @staticmethod
     def add_to_session(persistence_locker: PersistenceLocker) -> None:
         """Adds a locker instance to the current session without committing."""
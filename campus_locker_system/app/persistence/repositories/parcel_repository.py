@@ -1,8 +1,10 @@
-from typing import Optional, List, Iterable
+from typing import Optional, List, Iterable, Iterator, Tuple
 from app import db
 from app.persistence.models import Parcel as PersistenceParcel, Locker as PersistenceLocker # Import Locker for joins if needed later
 from flask import current_app
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, select, update, func, case
+from sqlalchemy.orm import joinedload, load_only
 
 class ParcelRepository:
     @staticmethod
@@ -14,6 +16,20 @@ class ParcelRepository:
             current_app.logger.error(f"Error fetching parcel by ID '{parcel_id}' from repository: {str(e)}")
             return None
 
+    @staticmethod
+    def get_by_id_with_locker(parcel_id: int, for_update: bool = False) -> Optional[PersistenceParcel]:
+        """
+        Fetches a parcel by its ID with its locker eagerly joined (single round-trip).
+        With for_update=True the parcel row is locked (SELECT ... FOR UPDATE OF parcel) until the
+        transaction ends, serializing concurrent state transitions on PostgreSQL/MySQL.
+        """
+        try:
+            return db.session.get(PersistenceParcel, parcel_id, options=[joinedload(PersistenceParcel.locker)],
+                                  with_for_update={'of': PersistenceParcel} if for_update else None)
+        except Exception as e:
+            current_app.logger.error(f"Error fetching parcel with locker by ID '{parcel_id}' from repository: {str(e)}")
+            return None
+
     @staticmethod
     def get_all_by_status(status: str) -> List[PersistenceParcel]:
         """Fetches all parcels with a specific status."""
@@ -34,6 +50,27 @@ class ParcelRepository:
             current_app.logger.error(f"Error fetching deposited parcels for PIN check: {str(e)}")
             return []
 
+    @staticmethod
+    def get_deposited_pin_candidates(pin_lookup: Optional[str]) -> List[PersistenceParcel]:
+        """
+        Fetches deposited parcels whose pin_lookup matches, via ix_parcel_status_pin_lookup.
+        Parcels issued a PIN before pin_lookup existed (NULL) are included so they stay collectable;
+        parcels still waiting for their first PIN have no pin_hash and are never candidates.
+        """
+        try:
+            lookup_filter = and_(PersistenceParcel.pin_lookup.is_(None), PersistenceParcel.pin_hash.isnot(None))
+            if pin_lookup:
+                lookup_filter = or_(PersistenceParcel.pin_lookup == pin_lookup, lookup_filter)
+            # No row lock (SQLite would not emit FOR UPDATE anyway): a concurrent pickup of the same parcel
+            # still finds it here, and the conditional claim in mark_picked_up_if_deposited decides the race
+            return PersistenceParcel.query.filter(
+                PersistenceParcel.status == 'deposited',
+                lookup_filter
+            ).all()
+        except Exception as e:
+            current_app.logger.error(f"Error fetching deposited parcels for PIN lookup: {str(e)}")
+            return []
+
     @staticmethod
     def get_all_deposited_older_than(cutoff_datetime: datetime) -> List[PersistenceParcel]:
         """Fetches all deposited parcels whose deposited_at is older than or equal to the cutoff_datetime."""
@@ -48,23 +85,94 @@ class ParcelRepository:
             return []
 
     @staticmethod
-    def get_all_deposited_needing_reminder(reminder_cutoff_time: datetime) -> List[PersistenceParcel]:
-        """Fetches parcels that are deposited, older than reminder_cutoff_time, and haven't had a reminder sent."""
+    def mark_overdue_returned_batch(cutoff_datetime: datetime, limit: int) -> List[Tuple[int, int]]:
+        """
+        Moves up to `limit` overdue deposited parcels (lowest IDs first) to 'return_to_sender' in one
+        UPDATE ... WHERE id IN (SELECT ... LIMIT) RETURNING id, locker_id, without committing.
+        Only parcels whose locker exists are selected; updated rows leave 'deposited', so repeated
+        calls walk the overdue set without an offset.
+        Returns a list of (parcel_id, locker_id).
+        """
         try:
-            return PersistenceParcel.query.filter(
-                PersistenceParcel.status == 'deposited',
-                PersistenceParcel.deposited_at <= reminder_cutoff_time,
-                PersistenceParcel.reminder_sent_at.is_(None)
+            overdue_ids = (
+                select(PersistenceParcel.id)
+                .join(PersistenceLocker, PersistenceLocker.id == PersistenceParcel.locker_id)
+                .where(PersistenceParcel.status == 'deposited', PersistenceParcel.deposited_at <= cutoff_datetime)
+                .order_by(PersistenceParcel.id)
+                .limit(limit)
+            )
+            rows = db.session.execute(
+                update(PersistenceParcel)
+                .where(PersistenceParcel.id.in_(overdue_ids))
+                .values(status='return_to_sender')
+                .returning(PersistenceParcel.id, PersistenceParcel.locker_id),
+                execution_options={"synchronize_session": "fetch"}
             ).all()
+            return sorted((row.id, row.locker_id) for row in rows)
         except Exception as e:
-            current_app.logger.error(f"Error fetching parcels needing reminder: {str(e)}")
+            current_app.logger.error(f"Error marking overdue parcels older than {cutoff_datetime} as returned: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_overdue_ids_without_locker(cutoff_datetime: datetime) -> List[int]:
+        """Returns IDs of overdue deposited parcels whose locker is missing (these cannot be returned)."""
+        try:
+            rows = db.session.execute(
+                select(PersistenceParcel.id)
+                .outerjoin(PersistenceLocker, PersistenceLocker.id == PersistenceParcel.locker_id)
+                .where(PersistenceParcel.status == 'deposited',
+                       PersistenceParcel.deposited_at <= cutoff_datetime,
+                       PersistenceLocker.id.is_(None))
+                .order_by(PersistenceParcel.id)
+            ).all()
+            return [row.id for row in rows]
+        except Exception as e:
+            current_app.logger.error(f"Error fetching overdue parcels without locker: {str(e)}")
             return []
 
+    @staticmethod
+    def iter_deposited_needing_reminder(reminder_cutoff_time: datetime, batch_size: int) -> Iterator[PersistenceParcel]:
+        """Streams parcels that are deposited, older than reminder_cutoff_time, and haven't had a reminder sent.
+           NFR-01: Performance - Loads batch_size rows at a time by id and detaches each batch once the caller
+           has moved past it, so memory stays bounded however large the backlog is.
+           Only the columns the reminder sweep reads are loaded.
+        """
+        last_id = 0
+        while True:
+            try:
+                batch = PersistenceParcel.query.options(load_only(
+                    PersistenceParcel.id, PersistenceParcel.locker_id, PersistenceParcel.recipient_email,
+                    PersistenceParcel.deposited_at, PersistenceParcel.pin_generation_token
+                )).filter(
+                    PersistenceParcel.status == 'deposited',
+                    PersistenceParcel.deposited_at <= reminder_cutoff_time,
+                    PersistenceParcel.reminder_sent_at.is_(None),
+                    PersistenceParcel.id > last_id
+                ).order_by(PersistenceParcel.id).limit(batch_size).all()
+            except Exception as e:
+                current_app.logger.error(f"Error fetching parcels needing reminder: {str(e)}")
+                return
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            last_id = batch[-1].id
+            for parcel in batch:
+                db.session.expunge(parcel)
+
     @staticmethod
     def get_by_pin_generation_token(token: str) -> Optional[PersistenceParcel]:
-        """Fetches a parcel by its PIN generation token."""
+        """
+        Fetches a parcel by its PIN generation token.
+        NFR-01: Performance - Loads only the columns PIN generation checks and reports; PIN hashes,
+        pickup and reminder timestamps stay unloaded (and load on access if a caller needs them)
+        """
         try:
-            return PersistenceParcel.query.filter_by(pin_generation_token=token).first()
+            return PersistenceParcel.query.options(load_only(
+                PersistenceParcel.id, PersistenceParcel.locker_id, PersistenceParcel.recipient_email,
+                PersistenceParcel.status, PersistenceParcel.pin_generation_token,
+                PersistenceParcel.pin_generation_token_expiry, PersistenceParcel.pin_generation_count,
+                PersistenceParcel.last_pin_generation
+            )).filter_by(pin_generation_token=token).first()
         except Exception as e:
             current_app.logger.error(f"Error fetching parcel by pin_generation_token '{token[:8]}...': {str(e)}")
             return None
@@ -73,8 +181,10 @@ class ParcelRepository:
     def get_by_email_and_locker_and_status(email: str, locker_id: int, status: str) -> Optional[PersistenceParcel]:
         """Fetches a parcel by recipient email, locker ID, and status."""
         try:
+            # Case-insensitive equality (served by ix_parcel_email_lower_locker_status); unlike ILIKE,
+            # '_' and '%' in an address are not treated as wildcards
             return PersistenceParcel.query.filter(
-                PersistenceParcel.recipient_email.ilike(email), # Case-insensitive email match
+                func.lower(PersistenceParcel.recipient_email) == email.lower(),
                 PersistenceParcel.locker_id == locker_id,
                 PersistenceParcel.status == status
             ).first()
@@ -132,6 +242,106 @@ class ParcelRepository:
             current_app.logger.error(f"Error saving parcel ID '{persistence_parcel.id}' in repository: {str(e)}")
             return False
 
+    @staticmethod
+    def mark_picked_up_if_deposited(parcel_id: int, picked_up_at: datetime) -> Tuple[bool, Optional[int]]:
+        """
+        Atomically moves a deposited parcel to 'picked_up' without committing.
+        Uses UPDATE ... WHERE status='deposited' RETURNING locker_id, so a concurrent pickup
+        that already claimed the parcel makes this return (False, None).
+        Returns (claimed, locker_id).
+        """
+        try:
+            result = db.session.execute(
+                update(PersistenceParcel)
+                .where(PersistenceParcel.id == parcel_id, PersistenceParcel.status == 'deposited')
+                .values(status='picked_up', picked_up_at=picked_up_at)
+                .returning(PersistenceParcel.locker_id)
+            ).first()
+            if result is None:
+                return False, None
+            return True, result.locker_id
+        except Exception as e:
+            current_app.logger.error(f"Error marking parcel ID '{parcel_id}' as picked up in repository: {str(e)}")
+            raise
+
+    @staticmethod
+    def issue_pin_by_token(parcel_id: int, token: str, pin_hash: str, pin_lookup: Optional[str],
+                           otp_expiry: datetime, issued_at: datetime, max_daily_generations: int) -> Optional[int]:
+        """
+        Atomically stores a newly generated PIN on a deposited parcel without committing.
+        The UPDATE ... WHERE re-checks the token, its expiry and the daily generation limit, so a concurrent
+        request that changed the parcel first makes this return None.
+        Returns the parcel's new pin_generation_count.
+        """
+        try:
+            result = db.session.execute(
+                update(PersistenceParcel)
+                .where(
+                    PersistenceParcel.id == parcel_id,
+                    PersistenceParcel.pin_generation_token == token,
+                    PersistenceParcel.status == 'deposited',
+                    PersistenceParcel.pin_generation_token_expiry > issued_at,
+                    or_(PersistenceParcel.last_pin_generation <= issued_at - timedelta(days=1),
+                        func.coalesce(PersistenceParcel.pin_generation_count, 0) < max_daily_generations)
+                )
+                .values(pin_hash=pin_hash, pin_lookup=pin_lookup, otp_expiry=otp_expiry,
+                        # The first generation of a new day starts the daily count again
+                        pin_generation_count=case(
+                            (PersistenceParcel.last_pin_generation <= issued_at - timedelta(days=1), 1),
+                            else_=func.coalesce(PersistenceParcel.pin_generation_count, 0) + 1
+                        ),
+                        last_pin_generation=issued_at)
+                .returning(PersistenceParcel.pin_generation_count),
+                execution_options={"synchronize_session": "fetch"}
+            ).first()
+            return result.pin_generation_count if result is not None else None
+        except Exception as e:
+            current_app.logger.error(f"Error issuing PIN for parcel ID '{parcel_id}' in repository: {str(e)}")
+            raise
+
+    @staticmethod
+    def reissue_pin_token(parcel_id: int, token: str, token_expiry: datetime, issued_at: datetime, reset_count: bool) -> bool:
+        """
+        Stores a new PIN generation token on a deposited parcel without committing.
+        The daily generation count is reset in the same UPDATE when reset_count is set or the last
+        generation is at least a day old. Returns False if the parcel is no longer deposited.
+        """
+        try:
+            if reset_count:
+                new_count = 0
+            else:
+                new_count = case((PersistenceParcel.last_pin_generation <= issued_at - timedelta(days=1), 0),
+                                 else_=PersistenceParcel.pin_generation_count)
+            result = db.session.execute(
+                update(PersistenceParcel)
+                .where(PersistenceParcel.id == parcel_id, PersistenceParcel.status == 'deposited')
+                .values(pin_generation_token=token, pin_generation_token_expiry=token_expiry, pin_generation_count=new_count)
+                .returning(PersistenceParcel.id),
+                execution_options={"synchronize_session": "fetch"}
+            ).first()
+            return result is not None
+        except Exception as e:
+            current_app.logger.error(f"Error reissuing PIN token for parcel ID '{parcel_id}' in repository: {str(e)}")
+            raise
+
+    @staticmethod
+    def mark_reminders_sent(parcel_ids: List[int], sent_at: datetime) -> bool:
+        """Sets reminder_sent_at for all given parcels with one UPDATE and a single commit."""
+        if not parcel_ids:
+            return True
+        try:
+            db.session.execute(
+                update(PersistenceParcel)
+                .where(PersistenceParcel.id.in_(parcel_ids))
+                .values(reminder_sent_at=sent_at)
+            )
+            db.session.commit()
+            return True
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error marking reminders sent for {len(parcel_ids)} parcels in repository: {str(e)}")
+            return False
+
     @staticmethod
     def add_to_session(persistence_parcel: PersistenceParcel) -> None:
         """Adds a parcel instance to the current session without committing."""
@@ -1,12 +1,11 @@
 from functools import wraps
 from flask import session, redirect, url_for, flash
+from app.services.admin_auth_service import AdminAuthService
 
 def admin_required(f):
     """NFR-03: Security - Authentication decorator to protect admin routes"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        from app.services.admin_auth_service import AdminAuthService
-        
         # NFR-03: Security - Validate admin session before allowing access
         is_valid, error_message = AdminAuthService.validate_session()
         if not is_valid:
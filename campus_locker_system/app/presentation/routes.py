@@ -20,6 +20,7 @@ from app.services.pin_service import (
 from app.services.notification_service import NotificationService
 from app.services.database_service import DatabaseService
 from app.services.admin_auth_service import AdminAuthService
+from app.services.rate_limiter import RateLimiter
 from .decorators import admin_required
 from datetime import datetime
 import datetime as dt
@@ -100,12 +101,22 @@ def deposit_parcel():
 
     return render_template('deposit_form.html')
 
+def _pin_lookup_allowed() -> bool:
+    """NFR-03: Security - Per-client token bucket in front of the token and re-issue lookups"""
+    return RateLimiter.acquire(f"pinlookup:{request.remote_addr}", current_app.config.get('PIN_LOOKUP_RPM', 60))
+
 @main_bp.route('/generate-pin/<token>', methods=['GET'])
 def generate_pin_by_token_route(token):
     """
     FR-05: Re-issue PIN - Token-based PIN generation for expired PIN recovery
     """
     try:
+        # NFR-03: Security - Floods are turned away before any database or audit work
+        if not _pin_lookup_allowed():
+            message = 'Too many PIN requests. Please wait a minute and try again.'
+            flash(message, 'error')
+            return render_template('pin_generation_error.html', error_message=message), 429
+        
         parcel, message = generate_pin_by_token(token)
         pin_expiry_hours = get_pin_expiry_hours()
 
@@ -310,6 +321,11 @@ def request_new_pin_action():
             flash('Email and Locker ID are required.', 'error')
             return redirect(url_for('main.request_new_pin_action'))
         
+        # NFR-03: Security - Throttled clients get the reply for details that match no parcel, without a database lookup
+        if not _pin_lookup_allowed():
+            flash("If your details matched an active parcel, a new PIN would have been sent.", 'info')
+            return redirect(url_for('main.request_new_pin_action'))
+        
         # FR-05: Re-issue PIN - Use service layer for PIN regeneration request
         parcel, message = request_pin_regeneration_by_recipient_email_and_locker(recipient_email, locker_id_str)
         
@@ -177,7 +177,7 @@ class AdminAuthService:
             if not AdminAuthManager.validate_username(username):
                 return None, "Invalid username format"
 
-            if AdminRepository.get_by_username(username):
+            if AdminRepository.username_exists(username):
                 return None, "Username already exists"
 
             business_admin = BusinessAdminUser(username=username, role=role)
@@ -1,10 +1,13 @@
 # Audit service - orchestration layer
-from typing import Tuple, Optional, List, Dict, Any
-from flask import current_app, session, request
-from app.business.audit import AuditManager, AuditEvent, AuditEventCategory, AuditEventSeverity
+from typing import Tuple, Optional, List, Dict, Any, Callable, Union
+from flask import current_app, session, request, has_request_context
+from app.business.audit import AuditManager, AuditEvent, AuditEventCategory, AuditEventSeverity, AuditEventClassifier
 from app.persistence.repositories.audit_log_repository import AuditLogRepository
+from app.services.audit_writer import AuditWriter
 from app.persistence.models import AuditLog as AuditLogEntity
 import json
+import threading
+import time
 from datetime import datetime, timedelta
 import datetime as dt
 
@@ -15,10 +18,19 @@ class AuditService:
     """
     
     @staticmethod
-    def log_event(action: str, details: Optional[Dict[str, Any]] = None):
+    def is_enabled() -> bool:
+        """FR-07: Audit logging is on unless AUDIT_LOGGING_ENABLED is switched off (e.g. for load tests)"""
+        return current_app.config.get('AUDIT_LOGGING_ENABLED', True)
+
+    @staticmethod
+    def log_event(action: str, details: Optional[Dict[str, Any]] = None, commit: bool = True):
         """Log a system event using AuditLogRepository.
            NFR-03: Security - Enhanced audit logging for security-sensitive operations.
+           Pass commit=False to stage the entry in the caller's transaction instead of committing it here.
+           NFR-01: Performance - Committed events are handed to the background AuditWriter when it is enabled.
         """
+        if not AuditService.is_enabled():
+            return
         try:
             # Attempt to get admin_id and admin_username from session if available
             admin_id = session.get('admin_id')
@@ -35,11 +47,22 @@ class AuditService:
             # Assuming the model's 'details' field is Text or JSON that SQLAlchemy handles.
             # No explicit conversion to json.dumps here if the model/repo handles dicts.
 
+            # Staged entries must stay in the caller's transaction; a full queue falls back to an inline write
+            if commit and AuditWriter.is_enabled() and AuditWriter.enqueue({
+                'action': action,
+                'details': dict(details) if details else details,
+                'admin_id': final_admin_id,
+                'admin_username': final_admin_username,
+                'timestamp': datetime.now(dt.UTC)
+            }):
+                return
+
             success = AuditLogRepository.create_and_save_log(
                 action=action,
                 details=details,
                 admin_id=final_admin_id,
-                admin_username=final_admin_username
+                admin_username=final_admin_username,
+                commit=commit
             )
             if not success:
                 current_app.logger.error(f"Failed to save audit log event '{action}' via repository.")
@@ -49,6 +72,116 @@ class AuditService:
             current_app.logger.error(f"CRITICAL: AuditService failed to log event '{action}': {str(e)}")
             # Optionally, try a more raw form of logging or raise an alert here
 
+    @staticmethod
+    def log_event_lazy(action: str, details_factory: Callable[[], Optional[Dict[str, Any]]], commit: bool = True):
+        """Log a system event whose details are only built when audit logging is enabled.
+           NFR-01: Performance - Hot paths skip building the details dict when nothing would be written.
+        """
+        if not AuditService.is_enabled():
+            return
+        AuditService.log_event(action, details=details_factory(), commit=commit)
+
+    @staticmethod
+    def log_event_sampled(action: str, details: Optional[Dict[str, Any]] = None, source: Optional[str] = None):
+        """Log only the first `action` per source in each AUDIT_SAMPLING_WINDOW_SECONDS window.
+           NFR-01: Performance - Repeats within the window are counted in memory and later written as one
+           '<action>_SUPPRESSED' event, so a flood from one client costs one audit row per window.
+           source defaults to the client address of the current request (the X-Forwarded-For client
+           behind nginx, via ProxyFix) and is recorded on the logged event.
+        """
+        if not AuditService.is_enabled():
+            return
+        window = current_app.config.get('AUDIT_SAMPLING_WINDOW_SECONDS', 60)
+        if window <= 0:
+            AuditService.log_event(action, details=details)
+            return
+        if source is None:
+            source = request.remote_addr if has_request_context() else "system"
+
+        state = current_app.extensions.setdefault('audit_sampling', {'lock': threading.Lock(), 'windows': {}, 'last_sweep': 0.0})
+        now = time.time()
+        with state['lock']:
+            windows = state['windows']
+            closed = []
+            # Closed windows are swept at most once per window length, not on every call
+            if now - state['last_sweep'] >= window:
+                closed = AuditService._pop_closed_windows(state, now, window)
+            key = (action, source)
+            sampled = windows.get(key)
+            if sampled is None or now - sampled[0] >= window:
+                if sampled is not None:
+                    closed.append((key, windows.pop(key)))
+                windows[key] = [now, 0]
+                first_in_window = True
+            else:
+                sampled[1] += 1
+                first_in_window = False
+
+        AuditService._log_suppressed(closed)
+        if first_in_window:
+            AuditService.log_event(action, details={"source": source, **(details or {})})
+
+    @staticmethod
+    def flush_sampled_events(close_all: bool = False):
+        """Write the '<action>_SUPPRESSED' counts of sampling windows that have closed.
+           Called from the AuditWriter loop, so a burst's count is written even when the source goes quiet;
+           close_all also ends the windows still open (at shutdown).
+        """
+        state = current_app.extensions.get('audit_sampling')
+        if state is None:
+            return
+        window = current_app.config.get('AUDIT_SAMPLING_WINDOW_SECONDS', 60)
+        with state['lock']:
+            closed = AuditService._pop_closed_windows(state, time.time(), 0 if close_all else window)
+        AuditService._log_suppressed(closed)
+
+    @staticmethod
+    def _pop_closed_windows(state: Dict[str, Any], now: float, window: float) -> List[Tuple[Tuple[str, str], List]]:
+        """Remove and return the ((action, source), [started, count]) windows at least `window` seconds old; hold state['lock']"""
+        state['last_sweep'] = now
+        windows = state['windows']
+        return [(key, windows.pop(key)) for key in [key for key, (started, _) in windows.items() if now - started >= window]]
+
+    @staticmethod
+    def _log_suppressed(closed: List[Tuple[Tuple[str, str], List]]):
+        AuditService.log_events_bulk([(f"{closed_action}_SUPPRESSED", {
+            "source": closed_source,
+            "suppressed_count": count,
+            "window_start": datetime.fromtimestamp(started, dt.UTC).isoformat()
+        }) for (closed_action, closed_source), (started, count) in closed if count])
+
+    @staticmethod
+    def log_events_bulk(events: List[Tuple[str, Union[Optional[Dict[str, Any]], Callable[[], Optional[Dict[str, Any]]]]]]):
+        """Log several (action, details) events with one bulk INSERT and a single commit.
+           NFR-01: Performance - Used by batch jobs instead of one commit per event.
+           details may also be a zero-argument factory, called only when audit logging is enabled.
+        """
+        if not events or not AuditService.is_enabled():
+            return
+        try:
+            # Batch jobs also run from the scheduler, outside any request
+            admin_id = session.get('admin_id') if has_request_context() else None
+            admin_username = session.get('admin_username') if has_request_context() else None
+
+            entries = []
+            for action, details in events:
+                if callable(details):
+                    details = details()
+                # Pop the admin keys from a copy; the caller may reuse its dict
+                details = dict(details) if details else details
+                entries.append({
+                    'action': action,
+                    'admin_id': details.pop('admin_id', admin_id) if details else admin_id,
+                    'admin_username': details.pop('admin_username', admin_username) if details else admin_username,
+                    'details': details
+                })
+
+            if not AuditLogRepository.create_and_save_logs_bulk(entries):
+                current_app.logger.error(f"Failed to save {len(entries)} bulk audit log events via repository.")
+
+        except Exception as e:
+            current_app.logger.error(f"CRITICAL: AuditService failed to log {len(events)} bulk events: {str(e)}")
+
     @staticmethod
     def get_paginated_audit_logs(page: int, per_page: int = 15):
         """
@@ -77,7 +210,6 @@ class AuditService:
             if action:
                 # First try to treat action as a specific action name
                 # Check if it's an exact action by looking for it in all categories
-                from app.business.audit import AuditEventClassifier
                 if action in AuditEventClassifier.EVENT_CLASSIFICATIONS:
                     # It's a specific action
                     actions_filter = [action]
@@ -246,8 +378,6 @@ class AuditService:
     @staticmethod
     def _get_actions_by_category(category_name: str) -> List[str]:
         """Get list of actions that belong to a specific category"""
-        from app.business.audit import AuditEventClassifier, AuditEventCategory
-        
         try:
             target_category = AuditEventCategory(category_name)
         except ValueError:
@@ -0,0 +1,138 @@
+# Audit writer - background persistence for audit events
+import atexit
+import queue
+import threading
+import time
+from typing import Dict, Any, List
+from flask import current_app
+from app.persistence.repositories.audit_log_repository import AuditLogRepository
+
+
+class AuditWriter:
+    """
+    FR-07: Audit Trail - Writes queued audit events to the audit database from a background thread
+    NFR-01: Performance - Request handlers only enqueue; the writer bulk-inserts up to
+    AUDIT_WRITER_BATCH_SIZE events per commit, or whatever arrived within AUDIT_WRITER_FLUSH_SECONDS.
+    The writer also writes the suppressed counts of closed audit sampling windows, at least once per
+    AUDIT_SAMPLING_WINDOW_SECONDS, so they are not lost when a burst stops
+    """
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def is_enabled() -> bool:
+        """Background audit writing is off under TESTING so tests observe audit rows synchronously"""
+        return current_app.config.get('AUDIT_ASYNC_ENABLED', True) and not current_app.testing
+
+    @staticmethod
+    def enqueue(entry: Dict[str, Any]) -> bool:
+        """
+        Queue one audit entry (action, details, admin_id, admin_username, timestamp) for the current app's writer.
+        Returns False when the queue is full, so the caller can write the entry itself instead of dropping it.
+        """
+        state = AuditWriter._ensure_started()
+        try:
+            state['queue'].put_nowait(entry)
+            return True
+        except queue.Full:
+            return False
+
+    @staticmethod
+    def flush() -> None:
+        """Write everything the current app has queued so far and wait for its in-flight batch to commit"""
+        state = current_app.extensions.get('audit_writer')
+        if state is None:
+            return
+        AuditWriter._flush(current_app._get_current_object(), state['queue'])
+
+    @staticmethod
+    def _flush(app, entries_queue: queue.Queue, close_sampling_windows: bool = False) -> None:
+        AuditWriter._flush_sampled(app, close_all=close_sampling_windows)
+        AuditWriter._write_batch(app, entries_queue, AuditWriter._drain(app, entries_queue, block=False))
+        entries_queue.join()
+
+    @staticmethod
+    def _flush_sampled(app, close_all: bool = False) -> None:
+        # Imported here: AuditService queues its events through this module
+        from app.services.audit_service import AuditService
+        try:
+            with app.app_context():
+                AuditService.flush_sampled_events(close_all=close_all)
+        except Exception as e:
+            app.logger.error(f"AuditWriter failed to write suppressed audit event counts: {str(e)}")
+
+    @staticmethod
+    def _ensure_started() -> Dict[str, Any]:
+        """
+        Lazily create the current app's queue and writer thread
+        Each app keeps its own writer in app.extensions, so events always reach the audit database
+        of the app that logged them
+        """
+        app = current_app._get_current_object()
+        state = app.extensions.get('audit_writer')
+        if state is not None and state['thread'].is_alive():
+            return state
+        with AuditWriter._lock:
+            state = app.extensions.get('audit_writer')
+            if state is None:
+                state = {'queue': queue.Queue(maxsize=app.config.get('AUDIT_QUEUE_MAX_SIZE', 10000)), 'thread': None}
+                app.extensions['audit_writer'] = state
+                # Daemon threads are killed at exit; write whatever is still queued first
+                atexit.register(AuditWriter._flush, app, state['queue'], True)
+            if state['thread'] is None or not state['thread'].is_alive():
+                state['thread'] = threading.Thread(target=AuditWriter._run, args=(app, state['queue']),
+                                                   name="AuditWriter", daemon=True)
+                state['thread'].start()
+        return state
+
+    @staticmethod
+    def _run(app, entries_queue: queue.Queue) -> None:
+        """
+        Writer loop: wait for the first event, then collect a batch and commit it in one INSERT;
+        between batches, once per sampling window, write the counts of closed sampling windows
+        """
+        last_sweep = time.monotonic()
+        while True:
+            AuditWriter._write_batch(app, entries_queue, AuditWriter._drain(app, entries_queue, block=True))
+            sweep_seconds = app.config.get('AUDIT_SAMPLING_WINDOW_SECONDS', 60)
+            if sweep_seconds > 0 and time.monotonic() - last_sweep >= sweep_seconds:
+                last_sweep = time.monotonic()
+                AuditWriter._flush_sampled(app)
+
+    @staticmethod
+    def _drain(app, entries_queue: queue.Queue, block: bool) -> List[Dict[str, Any]]:
+        """
+        Take up to one batch of entries; when blocking, wait for the first one (at most one sampling window,
+        so the loop still wakes up to write suppressed counts) and then fill the batch until one flush window
+        after that first entry, however the rest trickle in
+        """
+        batch_size = app.config.get('AUDIT_WRITER_BATCH_SIZE', 100)
+        flush_seconds = app.config.get('AUDIT_WRITER_FLUSH_SECONDS', 0.5)
+        idle_seconds = app.config.get('AUDIT_SAMPLING_WINDOW_SECONDS', 60)
+        entries = []
+        try:
+            if block:
+                entries.append(entries_queue.get(timeout=idle_seconds if idle_seconds > 0 else None))
+            deadline = time.monotonic() + flush_seconds
+            while len(entries) < batch_size:
+                if block:
+                    entries.append(entries_queue.get(timeout=max(0, deadline - time.monotonic())))
+                else:
+                    entries.append(entries_queue.get_nowait())
+        except queue.Empty:
+            pass
+        return entries
+
+    @staticmethod
+    def _write_batch(app, entries_queue: queue.Queue, entries: List[Dict[str, Any]]) -> None:
+        if not entries:
+            return
+        try:
+            with app.app_context():
+                if not AuditLogRepository.create_and_save_logs_bulk(entries):
+                    app.logger.error(f"AuditWriter failed to save {len(entries)} queued audit events.")
+        except Exception as e:
+            app.logger.error(f"CRITICAL: AuditWriter failed to write {len(entries)} queued audit events: {str(e)}")
+        finally:
+            for _ in entries:
+                entries_queue.task_done()
@@ -10,6 +10,7 @@ from datetime import datetime
 import datetime as dt
 from typing import Tuple, Dict, List, Any
 from flask import current_app
+from sqlalchemy import inspect, text
 from app import db
 from app.persistence.models import AdminUser, AuditLog, LockerSensorData
 from app.persistence.models import Locker as PersistenceLocker, Parcel as PersistenceParcel
@@ -30,6 +31,9 @@ class DatabaseService:
     NFR-04: Backup - Automated scheduled backup management
     """
     
+    # NFR-02: Reliability - Values SQLite accepts for PRAGMA synchronous
+    SQLITE_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+    
     @staticmethod
     def initialize_databases() -> Tuple[bool, str]:
         """
@@ -62,6 +66,9 @@ class DatabaseService:
             db.create_all()
             logger.info("🛠️ Database tables created/verified")
             
+            # 3b. Add columns introduced after the database file was first created
+            DatabaseService.upgrade_schema()
+            
             # NFR-02: Configure SQLite WAL mode for crash safety
             try:
                 DatabaseService.configure_sqlite_wal_mode()
@@ -115,6 +122,55 @@ class DatabaseService:
             logger.error(f"❌ {error_msg}")
             return False, error_msg
     
+    @staticmethod
+    def upgrade_schema() -> Tuple[bool, str]:
+        """
+        Bring existing databases up to the current model definitions
+        db.create_all() never alters existing tables, so new nullable columns and indexes are added here
+        Returns (success, message)
+        """
+        try:
+            added_columns = []
+            added_indexes = []
+            for model in (PersistenceLocker, PersistenceParcel, AdminUser, LockerSensorData, AuditLog):
+                table = model.__table__
+                engine = db.engines[getattr(model, '__bind_key__', None)]
+                existing_columns = {c['name'] for c in inspect(engine).get_columns(table.name)}
+                
+                with engine.begin() as conn:
+                    for column in table.columns:
+                        if column.name in existing_columns:
+                            continue
+                        column_type = column.type.compile(dialect=engine.dialect)
+                        conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                        added_columns.append(f"{table.name}.{column.name}")
+                
+                # NFR-01: Performance - Create indexes added to the models after the table existed
+                # PRAGMA index_list also reports expression indexes, which the inspector skips
+                with engine.connect() as conn:
+                    existing_indexes = {row[1] for row in conn.execute(text(f'PRAGMA index_list({table.name})'))}
+                for index in table.indexes:
+                    if index.name not in existing_indexes:
+                        index.create(engine)
+                        added_indexes.append(index.name)
+            
+            # SQLite cannot add CHECK constraints to existing tables, so older databases get
+            # their parcel statuses normalized to what ck_parcel_status_trimmed enforces on new ones
+            with db.engines[None].begin() as conn:
+                trimmed = conn.execute(text(
+                    "UPDATE parcel SET status = TRIM(status) WHERE status != TRIM(status)")).rowcount
+            normalized = [f"trimmed parcel.status on {trimmed} rows"] if trimmed else []
+            
+            changes = [f"added {name}" for name in added_columns + added_indexes] + normalized
+            if changes:
+                logger.info(f"🔧 Schema upgraded: {', '.join(changes)}")
+                return True, f"Upgraded: {', '.join(changes)}"
+            return True, "Schema already up to date"
+            
+        except Exception as e:
+            logger.error(f"❌ Schema upgrade failed: {str(e)}")
+            return False, f"Schema upgrade error: {str(e)}"
+    
     @staticmethod
     def validate_schema() -> Tuple[bool, str]:
         """
@@ -498,7 +554,11 @@ class DatabaseService:
                 return
             
             db_dir = current_app.config.get('DATABASE_DIR', '/app/databases')
-            sync_mode = current_app.config.get('SQLITE_SYNCHRONOUS_MODE', 'NORMAL')
+            sync_mode = str(current_app.config.get('SQLITE_SYNCHRONOUS_MODE', 'NORMAL')).upper()
+            # The mode is interpolated into the PRAGMA, so only SQLite's own values are accepted
+            if sync_mode not in DatabaseService.SQLITE_SYNCHRONOUS_MODES:
+                raise ValueError(f"SQLITE_SYNCHRONOUS_MODE must be one of "
+                                 f"{', '.join(DatabaseService.SQLITE_SYNCHRONOUS_MODES)}, got {sync_mode!r}")
             
             # NFR-02: Configure main database with WAL mode
             main_db_path = os.path.join(db_dir, 'campus_locker.db')
@@ -1,8 +1,15 @@
 # Notification service - orchestration layer
-from typing import Tuple, Optional
-from flask import current_app
+import atexit
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Optional, Dict, Any
+from flask import current_app, url_for
 from app.business.notification import NotificationManager, FormattedEmail, NotificationType
 from app.services.audit_service import AuditService
+from app.services.audit_writer import AuditWriter
 from app.adapters.email_adapter import create_email_adapter, EmailMessage
 from datetime import datetime
 import datetime as dt
@@ -10,14 +17,20 @@ import datetime as dt
 class NotificationService:
     """Service layer for notification orchestration"""
     
+    _delivery_state_lock = threading.Lock()
+    
     @staticmethod
-    def send_parcel_ready_notification(recipient_email: str, parcel_id: int, locker_id: int, deposited_time, pin_generation_url: str) -> Tuple[bool, str]:
+    def send_parcel_ready_notification(recipient_email: str, parcel_id: int, locker_id: int, deposited_time,
+                                       pin_generation_url: Optional[str] = None, pin_generation_token: Optional[str] = None) -> Tuple[bool, str]:
         """Send notification when parcel is ready for pickup (email-based PIN generation)"""
         try:
             # Business rule validation
             if not NotificationManager.is_delivery_allowed(recipient_email):
                 return False, f"Email delivery not allowed for {recipient_email}"
             
+            if pin_generation_url is None:
+                pin_generation_url = NotificationService._build_pin_generation_url(pin_generation_token)
+            
             # Create formatted email using business logic
             formatted_email = NotificationManager.create_parcel_ready_email(
                 parcel_id=parcel_id,
@@ -26,17 +39,15 @@ class NotificationService:
                 pin_generation_url=pin_generation_url
             )
             
-            # Send email via adapter
-            success = NotificationService._send_email(recipient_email, formatted_email)
+            # Send email via adapter (audited once delivered)
+            success = NotificationService._deliver(recipient_email, formatted_email, "NOTIFICATION_SENT", {
+                "notification_type": NotificationType.PARCEL_READY_FOR_PICKUP.value,
+                "recipient": recipient_email,
+                "parcel_id": parcel_id,
+                "locker_id": locker_id
+            })
             
             if success:
-                # Log successful notification
-                AuditService.log_event("NOTIFICATION_SENT", details={
-                    "notification_type": NotificationType.PARCEL_READY_FOR_PICKUP.value,
-                    "recipient": recipient_email,
-                    "parcel_id": parcel_id,
-                    "locker_id": locker_id
-                })
                 return True, f"Parcel ready notification sent to {recipient_email}"
             else:
                 return False, "Failed to send email notification"
@@ -46,13 +57,20 @@ class NotificationService:
             return False, "An error occurred while sending notification"
     
     @staticmethod
-    def send_pin_generation_notification(recipient_email: str, parcel_id: int, locker_id: int, pin: str, expiry_time, pin_generation_url: str) -> Tuple[bool, str]:
-        """Send notification when PIN is generated via email link"""
+    def send_pin_generation_notification(recipient_email: str, parcel_id: int, locker_id: int, pin: str, expiry_time,
+                                         pin_generation_url: Optional[str] = None, pin_generation_token: Optional[str] = None) -> Tuple[bool, str]:
+        """
+        Send notification when PIN is generated via email link
+        Callers may pass the parcel's pin_generation_token instead of a prebuilt pin_generation_url
+        """
         try:
             # Business rule validation
             if not NotificationManager.is_delivery_allowed(recipient_email):
                 return False, f"Email delivery not allowed for {recipient_email}"
             
+            if pin_generation_url is None:
+                pin_generation_url = NotificationService._build_pin_generation_url(pin_generation_token)
+            
             # Create formatted email using business logic
             formatted_email = NotificationManager.create_pin_generation_email(
                 parcel_id=parcel_id,
@@ -62,17 +80,15 @@ class NotificationService:
                 pin_generation_url=pin_generation_url
             )
             
-            # Send email via adapter
-            success = NotificationService._send_email(recipient_email, formatted_email)
+            # Send email via adapter (audited once delivered)
+            success = NotificationService._deliver(recipient_email, formatted_email, "NOTIFICATION_SENT", {
+                "notification_type": NotificationType.PIN_GENERATION.value,
+                "recipient": recipient_email,
+                "parcel_id": parcel_id,
+                "locker_id": locker_id
+            })
             
             if success:
-                # Log successful notification
-                AuditService.log_event("NOTIFICATION_SENT", details={
-                    "notification_type": NotificationType.PIN_GENERATION.value,
-                    "recipient": recipient_email,
-                    "parcel_id": parcel_id,
-                    "locker_id": locker_id
-                })
                 return True, f"PIN generation notification sent to {recipient_email}"
             else:
                 return False, "Failed to send email notification"
@@ -98,17 +114,15 @@ class NotificationService:
                 pin_generation_url=pin_generation_url
             )
             
-            # Send email via adapter
-            success = NotificationService._send_email(recipient_email, formatted_email)
+            # Send email via adapter (audited once delivered)
+            success = NotificationService._deliver(recipient_email, formatted_email, "NOTIFICATION_SENT", {
+                "notification_type": NotificationType.PIN_REISSUE.value,
+                "recipient": recipient_email,
+                "parcel_id": parcel_id,
+                "locker_id": locker_id
+            })
             
             if success:
-                # Log successful notification
-                AuditService.log_event("NOTIFICATION_SENT", details={
-                    "notification_type": NotificationType.PIN_REISSUE.value,
-                    "recipient": recipient_email,
-                    "parcel_id": parcel_id,
-                    "locker_id": locker_id
-                })
                 return True, f"PIN reissue notification sent to {recipient_email}"
             else:
                 return False, "Failed to send email notification"
@@ -134,17 +148,15 @@ class NotificationService:
                 pin_generation_url=pin_generation_url
             )
             
-            # Send email via adapter
-            success = NotificationService._send_email(recipient_email, formatted_email)
+            # Send email via adapter (audited once delivered)
+            success = NotificationService._deliver(recipient_email, formatted_email, "NOTIFICATION_SENT", {
+                "notification_type": NotificationType.PIN_REGENERATION.value,
+                "recipient": recipient_email,
+                "parcel_id": parcel_id,
+                "locker_id": locker_id
+            })
             
             if success:
-                # Log successful notification
-                AuditService.log_event("NOTIFICATION_SENT", details={
-                    "notification_type": NotificationType.PIN_REGENERATION.value,
-                    "recipient": recipient_email,
-                    "parcel_id": parcel_id,
-                    "locker_id": locker_id
-                })
                 return True, f"PIN regeneration notification sent to {recipient_email}"
             else:
                 return False, "Failed to send email notification"
@@ -154,15 +166,20 @@ class NotificationService:
             return False, "An error occurred while sending notification"
     
     @staticmethod
-    def send_24h_reminder_notification(recipient_email: str, parcel_id: int, locker_id: int, deposited_time, pin_generation_url: str) -> Tuple[bool, str]:
+    def send_24h_reminder_notification(recipient_email: str, parcel_id: int, locker_id: int, deposited_time,
+                                       pin_generation_url: Optional[str] = None, pin_generation_token: Optional[str] = None) -> Tuple[bool, str]:
         """
         FR-04: Send Reminder After 24h of Occupancy - Send configurable-hour reminder notification for parcel pickup
+        Callers may pass the parcel's pin_generation_token instead of a prebuilt pin_generation_url
         """
         try:
             # FR-04: Business rule validation for email delivery
             if not NotificationManager.is_delivery_allowed(recipient_email):
                 return False, f"Email delivery not allowed for {recipient_email}"
             
+            if pin_generation_url is None:
+                pin_generation_url = NotificationService._build_pin_generation_url(pin_generation_token)
+            
             # FR-04: Create formatted email using business logic for configurable-hour reminder
             formatted_email = NotificationManager.create_24h_reminder_email(
                 parcel_id=parcel_id,
@@ -171,20 +188,18 @@ class NotificationService:
                 pin_generation_url=pin_generation_url
             )
             
-            # FR-04: Send email via adapter
-            success = NotificationService._send_email(recipient_email, formatted_email)
+            # FR-04: Send email via adapter (audited once delivered)
+            success = NotificationService._deliver(recipient_email, formatted_email, "FR-04_REMINDER_SENT", {
+                "notification_type": NotificationType.PICKUP_REMINDER.value,
+                "recipient": recipient_email,
+                "parcel_id": parcel_id,
+                "locker_id": locker_id,
+                "deposited_time": deposited_time.isoformat() if deposited_time else None,
+                "hours_since_deposit": (datetime.now(dt.UTC) - deposited_time).total_seconds() / 3600 if deposited_time else None,
+                "configured_reminder_hours": current_app.config.get('REMINDER_HOURS_AFTER_DEPOSIT', 24)  # FR-04: Log configured timing
+            })
             
             if success:
-                # FR-04: Log successful notification for audit trail as required
-                AuditService.log_event("FR-04_REMINDER_SENT", details={
-                    "notification_type": NotificationType.PICKUP_REMINDER.value,
-                    "recipient": recipient_email,
-                    "parcel_id": parcel_id,
-                    "locker_id": locker_id,
-                    "deposited_time": deposited_time.isoformat() if deposited_time else None,
-                    "hours_since_deposit": (datetime.now(dt.UTC) - deposited_time).total_seconds() / 3600 if deposited_time else None,
-                    "configured_reminder_hours": current_app.config.get('REMINDER_HOURS_AFTER_DEPOSIT', 24)  # FR-04: Log configured timing
-                })
                 return True, f"Reminder sent to {recipient_email}"
             else:
                 return False, "Failed to send reminder email"
@@ -193,6 +208,59 @@ class NotificationService:
             current_app.logger.error(f"FR-04: Error sending reminder for parcel {parcel_id}: {str(e)}")  # FR-04: Error logging
             return False, "An error occurred while sending reminder"
     
+    @staticmethod
+    def _build_pin_generation_url(pin_generation_token: Optional[str]) -> str:
+        """FR-01/FR-04: Build the PIN generation link from the cached URL templates"""
+        pin_url_prefix, pin_url_fallback = NotificationService.pin_generation_url_templates()
+        return pin_url_prefix + pin_generation_token if pin_generation_token else pin_url_fallback
+    
+    @staticmethod
+    def _resolve_pin_generation_url(pin_generation_token: Optional[str], scheme: Optional[str] = None) -> Optional[str]:
+        """
+        FR-01/FR-04: Resolve the PIN generation link via routing; outside a request the host comes from SERVER_NAME
+        Returns None when no link can be built
+        """
+        url_options = {'_external': True}
+        if scheme:
+            url_options['_scheme'] = scheme
+        try:
+            if pin_generation_token:
+                return url_for('main.generate_pin_by_token_route', token=pin_generation_token, **url_options)
+            return url_for('main.request_new_pin_action', **url_options)
+        except RuntimeError as e:
+            # No SERVER_NAME configured
+            current_app.logger.info(f"URL generation failed (no server name configured): {str(e)}")
+        except Exception as e:
+            # Catch any other URL generation issues
+            current_app.logger.warning(f"Unexpected URL generation error: {str(e)}")
+        return None
+    
+    @staticmethod
+    def pin_generation_url_templates() -> Tuple[str, str]:
+        """
+        NFR-01: Performance - PIN generation links resolved once per SERVER_NAME and URL scheme and cached on the application
+        Returns (prefix, fallback): a token URL is prefix + token, parcels without a token get fallback
+        Without SERVER_NAME links follow the request's host, so they are resolved per call and never cached;
+        the localhost placeholders used when no link can be built are not cached either
+        """
+        placeholder = "token"
+        server_name = current_app.config.get('SERVER_NAME')
+        scheme = current_app.config.get('PREFERRED_URL_SCHEME', 'http') if server_name else None
+        templates = current_app.extensions.setdefault('pin_generation_url_templates', {})
+        if server_name and (server_name, scheme) in templates:
+            return templates[(server_name, scheme)]
+        
+        token_url = NotificationService._resolve_pin_generation_url(placeholder, scheme)
+        fallback_url = NotificationService._resolve_pin_generation_url(None, scheme)
+        if token_url is None or fallback_url is None:
+            # No host to build links against - use placeholder URLs
+            return "http://localhost/generate-pin/", "http://localhost/request-new-pin"
+        
+        resolved = (token_url[:-len(placeholder)], fallback_url)
+        if server_name:
+            templates[(server_name, scheme)] = resolved
+        return resolved
+    
     @staticmethod
     def send_parcel_missing_admin_notification(parcel_id: int, locker_id: int, recipient_email: str) -> Tuple[bool, str]:
         """
@@ -213,18 +281,16 @@ class NotificationService:
                 recipient_email=recipient_email
             )
             
-            # Send email via adapter
-            success = NotificationService._send_email(admin_email, formatted_email)
+            # Send email via adapter (audited once delivered)
+            success = NotificationService._deliver(admin_email, formatted_email, "ADMIN_NOTIFICATION_SENT", {
+                "notification_type": "PARCEL_MISSING_REPORT",
+                "admin_recipient": admin_email,
+                "parcel_id": parcel_id,
+                "locker_id": locker_id,
+                "reporter_email_domain": recipient_email.split('@')[1] if '@' in recipient_email else 'unknown'
+            })
             
             if success:
-                # FR-06: Log successful notification for audit trail as required
-                AuditService.log_event("ADMIN_NOTIFICATION_SENT", details={
-                    "notification_type": "PARCEL_MISSING_REPORT",
-                    "admin_recipient": admin_email,
-                    "parcel_id": parcel_id,
-                    "locker_id": locker_id,
-                    "reporter_email_domain": recipient_email.split('@')[1] if '@' in recipient_email else 'unknown'
-                })
                 return True, f"Admin notification sent to {admin_email}"
             else:
                 return False, "Failed to send admin notification email"
@@ -233,6 +299,208 @@ class NotificationService:
             current_app.logger.error(f"Error sending admin notification for missing parcel {parcel_id}: {str(e)}")
             return False, "An error occurred while sending admin notification"
     
+    @staticmethod
+    def _deliver(recipient_email: str, formatted_email: FormattedEmail, audit_action: str, audit_details: Dict[str, Any]) -> bool:
+        """
+        NFR-01: Performance - Hand the email to the background worker pool so SMTP latency stays
+        out of the request; audit_action is logged once the send succeeds
+        Returns True once the email is queued; refuses it when NOTIFICATION_QUEUE_MAX_SIZE emails are pending
+        Sends inline (and audits immediately) when background delivery is disabled or under TESTING
+        """
+        if not NotificationService._background_delivery_enabled():
+            success = NotificationService._send_email(recipient_email, formatted_email)
+            if success:
+                AuditService.log_event(audit_action, details=audit_details)
+            return success
+        
+        app = current_app._get_current_object()
+        state = NotificationService._delivery_state(app)
+        if not NotificationService._reserve_delivery_slot(state, app.config.get('NOTIFICATION_QUEUE_MAX_SIZE', 500)):
+            app.logger.error(f"Notification queue full, not queueing email to {recipient_email}")
+            AuditService.log_event("NOTIFICATION_QUEUE_FULL", details={**audit_details, "pending_action": audit_action})
+            return False
+        
+        try:
+            state['executor'].submit(
+                NotificationService._attempt_delivery,
+                app, recipient_email, formatted_email, audit_action, dict(audit_details), 0
+            )
+        except Exception as e:
+            NotificationService._release_delivery_slot(state)
+            app.logger.error(f"Error queueing email to {recipient_email}: {str(e)}")
+            return False
+        
+        return True
+    
+    @staticmethod
+    def _attempt_delivery(app, recipient_email: str, formatted_email: FormattedEmail, audit_action: str,
+                          audit_details: Dict[str, Any], attempt: int) -> None:
+        """Worker-side single send; a failure schedules the next attempt with exponential backoff and returns"""
+        finished = True
+        try:
+            with app.app_context():
+                if NotificationService._send_email(recipient_email, formatted_email):
+                    # log_events_bulk copes with running outside a request (no admin session)
+                    AuditService.log_events_bulk([(audit_action, audit_details)])
+                    return
+                
+                max_retries = app.config.get('NOTIFICATION_MAX_RETRIES', 5)
+                shutting_down = NotificationService._delivery_state(app)['shutting_down']
+                if attempt < max_retries and not shutting_down:
+                    backoff_seconds = app.config.get('NOTIFICATION_RETRY_BACKOFF_SECONDS', 2)
+                    NotificationService._schedule_retry(app, backoff_seconds * (2 ** attempt), (
+                        app, recipient_email, formatted_email, audit_action, audit_details, attempt + 1))
+                    finished = False
+                    return
+                
+                NotificationService._record_delivery_failure(app, recipient_email, audit_action, audit_details, attempt + 1,
+                                                             "shutdown" if shutting_down else "retries_exhausted")
+        except Exception as e:
+            app.logger.error(f"Error delivering email to {recipient_email}: {str(e)}")
+        finally:
+            if finished:
+                NotificationService._release_delivery_slot(NotificationService._delivery_state(app))
+    
+    @staticmethod
+    def _schedule_retry(app, delay_seconds: float, attempt_args: tuple) -> None:
+        """Queue a delivery attempt to be handed to the app's worker pool once delay_seconds have passed"""
+        state = NotificationService._delivery_state(app)
+        with state['retry_condition']:
+            heapq.heappush(state['retry_heap'], (time.monotonic() + delay_seconds, next(state['retry_sequence']), attempt_args))
+            if state['retry_thread'] is None or not state['retry_thread'].is_alive():
+                state['retry_thread'] = threading.Thread(target=NotificationService._run_retry_scheduler, args=(state,),
+                                                         name="NotificationRetryScheduler", daemon=True)
+                state['retry_thread'].start()
+            state['retry_condition'].notify()
+    
+    @staticmethod
+    def _run_retry_scheduler(state: Dict[str, Any]) -> None:
+        """Scheduler loop: sleep until the earliest retry is due, then submit it to the worker pool"""
+        retry_heap = state['retry_heap']
+        while True:
+            with state['retry_condition']:
+                while not retry_heap or retry_heap[0][0] > time.monotonic():
+                    state['retry_condition'].wait(timeout=retry_heap[0][0] - time.monotonic() if retry_heap else None)
+                _, _, attempt_args = heapq.heappop(retry_heap)
+            try:
+                state['executor'].submit(NotificationService._attempt_delivery, *attempt_args)
+            except Exception as e:
+                # The pool refuses work once the interpreter is shutting down
+                app, recipient_email, _, audit_action, audit_details, attempt = attempt_args
+                app.logger.error(f"Error rescheduling email to {recipient_email}: {str(e)}")
+                NotificationService._record_delivery_failure(app, recipient_email, audit_action, audit_details, attempt, "shutdown")
+                NotificationService._release_delivery_slot(state)
+    
+    @staticmethod
+    def _record_delivery_failure(app, recipient_email: str, audit_action: str, audit_details: Dict[str, Any],
+                                 attempts: int, reason: str) -> None:
+        """FR-07: Audit Trail - An accepted email that will never be sent; admins reissue the PIN from this event"""
+        app.logger.error(f"Giving up on email to {recipient_email} after {attempts} attempts ({reason})")
+        try:
+            with app.app_context():
+                AuditService.log_events_bulk([("NOTIFICATION_DELIVERY_FAILED", {
+                    **audit_details,
+                    "pending_action": audit_action,
+                    "attempts": attempts,
+                    "reason": reason
+                })])
+        except Exception as e:
+            app.logger.error(f"Error auditing failed email to {recipient_email}: {str(e)}")
+    
+    @staticmethod
+    def _reserve_delivery_slot(state: Dict[str, Any], max_pending: int) -> bool:
+        with state['pending_condition']:
+            if state['pending'] >= max_pending:
+                return False
+            state['pending'] += 1
+            return True
+    
+    @staticmethod
+    def _release_delivery_slot(state: Dict[str, Any]) -> None:
+        with state['pending_condition']:
+            state['pending'] -= 1
+            state['pending_condition'].notify_all()
+    
+    @staticmethod
+    def wait_for_deliveries(timeout: Optional[float] = None) -> bool:
+        """Block until every email the current app queued is delivered or given up on; returns False if timeout passes first"""
+        state = current_app.extensions.get('notification_delivery')
+        if state is None:
+            return True
+        with state['pending_condition']:
+            return state['pending_condition'].wait_for(lambda: state['pending'] == 0, timeout)
+    
+    @staticmethod
+    def is_background_delivery_enabled() -> bool:
+        """True when a successful send_* call means the email was queued rather than handed to the mail server"""
+        return NotificationService._background_delivery_enabled()
+    
+    @staticmethod
+    def _background_delivery_enabled() -> bool:
+        """Background delivery is off under TESTING so tests observe sends synchronously"""
+        return current_app.config.get('NOTIFICATION_ASYNC_ENABLED', True) and not current_app.testing
+    
+    @staticmethod
+    def _delivery_state(app) -> Dict[str, Any]:
+        """
+        NFR-01: Performance - The app's background delivery state, created on first use
+        Each app keeps its own worker pool (sized by NOTIFICATION_WORKER_THREADS), count of emails accepted
+        but not yet delivered or given up on (capped at NOTIFICATION_QUEUE_MAX_SIZE) and retry heap in app.extensions
+        NFR-02: Reliability - Retries wait in the heap as (due time, sequence, attempt arguments), not asleep
+        in a worker thread, so an SMTP outage cannot stall delivery of other emails
+        """
+        state = app.extensions.get('notification_delivery')
+        if state is not None:
+            return state
+        with NotificationService._delivery_state_lock:
+            state = app.extensions.get('notification_delivery')
+            if state is None:
+                state = {
+                    'executor': ThreadPoolExecutor(max_workers=app.config.get('NOTIFICATION_WORKER_THREADS', 2),
+                                                   thread_name_prefix="NotificationWorker"),
+                    'pending': 0,
+                    'pending_condition': threading.Condition(),
+                    'retry_heap': [],
+                    'retry_sequence': itertools.count(),
+                    'retry_condition': threading.Condition(),
+                    'retry_thread': None,
+                    'shutting_down': False,
+                }
+                app.extensions['notification_delivery'] = state
+                # Queued emails (and any PIN inside them) exist only in memory; never lose them silently
+                atexit.register(NotificationService._shutdown_delivery, app, state)
+        return state
+    
+    @staticmethod
+    def _shutdown_delivery(app, state: Dict[str, Any]) -> None:
+        """
+        NFR-02: Reliability - At process exit (atexit also runs when a gunicorn worker exits gracefully),
+        finish or account for every accepted email. The worker pool has already run its queued sends
+        (concurrent.futures joins it before atexit handlers); emails waiting for a retry get one last
+        inline attempt within NOTIFICATION_SHUTDOWN_TIMEOUT_SECONDS. Anything still unsent is audited as
+        NOTIFICATION_DELIVERY_FAILED so an admin can reissue it. A killed process loses its queue silently
+        """
+        state['shutting_down'] = True
+        deadline = time.monotonic() + app.config.get('NOTIFICATION_SHUTDOWN_TIMEOUT_SECONDS', 10)
+        with state['retry_condition']:
+            waiting = [attempt_args for _, _, attempt_args in sorted(state['retry_heap'])]
+            state['retry_heap'].clear()
+        for attempt_args in waiting:
+            if time.monotonic() < deadline:
+                NotificationService._attempt_delivery(*attempt_args)
+            else:
+                _, recipient_email, _, audit_action, audit_details, attempt = attempt_args
+                NotificationService._record_delivery_failure(app, recipient_email, audit_action, audit_details, attempt, "shutdown")
+                NotificationService._release_delivery_slot(state)
+        with state['pending_condition']:
+            if not state['pending_condition'].wait_for(lambda: state['pending'] == 0, max(0.0, deadline - time.monotonic())):
+                app.logger.error(f"Shutting down with {state['pending']} queued emails still sending")
+        try:
+            with app.app_context():
+                AuditWriter.flush()
+        except Exception as e:
+            app.logger.error(f"Error flushing delivery failure audit events: {str(e)}")
+    
     @staticmethod
     def _send_email(recipient_email: str, formatted_email: FormattedEmail) -> bool:
         """Internal method to send email via adapter"""
@@ -243,7 +511,8 @@ class NotificationService:
                 subject=formatted_email.subject,
                 body=formatted_email.body
             )
-            return email_adapter.send_email(email_message)
+            success, _ = email_adapter.send_email(email_message)
+            return success
         except Exception as e:
             current_app.logger.error(f"Error in email adapter: {str(e)}")
             return False 
\ No newline at end of file
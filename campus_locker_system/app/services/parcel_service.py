@@ -19,7 +19,7 @@ Status: ✅ PRODUCTION READY - All FRs and NFRs implemented and verified
 
 from datetime import datetime, timedelta
 import datetime as dt
-from flask import current_app, url_for
+from flask import current_app
 from app import db
 from app.persistence.models import Locker, Parcel
 from app.business.parcel import ParcelManager
@@ -27,14 +27,14 @@ from app.business.locker import LockerManager
 from app.business.pin import PinManager
 from app.services.audit_service import AuditService
 from app.services.notification_service import NotificationService
-import hashlib
-import os
-import binascii
-import json
 from typing import Optional, Tuple
 from app.persistence.repositories.parcel_repository import ParcelRepository
 from app.persistence.repositories.locker_repository import LockerRepository
 
+# NFR-01: Performance - Status sets for transition checks, built once at import
+_ALLOWED_MISSING_FROM = frozenset({'deposited', 'picked_up'})  # FR-06: Statuses a recipient can report missing from
+_OVERDUE_LOCKER_HOLD = frozenset({'occupied', 'out_of_service'})  # Locker statuses held for collection of returned parcels
+
 def get_parcel_by_id(parcel_id: int) -> Optional[Parcel]:
     """
     Retrieve a parcel by its ID using ParcelRepository.
@@ -70,15 +70,13 @@ def assign_locker_and_create_parcel(recipient_email: str, preferred_size: str):
         if not LockerManager.is_valid_size(preferred_size):
             return None, f"Invalid parcel size: {preferred_size}. Valid sizes: {', '.join(LockerManager.VALID_SIZES)}"
         
-        locker = LockerManager.find_available_locker(preferred_size)
+        # NFR-01: Performance - Claiming in one statement fails fast when the size is exhausted
+        locker = LockerManager.claim_available_locker(preferred_size)
         if not locker:
             return None, f"No available {preferred_size} lockers. Please try again later or choose a different size."
         
         # Follow hexagonal architecture pattern: use repositories for atomic transactions
         try:
-            # Update locker status (business logic in service, persistence via repository)
-            locker.status = 'occupied'
-            
             # Create parcel using business logic
             new_parcel = Parcel(
                 locker_id=locker.id,
@@ -91,31 +89,17 @@ def assign_locker_and_create_parcel(recipient_email: str, preferred_size: str):
             
             # Use repository pattern for atomic transaction (same pattern as other functions)
             ParcelRepository.add_to_session(new_parcel)
-            LockerRepository.add_to_session(locker)
             if not ParcelRepository.commit_session():
                 current_app.logger.error("Failed to commit locker and parcel changes.")
                 return None, "Database error during assignment."
             
-            # Generate PIN generation URL
-            try:
-                pin_generation_url = url_for('main.generate_pin_by_token_route', 
-                                           token=token, 
-                                           _external=True)
-            except RuntimeError as e:
-                # Not in request context (e.g., during testing) - use a placeholder URL
-                current_app.logger.info(f"URL generation failed (not in request context): {str(e)}")
-                pin_generation_url = f"http://localhost/generate-pin/{token}"
-            except Exception as e:
-                # Catch any other URL generation issues
-                current_app.logger.warning(f"Unexpected URL generation error: {str(e)}")
-                pin_generation_url = f"http://localhost/generate-pin/{token}"
-            
+            # PIN generation link is built by the notification service, shared with the reminder path
             notification_success, notification_message = NotificationService.send_parcel_ready_notification(
                 recipient_email=recipient_email,
                 parcel_id=new_parcel.id,
                 locker_id=locker.id,
                 deposited_time=new_parcel.deposited_at,
-                pin_generation_url=pin_generation_url
+                pin_generation_token=token
             )
             
             AuditService.log_event("PARCEL_CREATED_EMAIL_PIN", details={
@@ -143,44 +127,50 @@ def assign_locker_and_create_parcel(recipient_email: str, preferred_size: str):
 def process_pickup(provided_pin: str):
     """NFR-03: Security - Secure PIN verification process with audit logging"""
     try:
-        # Find parcel with matching PIN using repository
-        # Parcels that could match are those in 'deposited' state
-        deposited_parcels = ParcelRepository.get_all_deposited_for_pin_check()
+        # NFR-03: Security - Redacted PIN pattern for audit details, computed once per attempt
+        provided_pin_pattern = provided_pin[:3] + "XXX"
+        
+        # NFR-01: Performance - Indexed HMAC lookup narrows the search to the parcel(s) issued this PIN
+        # instead of running PBKDF2 against every deposited parcel
+        deposited_parcels = ParcelRepository.get_deposited_pin_candidates(PinManager.generate_pin_lookup(provided_pin))
         
         parcel_to_update = None
-        locker_to_update = None
+        pin_verified = False
 
         for parcel_persistence_instance in deposited_parcels:
             if not parcel_persistence_instance.pin_hash:
                 continue
                 
+            pin_verified = True
             if PinManager.verify_pin(parcel_persistence_instance.pin_hash, provided_pin):
                 if PinManager.is_pin_expired(parcel_persistence_instance.otp_expiry):
                     AuditService.log_event("USER_PICKUP_FAIL_PIN_EXPIRED", details={
                         "parcel_id": parcel_persistence_instance.id,
-                        "provided_pin_pattern": provided_pin[:3] + "XXX",
+                        "provided_pin_pattern": provided_pin_pattern,
                         "expiry_time": parcel_persistence_instance.otp_expiry.isoformat() if parcel_persistence_instance.otp_expiry else None
                     })
                     return None, "PIN has expired. Please request a new PIN."
                 
-                parcel_persistence_instance.status = 'picked_up'
-                parcel_persistence_instance.picked_up_at = datetime.now(dt.UTC)
                 parcel_to_update = parcel_persistence_instance
-                
-                # Fetch locker using LockerRepository to ensure it's the persistence model
-                retrieved_locker = LockerRepository.get_by_id(parcel_persistence_instance.locker_id)
-                if retrieved_locker:
-                    if retrieved_locker.status != 'out_of_service':
-                        retrieved_locker.status = 'free'
-                    locker_to_update = retrieved_locker
-                
                 break
         
+        if not pin_verified:
+            # NFR-03: Security - Always pay for one PBKDF2 verify, closing the "parcel exists" timing side-channel
+            PinManager.verify_pin_against_dummy(provided_pin)
+        
         if parcel_to_update:
             try:
-                ParcelRepository.add_to_session(parcel_to_update)
-                if locker_to_update:
-                    LockerRepository.add_to_session(locker_to_update)
+                # NFR-01 & NFR-02: Single conditional UPDATE ... RETURNING claims the parcel atomically,
+                # so concurrent pickups with the same PIN cannot both succeed
+                claimed, locker_id = ParcelRepository.mark_picked_up_if_deposited(
+                    parcel_to_update.id, datetime.now(dt.UTC))
+                if not claimed:
+                    db.session.rollback()
+                    current_app.logger.warning(f"Parcel {parcel_to_update.id} was already claimed by a concurrent pickup")
+                    return None, "This parcel has already been picked up."
+                
+                if locker_id is not None:
+                    LockerRepository.release_if_in_service(locker_id)
                 
                 if not ParcelRepository.commit_session():
                     current_app.logger.error(f"Failed to commit session during pickup for parcel {parcel_to_update.id}")
@@ -189,11 +179,12 @@ def process_pickup(provided_pin: str):
                 AuditService.log_event(f"Parcel {parcel_to_update.id} picked up from locker {parcel_to_update.locker_id}")
                 return parcel_to_update, f"Parcel successfully picked up from locker {parcel_to_update.locker_id}."
             except Exception as commit_e:
+                db.session.rollback()
                 current_app.logger.error(f"Error committing pickup for parcel {parcel_to_update.id}: {str(commit_e)}")
                 return None, "An error occurred while finalizing the pickup."
 
         AuditService.log_event("USER_PICKUP_FAIL_INVALID_PIN", details={
-            "provided_pin_pattern": provided_pin[:3] + "XXX",
+            "provided_pin_pattern": provided_pin_pattern,
             "reason": "No matching deposited parcel found or PIN invalid"
         })
         return None, "Invalid PIN or no matching parcel found."
@@ -202,15 +193,25 @@ def process_pickup(provided_pin: str):
         current_app.logger.error(f"Error processing pickup: {str(e)}")
         return None, "An error occurred while processing the pickup."
 
+def _load_parcel_with_locker(parcel_id: int) -> Tuple[Optional[Parcel], Optional[Locker]]:
+    """
+    NFR-01: Performance - Load a parcel and its locker in one joined query
+    NFR-02: Reliability - The parcel row stays locked until commit, so concurrent transitions serialize
+    Returns (parcel, locker); locker is None for detached parcels
+    """
+    parcel = ParcelRepository.get_by_id_with_locker(parcel_id, for_update=True)
+    if not parcel:
+        return None, None
+    return parcel, parcel.locker
+
 def retract_deposit(parcel_id: int):
     try:
-        parcel = ParcelRepository.get_by_id(parcel_id)
+        parcel, locker = _load_parcel_with_locker(parcel_id)
         if not parcel:
             return None, "Parcel not found."
         if parcel.status != 'deposited':
             return None, f"Parcel is not in 'deposited' state (current status: {parcel.status}). Cannot retract."
         
-        locker = LockerRepository.get_by_id(parcel.locker_id)
         if not locker:
             current_app.logger.error(f"Data inconsistency: Locker ID {parcel.locker_id} not found for parcel {parcel.id} during retraction.")
             return None, "Associated locker not found. Data inconsistency."
@@ -226,10 +227,8 @@ def retract_deposit(parcel_id: int):
             current_app.logger.warning(f"Locker {locker.id} had unexpected status '{original_locker_status}' during deposit retraction for parcel {parcel.id}. Setting to 'free'.")
             locker.status = 'free'
 
-        # Save changes using repository methods that manage session
+        # Parcel and locker are already tracked by the session, so committing is enough to save them
         try:
-            ParcelRepository.add_to_session(parcel)
-            LockerRepository.add_to_session(locker)
             if not ParcelRepository.commit_session():
                  current_app.logger.error(f"Failed to commit session during deposit retraction for parcel {parcel_id}")
                  return None, "A database error occurred while retracting deposit (commit)."
@@ -249,13 +248,12 @@ def retract_deposit(parcel_id: int):
 
 def dispute_pickup(parcel_id: int):
     try:
-        parcel = ParcelRepository.get_by_id(parcel_id)
+        parcel, locker = _load_parcel_with_locker(parcel_id)
         if not parcel:
             return None, "Parcel not found."
         if parcel.status != 'picked_up':
             return None, f"Parcel is not in 'picked_up' state (current status: {parcel.status}). Cannot dispute."
         
-        locker = LockerRepository.get_by_id(parcel.locker_id)
         if not locker:
             current_app.logger.error(f"Data inconsistency: Locker ID {parcel.locker_id} not found for parcel {parcel.id} during pickup dispute.")
             return None, "Associated locker not found. Data inconsistency."
@@ -264,8 +262,6 @@ def dispute_pickup(parcel_id: int):
         locker.status = 'disputed_contents'
         
         try:
-            ParcelRepository.add_to_session(parcel)
-            LockerRepository.add_to_session(locker)
             if not ParcelRepository.commit_session():
                 current_app.logger.error(f"Failed to commit session during pickup dispute for parcel {parcel_id}")
                 return None, "A database error occurred while disputing pickup (commit)."
@@ -289,32 +285,24 @@ def report_parcel_missing_by_recipient(parcel_id: int) -> Tuple[Optional[Parcel]
     FR-06: Report Missing Item - Core business logic for recipient reporting parcel as missing
     """
     try:
-        parcel = ParcelRepository.get_by_id(parcel_id)
+        parcel, locker = _load_parcel_with_locker(parcel_id)
         if not parcel:
             return None, "Parcel not found."
         
-        current_status = parcel.status.strip() if parcel.status else "None"
-        allowed_statuses = ['deposited', 'picked_up']
-        
-        if current_status not in allowed_statuses:
+        current_status = parcel.status or "None"
+        if current_status not in _ALLOWED_MISSING_FROM:
+            allowed_statuses = sorted(_ALLOWED_MISSING_FROM)
             current_app.logger.warning(f"FR-06: Missing report rejected for parcel {parcel_id}. Status: '{current_status}', allowed: {allowed_statuses}")
             return None, f"Parcel cannot be reported missing by recipient from its current state: '{current_status}'. Allowed states: {', '.join(allowed_statuses)}."
         
-        locker = LockerRepository.get_by_id(parcel.locker_id) if parcel.locker_id else None
-        
         original_status = current_status
         parcel.status = 'missing'
         
-        locker_updated = False
         if locker:
             locker.status = 'out_of_service'
-            locker_updated = True
         
         # Commit changes using repository
         try:
-            ParcelRepository.add_to_session(parcel)
-            if locker_updated and locker:
-                LockerRepository.add_to_session(locker)
             if not ParcelRepository.commit_session():
                 current_app.logger.error(f"Failed to commit session reporting parcel {parcel_id} missing by recipient.")
                 return None, "Database error occurred while reporting parcel as missing (commit)."
@@ -342,7 +330,7 @@ def report_parcel_missing_by_recipient(parcel_id: int) -> Tuple[Optional[Parcel]
 def mark_parcel_missing_by_admin(admin_id: int, admin_username: str, parcel_id: int) -> tuple[Parcel | None, str | None]:
     """Admin function to mark a parcel as missing"""
     try:
-        parcel = ParcelRepository.get_by_id(parcel_id)
+        parcel, locker = _load_parcel_with_locker(parcel_id)
         if not parcel:
             return None, "Parcel not found."
 
@@ -352,17 +340,12 @@ def mark_parcel_missing_by_admin(admin_id: int, admin_username: str, parcel_id:
         original_parcel_status = parcel.status
         parcel.status = 'missing'
         
-        locker_to_update = None
         original_locker_status = "N/A"
-        locker_updated = False
 
         if parcel.locker_id:
-            locker = LockerRepository.get_by_id(parcel.locker_id)
             if locker:
                 original_locker_status = locker.status
                 locker.status = 'out_of_service'
-                locker_to_update = locker
-                locker_updated = True
                 
                 AuditService.log_event("LOCKER_SET_OUT_OF_SERVICE_FOR_MISSING_PARCEL", details={
                     "admin_id": admin_id,
@@ -371,29 +354,30 @@ def mark_parcel_missing_by_admin(admin_id: int, admin_username: str, parcel_id:
                     "locker_id": parcel.locker_id,
                     "original_locker_status": original_locker_status,
                     "reason": "Parcel marked as missing - investigation required"
-                })
+                }, commit=False)
             else:
                 current_app.logger.warning(f"Locker ID {parcel.locker_id} not found for parcel {parcel.id} being marked missing by admin.")
         
+        # Status changes and their audit entries share one session commit; the audit log lives on
+        # its own bind, so the two databases are committed one after the other, not atomically
+        AuditService.log_event("ADMIN_MARKED_PARCEL_MISSING", details={
+            "admin_id": admin_id,
+            "admin_username": admin_username,
+            "parcel_id": parcel.id,
+            "locker_id": parcel.locker_id,
+            "original_parcel_status": original_parcel_status
+        }, commit=False)
+
         # Commit changes using repository
         try:
-            ParcelRepository.add_to_session(parcel)
-            if locker_updated and locker_to_update:
-                LockerRepository.add_to_session(locker_to_update)
             if not ParcelRepository.commit_session():
                 current_app.logger.error(f"Failed to commit session marking parcel {parcel_id} missing by admin.")
                 return None, "A database error occurred while marking parcel missing (commit)."
         except Exception as e_commit:
+            db.session.rollback()
             current_app.logger.error(f"Error committing missing mark for parcel {parcel_id} by admin: {str(e_commit)}")
             return None, "A database error occurred while marking parcel missing (exception)."
 
-        AuditService.log_event("ADMIN_MARKED_PARCEL_MISSING", details={
-            "admin_id": admin_id,
-            "admin_username": admin_username,
-            "parcel_id": parcel.id,
-            "locker_id": parcel.locker_id,
-            "original_parcel_status": original_parcel_status
-        })
         return parcel, None
     except Exception as e:
         current_app.logger.error(f"Error in mark_parcel_missing_by_admin for parcel {parcel_id}: {e}")
@@ -401,151 +385,159 @@ def mark_parcel_missing_by_admin(admin_id: int, admin_username: str, parcel_id:
 
 def process_overdue_parcels():
     max_pickup_days = current_app.config.get('PARCEL_MAX_PICKUP_DAYS', 7)
-    cutoff_datetime = datetime.now(dt.UTC) - timedelta(days=max_pickup_days)
+    batch_size = current_app.config.get('OVERDUE_PROCESSING_CHUNK_SIZE', 500)
+    # Single timestamp snapshot for the whole batch keeps the cutoff consistent across audit events
+    now = datetime.now(dt.UTC)
+    cutoff_datetime = now - timedelta(days=max_pickup_days)
+    cutoff_iso = cutoff_datetime.isoformat()
     
-    # Use repository to fetch eligible parcels
-    deposited_parcels = ParcelRepository.get_all_deposited_older_than(cutoff_datetime)
+    # Overdue parcels whose locker no longer exists cannot be returned; they are reported and left as is
+    skipped_audit_events = [("PROCESS_OVERDUE_FAIL_NO_LOCKER", {
+        "parcel_id": parcel_id,
+        "reason": "Locker not found for deposited parcel."
+    }) for parcel_id in ParcelRepository.get_overdue_ids_without_locker(cutoff_datetime)]
+    AuditService.log_events_bulk(skipped_audit_events)
     
+    # NFR-01: Performance - Overdue detection runs as UPDATE ... RETURNING in the database, one bounded
+    # batch per transaction, instead of hydrating every overdue parcel and locker into the session
     processed_count = 0
-    items_to_update_in_repository = []
-
-    for parcel in deposited_parcels:
-        if not isinstance(parcel.deposited_at, datetime):
-            AuditService.log_event("PROCESS_OVERDUE_FAIL_INVALID_DEPOSITED_AT", {
-                "parcel_id": parcel.id, 
-                "deposited_at_type": str(type(parcel.deposited_at)),
-                "reason": "Parcel has invalid or missing deposited_at timestamp (post-repo fetch)."
-            })
-            continue
+    while True:
+        batch_processed, batch_error = _process_overdue_batch(cutoff_datetime, batch_size, max_pickup_days, cutoff_iso)
+        if batch_error:
+            return processed_count, batch_error
+        processed_count += batch_processed
         
-        try:
-            locker = parcel.locker
-            if not locker:
-                locker = LockerRepository.get_by_id(parcel.locker_id)
-                if not locker:
-                    AuditService.log_event("PROCESS_OVERDUE_FAIL_NO_LOCKER", {
-                        "parcel_id": parcel.id, 
-                        "reason": "Locker not found for deposited parcel."
-                    })
-                    continue
-
-            old_parcel_status = parcel.status
-            old_locker_status = locker.status
-            parcel.status = 'return_to_sender'
-            
-            if locker.status in ['occupied', 'out_of_service']:
-                locker.status = 'awaiting_collection'
-            else:
-                locker.status = 'free' 
-            
-            items_to_update_in_repository.append(parcel)
-            if old_locker_status != locker.status:
-                items_to_update_in_repository.append(locker)
-
-            AuditService.log_event("PARCEL_MARKED_RETURN_TO_SENDER", {
-                "parcel_id": parcel.id,
-                "locker_id": locker.id,
-                "old_parcel_status": old_parcel_status,
-                "new_parcel_status": parcel.status,
-                "old_locker_status": old_locker_status,
-                "new_locker_status": locker.status,
-                "max_pickup_days_configured": max_pickup_days
-            })
-            processed_count += 1
-        except Exception as e:
-            current_app.logger.error(f"Error processing parcel ID {parcel.id} for overdue status: {str(e)}")
-            AuditService.log_event("PROCESS_OVERDUE_PARCEL_ERROR", {
-                "parcel_id": parcel.id, 
-                "error": str(e),
-                "action": "Skipped this parcel, continued with batch."
-            })
-            continue
-            
-    if items_to_update_in_repository:
-        try:
-            for item in items_to_update_in_repository:
-                if isinstance(item, Parcel):
-                    ParcelRepository.add_to_session(item)
-                elif isinstance(item, Locker):
-                    LockerRepository.add_to_session(item)
-                else:
-                    current_app.logger.warning(f"Unknown item type in process_overdue_parcels batch: {type(item)}")
-            
-            if not ParcelRepository.commit_session():
-                current_app.logger.error(f"Error committing batch of overdue parcels via repository.")
-                AuditService.log_event("PROCESS_OVERDUE_BATCH_COMMIT_ERROR_REPO", {
-                    "error": "Commit failed via ParcelRepository.commit_session()", 
-                    "num_items_intended_for_update_in_batch": len(items_to_update_in_repository)
-                })
-                return 0, "Error committing batch of overdue parcels."
-
-        except Exception as e:
-            current_app.logger.error(f"Error committing batch of overdue parcels: {str(e)}")
-            AuditService.log_event("PROCESS_OVERDUE_BATCH_COMMIT_ERROR", {
-                "error": str(e), 
-                "num_parcels_intended_for_update_in_batch": processed_count
-            })
-            return 0, f"Error committing batch of overdue parcels: {str(e)}"
-            
+        if batch_processed < batch_size:
+            break
+    
     return processed_count, f"{processed_count} overdue parcels processed."
 
+def _process_overdue_batch(cutoff_datetime: datetime, batch_size: int, max_pickup_days: int, cutoff_iso: str) -> Tuple[int, Optional[str]]:
+    """
+    Mark one batch of overdue parcels as return_to_sender, update their lockers and commit
+    Returns (processed_count, error_message); error_message is None on success
+    """
+    try:
+        returned_parcels = ParcelRepository.mark_overdue_returned_batch(cutoff_datetime, batch_size)
+        if not returned_parcels:
+            return 0, None
+        
+        locker_ids = sorted({locker_id for _, locker_id in returned_parcels})
+        old_locker_statuses = LockerRepository.get_statuses(locker_ids)
+        new_locker_statuses = {
+            locker_id: 'awaiting_collection' if old_status in _OVERDUE_LOCKER_HOLD else 'free'
+            for locker_id, old_status in old_locker_statuses.items()
+        }
+        # One UPDATE ... CASE for every locker whose status actually changes
+        LockerRepository.set_statuses_bulk({
+            locker_id: status for locker_id, status in new_locker_statuses.items()
+            if status != old_locker_statuses[locker_id]
+        })
+        
+        if not ParcelRepository.commit_session():
+            current_app.logger.error(f"Error committing batch of overdue parcels via repository.")
+            AuditService.log_events_bulk([("PROCESS_OVERDUE_BATCH_COMMIT_ERROR_REPO", {
+                "error": "Commit failed via ParcelRepository.commit_session()", 
+                "num_items_intended_for_update_in_batch": len(returned_parcels) + len(locker_ids)
+            })])
+            return 0, "Error committing batch of overdue parcels."
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error committing batch of overdue parcels: {str(e)}")
+        AuditService.log_events_bulk([("PROCESS_OVERDUE_BATCH_COMMIT_ERROR", {
+            "error": str(e), 
+            "batch_size": batch_size
+        })])
+        return 0, f"Error committing batch of overdue parcels: {str(e)}"
+    
+    # Transitions are only audited once the batch has actually been committed
+    AuditService.log_events_bulk([("PARCEL_MARKED_RETURN_TO_SENDER", lambda parcel_id=parcel_id, locker_id=locker_id: {
+        "parcel_id": parcel_id,
+        "locker_id": locker_id,
+        "old_parcel_status": 'deposited',
+        "new_parcel_status": 'return_to_sender',
+        "old_locker_status": old_locker_statuses.get(locker_id),
+        "new_locker_status": new_locker_statuses.get(locker_id),
+        "max_pickup_days_configured": max_pickup_days,
+        "overdue_cutoff": cutoff_iso
+    }) for parcel_id, locker_id in returned_parcels])
+    
+    return len(returned_parcels), None
+
 def process_reminder_notifications():
+    # NFR-01: Performance - Resolve the app-context proxy once instead of on every loop iteration
+    logger = current_app.logger
     try:
         reminder_hours = current_app.config.get('REMINDER_HOURS_AFTER_DEPOSIT', 24)
-        cutoff_time = datetime.now(dt.UTC) - timedelta(hours=reminder_hours)
+        # NFR-01: Performance - One clock read serves as both the eligibility cutoff base and the batch sent_at
+        sent_at = datetime.now(dt.UTC)
+        cutoff_time = sent_at - timedelta(hours=reminder_hours)
         
-        # Use repository to get eligible parcels
-        eligible_parcels = ParcelRepository.get_all_deposited_needing_reminder(cutoff_time)
+        # NFR-01: Performance - Eligible parcels are streamed from the repository in bounded batches
+        batch_size = current_app.config.get('REMINDER_PROCESSING_BATCH_SIZE', 500)
+        eligible_parcels = ParcelRepository.iter_deposited_needing_reminder(cutoff_time, batch_size)
+        # NFR-01: Performance - Links are resolved once per sweep and completed per parcel by concatenation
+        pin_url_prefix, pin_url_fallback = NotificationService.pin_generation_url_templates()
         
+        eligible_count = 0
         processed_count = 0
         error_count = 0
         
-        parcels_to_update = []
+        # NFR-01: Performance - One timestamp, one UPDATE and one bulk audit write for the whole batch
+        reminded_parcel_ids = []
+        reminder_audit_events = []
 
         for parcel in eligible_parcels:
+            eligible_count += 1
             try:
-                pin_generation_url = f"http://localhost/generate-pin/{parcel.pin_generation_token}" if parcel.pin_generation_token else "http://localhost/request-new-pin"
-                
+                _, _, recipient_email_domain = parcel.recipient_email.rpartition('@')
+                recipient_email_domain = recipient_email_domain or 'unknown'
+
                 success, message = NotificationService.send_24h_reminder_notification(
                     recipient_email=parcel.recipient_email,
                     parcel_id=parcel.id,
                     locker_id=parcel.locker_id,
                     deposited_time=parcel.deposited_at,
-                    pin_generation_url=pin_generation_url
+                    pin_generation_url=pin_url_prefix + parcel.pin_generation_token if parcel.pin_generation_token else pin_url_fallback
                 )
                 
                 if success:
-                    parcel.reminder_sent_at = datetime.now(dt.UTC)
-                    parcels_to_update.append(parcel)
+                    reminded_parcel_ids.append(parcel.id)
                     processed_count += 1
                     
-                    AuditService.log_event("FR-04_REMINDER_SENT_SUCCESS", {
-                        "parcel_id": parcel.id, "locker_id": parcel.locker_id,
-                        "recipient_email_domain": parcel.recipient_email.split('@')[1] if '@' in parcel.recipient_email else 'unknown',
-                        "deposited_hours_ago": int((datetime.now(dt.UTC) - parcel.deposited_at).total_seconds() / 3600),
+                    # NFR-01: Performance - Details are built only if audit logging is enabled; plain values are
+                    # captured because the factories run after the batch commit has expired the ORM instances
+                    reminder_audit_events.append(("FR-04_REMINDER_SENT_SUCCESS", lambda parcel_id=parcel.id, locker_id=parcel.locker_id,
+                                                  domain=recipient_email_domain, deposited_at=parcel.deposited_at: {
+                        "parcel_id": parcel_id, "locker_id": locker_id,
+                        "recipient_email_domain": domain,
+                        "deposited_hours_ago": int((sent_at - deposited_at).total_seconds() / 3600),
                         "configured_reminder_hours": reminder_hours
-                    })
+                    }))
                 else:
                     error_count += 1
-                    AuditService.log_event("FR-04_REMINDER_SENT_FAILED", {
-                        "parcel_id": parcel.id, "error_message": message,
-                        "recipient_email_domain": parcel.recipient_email.split('@')[1] if '@' in parcel.recipient_email else 'unknown'
-                    })
+                    reminder_audit_events.append(("FR-04_REMINDER_SENT_FAILED", lambda parcel_id=parcel.id, message=message,
+                                                  domain=recipient_email_domain: {
+                        "parcel_id": parcel_id, "error_message": message,
+                        "recipient_email_domain": domain
+                    }))
             except Exception as e:
                 error_count += 1
-                current_app.logger.error(f"FR-04: Error processing reminder for parcel {parcel.id}: {str(e)}")
+                logger.error(f"FR-04: Error processing reminder for parcel {parcel.id}: {str(e)}")
             
-        if parcels_to_update:
-            if not ParcelRepository.save_all(parcels_to_update):
-                current_app.logger.error("FR-04: Failed to batch update reminder_sent_at for parcels via repository.")
-                AuditService.log_event("FR-04_REMINDER_DB_UPDATE_FAILED", {
-                    "num_parcels_sent_not_marked": len(parcels_to_update),
-                    "reason": "ParcelRepository.save_all returned false"
-                })
-                error_count += len(parcels_to_update)
+        if reminded_parcel_ids:
+            if not ParcelRepository.mark_reminders_sent(reminded_parcel_ids, sent_at):
+                logger.error("FR-04: Failed to batch update reminder_sent_at for parcels via repository.")
+                reminder_audit_events.append(("FR-04_REMINDER_DB_UPDATE_FAILED", {
+                    "num_parcels_sent_not_marked": len(reminded_parcel_ids),
+                    "reason": "ParcelRepository.mark_reminders_sent returned false"
+                }))
+                error_count += len(reminded_parcel_ids)
+        
+        AuditService.log_events_bulk(reminder_audit_events)
 
         AuditService.log_event("FR-04_BULK_REMINDER_PROCESSING_COMPLETED", {
-            "total_eligible_parcels": len(eligible_parcels),
+            "total_eligible_parcels": eligible_count,
             "processed_count": processed_count,
             "error_count": error_count,
             "configured_reminder_hours": reminder_hours,
@@ -555,7 +547,7 @@ def process_reminder_notifications():
         return processed_count, error_count
         
     except Exception as e:
-        current_app.logger.error(f"FR-04: Critical error in reminder processing: {str(e)}")
+        logger.error(f"FR-04: Critical error in reminder processing: {str(e)}")
         try:
             AuditService.log_event("FR-04_REMINDER_PROCESSING_CRITICAL_ERROR", {"error": str(e)})
         except:
@@ -571,18 +563,20 @@ def send_individual_reminder(parcel_id: int, admin_id: int, admin_username: str)
         if parcel.status != 'deposited':
             return False, f"Parcel is not in 'deposited' status (current: {parcel.status}). Reminders are only sent for deposited parcels."
         
-        pin_generation_url = f"http://localhost/generate-pin/{parcel.pin_generation_token}" if parcel.pin_generation_token else "http://localhost/request-new-pin"
+        _, _, recipient_email_domain = parcel.recipient_email.rpartition('@')
+        recipient_email_domain = recipient_email_domain or 'unknown'
         
         success, message = NotificationService.send_24h_reminder_notification(
             recipient_email=parcel.recipient_email,
             parcel_id=parcel.id,
             locker_id=parcel.locker_id,
             deposited_time=parcel.deposited_at,
-            pin_generation_url=pin_generation_url
+            pin_generation_token=parcel.pin_generation_token
         )
         
         if success:
-            parcel.reminder_sent_at = datetime.now(dt.UTC)
+            sent_at = datetime.now(dt.UTC)
+            parcel.reminder_sent_at = sent_at
             if not ParcelRepository.save(parcel):
                 current_app.logger.error(f"FR-04: Failed to update reminder_sent_at for parcel {parcel_id} (admin individual) via repository.")
                 AuditService.log_event("FR-04_ADMIN_INDIVIDUAL_REMINDER_DB_FAIL", {
@@ -593,8 +587,8 @@ def send_individual_reminder(parcel_id: int, admin_id: int, admin_username: str)
             AuditService.log_event("FR-04_ADMIN_INDIVIDUAL_REMINDER_SENT", {
                 "admin_id": admin_id, "admin_username": admin_username, "parcel_id": parcel.id,
                 "locker_id": parcel.locker_id,
-                "recipient_email_domain": parcel.recipient_email.split('@')[1] if '@' in parcel.recipient_email else 'unknown',
-                "deposited_hours_ago": int((datetime.now(dt.UTC) - parcel.deposited_at).total_seconds() / 3600),
+                "recipient_email_domain": recipient_email_domain,
+                "deposited_hours_ago": int((sent_at - parcel.deposited_at).total_seconds() / 3600),
                 "reminder_type": "admin_initiated_individual"
             })
             return True, f"Reminder sent successfully to {parcel.recipient_email}"
@@ -602,7 +596,7 @@ def send_individual_reminder(parcel_id: int, admin_id: int, admin_username: str)
             AuditService.log_event("FR-04_ADMIN_INDIVIDUAL_REMINDER_FAILED", {
                 "admin_id": admin_id, "admin_username": admin_username, "parcel_id": parcel.id,
                 "error_message": message,
-                "recipient_email_domain": parcel.recipient_email.split('@')[1] if '@' in parcel.recipient_email else 'unknown'
+                "recipient_email_domain": recipient_email_domain
             })
             return False, f"Failed to send reminder: {message}"
             
@@ -1,21 +1,66 @@
+import hashlib
 from datetime import datetime, timedelta
 import datetime as dt
-from flask import current_app, url_for
+from flask import current_app
 from app import db
 from app.business.pin import PinManager
 from app.persistence.models import Parcel as PersistenceParcel
 from app.persistence.repositories.parcel_repository import ParcelRepository
 from app.services.audit_service import AuditService
+from app.services.notification_service import NotificationService
 from typing import Tuple, Optional
 
-def _safe_token_prefix(token: str) -> str:
+def _token_tag(token: str) -> str:
     """
-    Helper function to safely create token prefix for logging
-    Maintains security by not logging full tokens while handling None values
+    Helper function to create a short token tag for logging
+    NFR-03: Security - A 4-byte BLAKE2b digest correlates attempts on the same token across
+    audit events without recording any part of the token itself; handles None values
     """
     if not token:
         return "None or empty"
-    return token[:8] + "..." if len(token) > 8 else token
+    return hashlib.blake2b(token.encode('utf-8'), digest_size=4).hexdigest()
+
+def _pin_generation_rejection(parcel: PersistenceParcel, token: str, max_daily_generations: int, token_tag: str,
+                              now: datetime) -> Optional[Tuple[str, dict, str]]:
+    """
+    FR-02: Business rules a parcel must pass before a PIN is generated for it, evaluated as of now
+    Returns (audit_action, audit_details, user_message) for the first rule that fails, or None
+    """
+    if parcel.pin_generation_token != token:
+        return "PIN_GENERATION_FAIL_INVALID_TOKEN", {
+            "token_tag": token_tag,
+            "reason": "Token not found"
+        }, "Invalid or expired token."
+    
+    # Business rule: Check if parcel is in correct status
+    if parcel.status != 'deposited':
+        return "PIN_GENERATION_FAIL_INVALID_STATUS", {
+            "parcel_id": parcel.id,
+            "status": parcel.status,
+            "token_tag": token_tag
+        }, f"Parcel is not available for pickup (status: {parcel.status})."
+    
+    # Business rule: Check if token is still valid
+    if not parcel.is_pin_token_valid(now):
+        return "PIN_GENERATION_FAIL_TOKEN_EXPIRED", {
+            "parcel_id": parcel.id,
+            "token_expiry": parcel.pin_generation_token_expiry.isoformat() if parcel.pin_generation_token_expiry else None,
+            "token_tag": token_tag
+        }, "Token has expired. Please request a new PIN generation link."
+    
+    # Business rule: Check rate limiting to prevent abuse
+    if not parcel.can_generate_pin(max_daily_generations, now):
+        return "PIN_GENERATION_FAIL_RATE_LIMIT", {
+            "parcel_id": parcel.id,
+            "generation_count": parcel.pin_generation_count,
+            "max_allowed": max_daily_generations
+        }, f"Daily PIN generation limit reached ({max_daily_generations} per day). Please try again tomorrow."
+    
+    return None
+
+def _delivery_phrase() -> str:
+    """How to describe a successful notification: background delivery has only queued it"""
+    return "queued for delivery to" if NotificationService.is_background_delivery_enabled() else "sent to"
 
 def get_pin_expiry_hours() -> int:
     """
@@ -31,12 +76,16 @@ def generate_pin_by_token(token: str) -> Tuple[Optional[PersistenceParcel], str]
     NFR-03: Security - Cryptographically secure PIN generation with audit logging
     Follows hexagonal architecture: Service layer coordinates between business logic and repositories
     """
+    # NFR-03: Security - One tag per call identifies the token in every audit event below
+    token_tag = _token_tag(token)
+    # One clock read per call: the rule checks, PIN expiry and issue time all agree
+    now = datetime.now(dt.UTC)
     try:
         # Validate token input (business rule validation)
         if not token:
             current_app.logger.warning("PIN generation attempted with empty or None token")
-            AuditService.log_event("PIN_GENERATION_FAIL_INVALID_TOKEN", details={
-                "token_prefix": _safe_token_prefix(token),
+            AuditService.log_event_sampled("PIN_GENERATION_FAIL_INVALID_TOKEN", details={
+                "token_tag": token_tag,
                 "reason": "Invalid token format"
             })
             return None, "Invalid token provided."
@@ -45,102 +94,137 @@ def generate_pin_by_token(token: str) -> Tuple[Optional[PersistenceParcel], str]
         parcel = ParcelRepository.get_by_pin_generation_token(token)
         
         if not parcel:
-            # NFR-03: Security - Log invalid token attempts for security monitoring
-            AuditService.log_event("PIN_GENERATION_FAIL_INVALID_TOKEN", details={
-                "token_prefix": _safe_token_prefix(token),
+            # NFR-03: Security - Log invalid token attempts for security monitoring; token sprays from one
+            # client are sampled to one event per window plus a suppressed count
+            AuditService.log_event_sampled("PIN_GENERATION_FAIL_INVALID_TOKEN", details={
+                "token_tag": token_tag,
                 "reason": "Token not found"
             })
             return None, "Invalid or expired token."
         
-        # Business rule: Check if parcel is in correct status
-        if parcel.status != 'deposited':
-            AuditService.log_event("PIN_GENERATION_FAIL_INVALID_STATUS", details={
-                "parcel_id": parcel.id,
-                "status": parcel.status,
-                "token_prefix": _safe_token_prefix(token)
-            })
-            return None, f"Parcel is not available for pickup (status: {parcel.status})."
-        
-        # Business rule: Check if token is still valid
-        if not parcel.is_pin_token_valid():
-            AuditService.log_event("PIN_GENERATION_FAIL_TOKEN_EXPIRED", details={
-                "parcel_id": parcel.id,
-                "token_expiry": parcel.pin_generation_token_expiry.isoformat() if parcel.pin_generation_token_expiry else None,
-                "token_prefix": _safe_token_prefix(token)
-            })
-            return None, "Token has expired. Please request a new PIN generation link."
-        
-        # Business rule: Check rate limiting to prevent abuse
+        # Business rules: status, token expiry and daily generation limit
         max_daily_generations = current_app.config.get('MAX_PIN_GENERATIONS_PER_DAY', 3)
-        if not parcel.can_generate_pin(max_daily_generations):
-            AuditService.log_event("PIN_GENERATION_FAIL_RATE_LIMIT", details={
-                "parcel_id": parcel.id,
-                "generation_count": parcel.pin_generation_count,
-                "max_allowed": max_daily_generations
-            })
-            return None, f"Daily PIN generation limit reached ({max_daily_generations} per day). Please try again tomorrow."
+        rejection = _pin_generation_rejection(parcel, token, max_daily_generations, token_tag, now)
+        if rejection:
+            audit_action, audit_details, message = rejection
+            AuditService.log_event(audit_action, details=audit_details)
+            return None, message
         
         # Business layer: Generate new 6-digit PIN with salted SHA-256 hash
         new_pin, new_pin_hash = PinManager.generate_pin_and_hash()
+        otp_expiry = PinManager.generate_expiry_time(now=now)
+        
+        # NFR-01: Performance - Commit expires the parcel; keep what the notification and audit need
+        # so they do not reload the row
+        parcel_id, recipient_email, locker_id = parcel.id, parcel.recipient_email, parcel.locker_id
         
-        # Update domain model with new PIN data
-        parcel.pin_hash = new_pin_hash
-        parcel.otp_expiry = PinManager.generate_expiry_time()
-        parcel.pin_generation_count += 1
-        parcel.last_pin_generation = datetime.now(dt.UTC)
+        # NFR-01 & NFR-02: One conditional UPDATE ... RETURNING writes the PIN and re-checks the rules above,
+        # so concurrent requests cannot exceed the daily limit or issue a PIN for a parcel that just left 'deposited'
+        generation_count = ParcelRepository.issue_pin_by_token(
+            parcel_id, token, new_pin_hash,
+            PinManager.generate_pin_lookup(new_pin),
+            otp_expiry,
+            now,
+            max_daily_generations
+        )
+        if generation_count is None:
+            # Another request changed the parcel first; report whichever rule it now fails
+            db.session.rollback()
+            rejection = _pin_generation_rejection(parcel, token, max_daily_generations, token_tag, now)
+            if rejection:
+                audit_action, audit_details, message = rejection
+                AuditService.log_event(audit_action, details=audit_details)
+                return None, message
         
         # Repository layer: Persist changes
-        if not ParcelRepository.save(parcel):
-            # Rollback handled by repository if save fails
-            current_app.logger.error(f"Failed to save parcel {parcel.id} during PIN generation via repository.")
+        if generation_count is None or not ParcelRepository.commit_session():
+            # Rollback handled by repository if commit fails
+            current_app.logger.error(f"Failed to save parcel {parcel_id} during PIN generation via repository.")
             AuditService.log_event("PIN_GENERATION_FAIL_DB_SAVE", {
-                "parcel_id": parcel.id, 
-                "token_prefix": _safe_token_prefix(token)
+                "parcel_id": parcel_id, 
+                "token_tag": token_tag
             })
             return None, "Database error saving PIN details."
         
-        # Generate PIN generation URL for regeneration link
-        try:
-            pin_generation_url = url_for('main.generate_pin_by_token_route', 
-                                       token=parcel.pin_generation_token, 
-                                       _external=True)
-        except RuntimeError:
-            # Not in request context (e.g., during testing) - use a placeholder URL
-            pin_generation_url = f"http://localhost/generate-pin/{parcel.pin_generation_token}"
-        
-        # External adapter: Send PIN via email using notification service
-        from app.services.notification_service import NotificationService
+        # External adapter: Send PIN via email using notification service (regeneration link built from the token)
         notification_success, notification_message = NotificationService.send_pin_generation_notification(
-            recipient_email=parcel.recipient_email,
-            parcel_id=parcel.id,
-            locker_id=parcel.locker_id,
+            recipient_email=recipient_email,
+            parcel_id=parcel_id,
+            locker_id=locker_id,
             pin=new_pin,
-            expiry_time=parcel.otp_expiry,
-            pin_generation_url=pin_generation_url
+            expiry_time=otp_expiry,
+            pin_generation_token=token
         )
         
         # Audit logging: Record PIN generation event with timestamp and security details
         AuditService.log_event("PIN_GENERATED_VIA_EMAIL", details={
-            "parcel_id": parcel.id,
-            "locker_id": parcel.locker_id,
-            "generation_count": parcel.pin_generation_count,
+            "parcel_id": parcel_id,
+            "locker_id": locker_id,
+            "generation_count": generation_count,
             "notification_sent": notification_success
         })
         
         if notification_success:
-            return parcel, f"PIN generated successfully and sent to {parcel.recipient_email}"
+            return parcel, f"PIN generated successfully and {_delivery_phrase()} {recipient_email}"
         else:
             current_app.logger.warning(f"PIN generated but notification failed: {notification_message}")
             return parcel, f"PIN generated successfully. Note: Email notification may have failed."
             
     except Exception as e:
-        current_app.logger.error(f"Error generating PIN by token: {str(e)}")
+        current_app.logger.exception("Error generating PIN by token: %s", e)
         AuditService.log_event("PIN_GENERATION_ERROR", details={
             "error": str(e),
-            "token_prefix": _safe_token_prefix(token)
+            "token_tag": token_tag
         })
         return None, "An error occurred while generating the PIN."
 
+def _reissue_pin_token(parcel: PersistenceParcel, recipient_email: str, admin_reset: bool) -> Tuple[bool, str]:
+    """
+    FR-05: Re-issue PIN - Store a fresh PIN generation token for a parcel the caller has already validated,
+    then send the new link and audit it. Shared by the admin reset and the recipient request form;
+    exceptions are left to the caller's handler
+    """
+    # Read before commit expires the parcel, so the notification and audit need no reload
+    parcel_id, locker_id, deposited_at = parcel.id, parcel.locker_id, parcel.deposited_at
+    
+    # Generate new token; its expiry and the re-issue time share one clock read
+    now = datetime.now(dt.UTC)
+    token, token_expiry = PersistenceParcel.new_pin_token(now=now)
+    
+    # NFR-02: One conditional UPDATE stores the token and resets the generation count when an admin
+    # resets it or a day has passed, so concurrent requests cannot interleave a reset and an increment
+    if not ParcelRepository.reissue_pin_token(parcel_id, token, token_expiry, now, reset_count=admin_reset):
+        db.session.rollback()
+        return False, f"Parcel is not in 'deposited' state (current status: {parcel.status})."
+    
+    # Save parcel using repository
+    if not ParcelRepository.commit_session():
+        # Rollback handled by repository if commit fails
+        current_app.logger.error(f"Failed to save parcel {parcel_id} during PIN token regeneration via repository.")
+        return False, "Database error updating PIN token details."
+    
+    # Send new parcel ready notification via notification service (link built from the new token)
+    notification_success, notification_message = NotificationService.send_parcel_ready_notification(
+        recipient_email=recipient_email,
+        parcel_id=parcel_id,
+        locker_id=locker_id,
+        deposited_time=deposited_at,
+        pin_generation_token=token
+    )
+    
+    # Log the token regeneration
+    AuditService.log_event("PIN_TOKEN_REGENERATED", details={
+        "parcel_id": parcel_id,
+        "recipient_email": recipient_email,
+        "notification_sent": notification_success,
+        "admin_reset": admin_reset
+    })
+    
+    if notification_success:
+        return True, f"New PIN generation link {_delivery_phrase()} {recipient_email}"
+    else:
+        return True, f"New PIN generation link created. Note: Email notification may have failed."
+
 def regenerate_pin_token(parcel_id: int, recipient_email: str, admin_reset: bool = False) -> Tuple[bool, str]:
     """
     FR-05: Re-issue PIN - Regenerate PIN generation token for expired links
@@ -152,61 +236,17 @@ def regenerate_pin_token(parcel_id: int, recipient_email: str, admin_reset: bool
         if not parcel:
             return False, "Parcel not found."
         
-        if parcel.recipient_email.lower() != recipient_email.lower():
+        # Admin resets pass the stored address itself, so exact equality settles most calls without lowercasing
+        if parcel.recipient_email != recipient_email and parcel.recipient_email.lower() != recipient_email.lower():
             return False, "Email does not match parcel recipient."
         
         if parcel.status != 'deposited':
             return False, f"Parcel is not in 'deposited' state (current status: {parcel.status})."
         
-        # Generate new token
-        token = parcel.generate_pin_token()
-        
-        # Reset generation count if it's a new day OR if admin is resetting
-        if admin_reset:
-            parcel.pin_generation_count = 0  # Admin reset always resets the limit
-        elif parcel.last_pin_generation and (datetime.now(dt.UTC) - parcel.last_pin_generation).days >= 1:
-            parcel.pin_generation_count = 0  # Natural daily reset
-        
-        # Save parcel using repository
-        if not ParcelRepository.save(parcel):
-            # Rollback handled by repository if save fails
-            current_app.logger.error(f"Failed to save parcel {parcel.id} during PIN token regeneration via repository.")
-            return False, "Database error updating PIN token details."
-        
-        # Generate new PIN generation URL
-        try:
-            pin_generation_url = url_for('main.generate_pin_by_token_route', 
-                                       token=token, 
-                                       _external=True)
-        except RuntimeError:
-            # Not in request context (e.g., during testing) - use a placeholder URL
-            pin_generation_url = f"http://localhost/generate-pin/{token}"
-        
-        # Send new parcel ready notification via notification service
-        from app.services.notification_service import NotificationService
-        notification_success, notification_message = NotificationService.send_parcel_ready_notification(
-            recipient_email=recipient_email,
-            parcel_id=parcel.id,
-            locker_id=parcel.locker_id,
-            deposited_time=parcel.deposited_at,
-            pin_generation_url=pin_generation_url
-        )
-        
-        # Log the token regeneration
-        AuditService.log_event("PIN_TOKEN_REGENERATED", details={
-            "parcel_id": parcel.id,
-            "recipient_email": recipient_email,
-            "notification_sent": notification_success,
-            "admin_reset": admin_reset
-        })
-        
-        if notification_success:
-            return True, f"New PIN generation link sent to {recipient_email}"
-        else:
-            return True, f"New PIN generation link created. Note: Email notification may have failed."
+        return _reissue_pin_token(parcel, recipient_email, admin_reset)
             
     except Exception as e:
-        current_app.logger.error(f"Error regenerating PIN token: {str(e)}")
+        current_app.logger.exception("Error regenerating PIN token: %s", e)
         return False, "An error occurred while regenerating the PIN token."
 
 def request_pin_regeneration_by_recipient_email_and_locker(recipient_email: str, locker_id: str, admin_override_parcel_id: int = None):
@@ -230,11 +270,11 @@ def request_pin_regeneration_by_recipient_email_and_locker(recipient_email: str,
             # Return generic message for security (prevent fishing)
             return None, "If your details matched an active parcel, a new PIN would have been sent."
         
-        # Use email-based PIN regeneration (admin override means admin is resetting)
-        success, message = regenerate_pin_token(parcel.id, parcel.recipient_email, admin_reset=(admin_override_parcel_id is not None))
+        # Use email-based PIN regeneration on the parcel just found (admin override means admin is resetting)
+        success, message = _reissue_pin_token(parcel, parcel.recipient_email, admin_reset=(admin_override_parcel_id is not None))
         
         if success:
-            return parcel, "PIN generation link has been regenerated and sent to your email."
+            return parcel, f"PIN generation link has been regenerated and {_delivery_phrase()} your email."
         else:
             return None, message
             
@@ -242,5 +282,5 @@ def request_pin_regeneration_by_recipient_email_and_locker(recipient_email: str,
         # Invalid locker_id conversion
         return None, "Invalid locker ID format."
     except Exception as e:
-        current_app.logger.error(f"Error in request_pin_regeneration_by_recipient_email_and_locker: {str(e)}")
+        current_app.logger.exception("Error in request_pin_regeneration_by_recipient_email_and_locker: %s", e)
         return None, "An error occurred while processing your request." 
\ No newline at end of file
@@ -0,0 +1,45 @@
+# Rate limiter - in-process token buckets for abuse-prone endpoints
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class RateLimiter:
+    """
+    NFR-03: Security - Token-bucket limiter that rejects request floods before they reach the database
+    NFR-01: Performance - Each bucket is a (tokens, last_refill) pair refilled lazily on access;
+    state lives on the application, so it is shared by every request thread of one process only.
+    Every worker process has its own buckets, so each enforces 1/RATE_LIMITER_WORKERS of the configured
+    rate; the overall limit is approximate, since one client's requests are not spread evenly over workers
+    """
+
+    @staticmethod
+    def acquire(key: str, per_minute: int) -> bool:
+        """
+        Take one token from the bucket for key, holding at most this worker's share of per_minute tokens
+        (never less than one) and refilling at that share/60 per second.
+        Returns False when the bucket is empty; a non-positive per_minute disables limiting.
+        """
+        if per_minute <= 0:
+            return True
+        per_minute = max(1.0, per_minute / max(1, current_app.config.get('RATE_LIMITER_WORKERS', 1)))
+
+        state = current_app.extensions.setdefault('rate_limiter', {'lock': threading.Lock(), 'buckets': OrderedDict()})
+        buckets = state['buckets']
+        now = time.monotonic()
+
+        with state['lock']:
+            tokens, last_refill = buckets.pop(key, (float(per_minute), now))
+            tokens = min(float(per_minute), tokens + (now - last_refill) * per_minute / 60.0)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            buckets[key] = (tokens, now)
+
+            # Least recently used keys are evicted first; an evicted client simply starts with a full bucket
+            max_keys = current_app.config.get('RATE_LIMITER_MAX_KEYS', 10000)
+            while len(buckets) > max_keys:
+                buckets.popitem(last=False)
+
+        return allowed
@@ -1,19 +1,20 @@
 # create_admin.py (in campus_locker_system root)
 from app import create_app, db
+from app.services.admin_auth_service import AdminAuthService
+from app.business.admin_auth import AdminRole
 import sys
 
-def create_admin_user(username, password):
-    app = create_app()
+def create_admin_user(username, password, app=None):
+    # Callers provisioning several admins can pass one app and skip building one per user
+    app = app or create_app()
     with app.app_context():
-        from app.services.admin_auth_service import AdminAuthService
-        from app.business.admin_auth import AdminRole
-        
         admin_user, message = AdminAuthService.create_admin_user(username, password, AdminRole.ADMIN)
         
         if admin_user:
             print(f"Admin user {username} created successfully.")
         else:
             print(f"Error creating admin user: {message}")
+        return admin_user
 
 if __name__ == '__main__':
     if len(sys.argv) != 3:
@@ -22,7 +22,6 @@ import sys
 import json
 import argparse
 import sqlite3
-import shutil
 from datetime import datetime
 import datetime as dt
 from pathlib import Path
@@ -41,6 +40,27 @@ def get_database_path():
     """Get the database file path"""
     return Path(__file__).parent / 'databases' / 'campus_locker.db'
 
+SQLITE_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+def connect_db(db_path):
+    """
+    Open the locker database with the journal settings the application uses
+    NFR-02: Reliability - WAL plus synchronous=NORMAL (ENABLE_SQLITE_WAL_MODE / SQLITE_SYNCHRONOUS_MODE),
+    so a seed commit appends to the log instead of syncing the rollback journal and database file
+    """
+    wal_enabled = os.environ.get('ENABLE_SQLITE_WAL_MODE', 'true').lower() == 'true'
+    sync_mode = os.environ.get('SQLITE_SYNCHRONOUS_MODE', 'NORMAL').upper()
+    # The mode is interpolated into the PRAGMA, so only SQLite's own values are accepted
+    if wal_enabled and sync_mode not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS_MODE must be one of {', '.join(SQLITE_SYNCHRONOUS_MODES)}, got {sync_mode!r}")
+    
+    conn = sqlite3.connect(db_path)
+    if wal_enabled:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={sync_mode}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
 def create_backup(db_path):
     """NFR-04: Backup - Create timestamped backup for data preservation"""
     if not db_path.exists():
@@ -54,14 +74,21 @@ def create_backup(db_path):
     
     backup_path = backup_dir / f'campus_locker_backup_{timestamp}.db'
     
-    # NFR-04: Backup - Copy database file for overwrite protection
-    shutil.copy2(db_path, backup_path)
+    # NFR-04: Backup - SQLite's online backup API copies a consistent snapshot, including pages still
+    # in the WAL, while the application keeps writing; 1000 pages per step keeps each read lock short
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(backup_path)
+    try:
+        source.backup(target, pages=1000)
+    finally:
+        target.close()
+        source.close()
     print(f"💾 Created backup: {backup_path}")
     return backup_path
 
 def get_existing_lockers(db_path):
     """Get all existing lockers from database"""
-    conn = sqlite3.connect(db_path)
+    conn = connect_db(db_path)
     cursor = conn.cursor()
     cursor.execute("SELECT id, location, size, status FROM locker ORDER BY id")
     existing = cursor.fetchall()
@@ -78,6 +105,12 @@ def check_for_conflicts(existing_lockers, new_config):
     
     return conflicts, existing_ids, new_ids
 
+LOCKER_INSERT_SQL = "INSERT INTO locker (id, location, size, status) VALUES (?, ?, ?, ?)"
+
+def locker_row(locker):
+    """(id, location, size, status) parameters for LOCKER_INSERT_SQL"""
+    return (locker['id'], locker['location'], locker['size'], locker['status'])
+
 def add_new_lockers_safely(config, db_path):
     """Safely add ONLY new lockers without touching existing ones"""
     existing_lockers = get_existing_lockers(db_path)
@@ -119,27 +152,28 @@ def add_new_lockers_safely(config, db_path):
     backup_path = create_backup(db_path)
     
     # Add only new lockers
-    conn = sqlite3.connect(db_path)
+    conn = connect_db(db_path)
     cursor = conn.cursor()
     
-    added_count = 0
-    for locker in truly_new:
-        try:
-            cursor.execute("""
-                INSERT INTO locker (id, location, size, status) 
-                VALUES (?, ?, ?, ?)
-            """, (
-                locker['id'],
-                locker['location'], 
-                locker['size'],
-                locker['status']
-            ))
-            added_count += 1
-            print(f"  ✅ Added: ID {locker['id']} - {locker['location']} ({locker['size']})")
-        except sqlite3.IntegrityError as e:
-            print(f"  ❌ Failed to add locker ID {locker['id']}: {e}")
+    # NFR-01: Performance - One executemany in one transaction; only if it hits a constraint
+    # are the lockers retried one by one so each failure can be reported
+    added = truly_new
+    try:
+        cursor.executemany(LOCKER_INSERT_SQL, map(locker_row, truly_new))
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        added = []
+        for locker in truly_new:
+            try:
+                cursor.execute(LOCKER_INSERT_SQL, locker_row(locker))
+                added.append(locker)
+            except sqlite3.IntegrityError as e:
+                print(f"  ❌ Failed to add locker ID {locker['id']}: {e}")
     
     conn.commit()
+    added_count = len(added)
+    for locker in added:
+        print(f"  ✅ Added: ID {locker['id']} - {locker['location']} ({locker['size']})")
     conn.close()
     
     print(f"\n🎉 Successfully added {added_count} new lockers!")
@@ -159,19 +193,11 @@ def initial_seed_only(config, db_path):
     print(f"🌱 Database is empty. Performing initial seed...")
     
     lockers = config.get('lockers', [])
-    conn = sqlite3.connect(db_path)
+    conn = connect_db(db_path)
     cursor = conn.cursor()
     
-    for locker in lockers:
-        cursor.execute("""
-            INSERT INTO locker (id, location, size, status) 
-            VALUES (?, ?, ?, ?)
-        """, (
-            locker['id'],
-            locker['location'], 
-            locker['size'],
-            locker['status']
-        ))
+    # NFR-01: Performance - All lockers go in with one executemany and one commit
+    cursor.executemany(LOCKER_INSERT_SQL, map(locker_row, lockers))
     
     conn.commit()
     conn.close()
@@ -211,27 +237,22 @@ def admin_reset_with_confirmation(config, db_path):
     backup_path = create_backup(db_path)
     
     # Clear and reseed
-    conn = sqlite3.connect(db_path)
+    conn = connect_db(db_path)
     cursor = conn.cursor()
     
-    cursor.execute("DELETE FROM locker_sensor_data")
-    cursor.execute("DELETE FROM parcel") 
-    cursor.execute("DELETE FROM locker")
-    
+    # The deletes and the reseed share one transaction, so a failed insert leaves the old data in place
     lockers = config.get('lockers', [])
-    for locker in lockers:
-        cursor.execute("""
-            INSERT INTO locker (id, location, size, status) 
-            VALUES (?, ?, ?, ?)
-        """, (
-            locker['id'],
-            locker['location'], 
-            locker['size'],
-            locker['status']
-        ))
-    
-    conn.commit()
-    conn.close()
+    try:
+        cursor.execute("DELETE FROM locker_sensor_data")
+        cursor.execute("DELETE FROM parcel") 
+        cursor.execute("DELETE FROM locker")
+        cursor.executemany(LOCKER_INSERT_SQL, map(locker_row, lockers))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
     
     print(f"💥 DESTRUCTIVE OPERATION COMPLETED")
     print(f"   Deleted: {len(existing_lockers)} existing lockers")
@@ -242,7 +263,7 @@ def admin_reset_with_confirmation(config, db_path):
 
 def verify_seeding(config, db_path):
     """Verify database state without making changes"""
-    conn = sqlite3.connect(db_path)
+    conn = connect_db(db_path)
     cursor = conn.cursor()
     
     cursor.execute("SELECT id, location, size, status FROM locker ORDER BY id")
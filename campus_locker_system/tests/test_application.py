@@ -28,11 +28,14 @@ from app.services.locker_service import set_locker_status, mark_locker_as_emptie
 from app.services.parcel_service import assign_locker_and_create_parcel, process_pickup, retract_deposit, dispute_pickup, report_parcel_missing_by_recipient, process_overdue_parcels
 from app.services.pin_service import regenerate_pin_token, request_pin_regeneration_by_recipient_email_and_locker
 from app.persistence.models import Locker, Parcel, AuditLog, AdminUser, LockerSensorData # Add LockerSensorData
+from sqlalchemy import select
 from app import db, mail # Import db and mail for testing
 from flask import current_app # Add current_app for logger
 import pytest # Import pytest to use fixtures
 import json # Add this import
 from datetime import datetime, timedelta # For expired PIN test
+import datetime as dt
+from unittest.mock import patch
 from app.business.pin import PinManager
 from app.services.audit_service import AuditService
 from app.services.parcel_service import mark_parcel_missing_by_admin
@@ -44,6 +47,20 @@ from app.persistence.repositories.admin_repository import AdminRepository
 from app.persistence.repositories.audit_log_repository import AuditLogRepository
 from app.persistence.repositories.locker_sensor_data_repository import LockerSensorDataRepository
 
+@pytest.fixture
+def located_lockers(app):
+    """Same lockers as init_database, with the location the Locker model requires"""
+    with app.app_context():
+        lockers = [
+            Locker(location='Test Small 1', size='small', status='free'),
+            Locker(location='Test Medium 1', size='medium', status='free'),
+            Locker(location='Test Large 1', size='large', status='free'),
+            Locker(location='Test Small Occupied', size='small', status='occupied'),
+        ]
+        db.session.add_all(lockers)
+        db.session.commit()
+        yield [locker.id for locker in lockers]
+
 def test_generate_pin_and_hash():
     pin, hashed_value = PinManager.generate_pin_and_hash()
     assert pin is not None
@@ -595,6 +612,24 @@ def test_retract_deposit_parcel_not_found(init_database, app):
         assert error is not None
         assert "Parcel not found" in error
 
+def test_get_parcel_with_locker_single_query(located_lockers, app):
+    with app.app_context():
+        parcel, _ = assign_locker_and_create_parcel('with_locker@example.com', 'small')
+        assert parcel is not None
+        parcel_id, locker_id = parcel.id, parcel.locker_id
+        db.session.expunge_all()
+
+        loaded_parcel = ParcelRepository.get_by_id_with_locker(parcel_id)
+        assert loaded_parcel is not None
+        assert 'locker' in loaded_parcel.__dict__ # Eagerly loaded, no lazy SELECT on access
+        assert loaded_parcel.locker.id == locker_id
+        assert ParcelRepository.get_by_id_with_locker(99999) is None
+
+        # Row-locking variant used by state transitions (FOR UPDATE is a no-op on SQLite)
+        db.session.expunge_all()
+        locked_parcel = ParcelRepository.get_by_id_with_locker(parcel_id, for_update=True)
+        assert locked_parcel is not None and 'locker' in locked_parcel.__dict__
+
 def test_retract_deposit_parcel_not_deposited(init_database, app):
     with app.app_context():
         # 1. Deposit and then pick up a parcel
@@ -732,6 +767,97 @@ def test_process_pickup_fails_for_disputed_parcel(init_database, app):
         assert picked_parcel is None
         assert "Invalid PIN" in pickup_message
 
+def test_process_pickup_loses_race_to_concurrent_pickup(located_lockers, app):
+    with app.app_context():
+        result = assign_locker_and_create_parcel('pickup_race@example.com', 'small')
+        parcel, _ = result
+        assert parcel is not None
+
+        test_pin, test_hash = PinManager.generate_pin_and_hash()
+        parcel.pin_hash = test_hash
+        parcel.otp_expiry = PinManager.generate_expiry_time()
+        db.session.commit()
+
+        # Snapshot taken before a concurrent request claims the parcel
+        stale_candidates = ParcelRepository.get_deposited_pin_candidates(PinManager.generate_pin_lookup(test_pin))
+        claimed, locker_id = ParcelRepository.mark_picked_up_if_deposited(parcel.id, datetime.now(dt.UTC))
+        db.session.commit()
+        assert claimed and locker_id == parcel.locker_id
+
+        with patch('app.services.parcel_service.ParcelRepository.get_deposited_pin_candidates', return_value=stale_candidates):
+            picked_parcel, pickup_message = process_pickup(test_pin)
+
+        assert picked_parcel is None
+        assert "already been picked up" in pickup_message
+
+def test_process_pickup_uses_pin_lookup_index(located_lockers, app):
+    with app.app_context():
+        target, _ = assign_locker_and_create_parcel('pin_lookup_target@example.com', 'small')
+        other, _ = assign_locker_and_create_parcel('pin_lookup_other@example.com', 'medium')
+        assert target is not None and other is not None
+
+        test_pin, test_hash = PinManager.generate_pin_and_hash()
+        other_pin, other_hash = PinManager.generate_pin_and_hash()
+        target.pin_hash, target.pin_lookup = test_hash, PinManager.generate_pin_lookup(test_pin)
+        other.pin_hash, other.pin_lookup = other_hash, PinManager.generate_pin_lookup(other_pin)
+        target.otp_expiry = other.otp_expiry = PinManager.generate_expiry_time()
+        db.session.commit()
+
+        awaiting_pin, _ = assign_locker_and_create_parcel('pin_lookup_awaiting@example.com', 'large')
+        assert awaiting_pin is not None and awaiting_pin.pin_hash is None
+
+        candidates = ParcelRepository.get_deposited_pin_candidates(PinManager.generate_pin_lookup(test_pin))
+        assert target in candidates
+        assert other not in candidates
+        assert awaiting_pin not in candidates, "Parcels without a PIN yet should not be loaded for verification"
+
+        picked_parcel, _ = process_pickup(test_pin)
+        assert picked_parcel is not None and picked_parcel.id == target.id
+
+def test_process_pickup_survives_secret_key_rotation(located_lockers, app):
+    with app.app_context():
+        app.config['PIN_LOOKUP_KEY'] = 'persistent-pin-lookup-key'
+        parcel, _ = assign_locker_and_create_parcel('secret_rotation@example.com', 'small')
+        assert parcel is not None
+        test_pin, test_hash = PinManager.generate_pin_and_hash()
+        parcel.pin_hash, parcel.pin_lookup = test_hash, PinManager.generate_pin_lookup(test_pin)
+        parcel.otp_expiry = PinManager.generate_expiry_time()
+        db.session.commit()
+
+        # make build / make up write a fresh SECRET_KEY on every deploy
+        app.config['SECRET_KEY'] = 'rotated-' + app.config['SECRET_KEY']
+
+        picked_parcel, _ = process_pickup(test_pin)
+        assert picked_parcel is not None and picked_parcel.id == parcel.id
+
+def test_create_app_requires_pin_lookup_key_when_configured():
+    from app import create_app
+    from app.config import Config
+
+    class ProductionConfig(Config):
+        PIN_LOOKUP_KEY = None
+        REQUIRE_PIN_LOOKUP_KEY = True
+
+    with pytest.raises(RuntimeError, match="PIN_LOOKUP_KEY"):
+        create_app(ProductionConfig)
+
+def test_process_pickup_verifies_once_without_candidate(located_lockers, app):
+    with app.app_context():
+        parcel, _ = assign_locker_and_create_parcel('pin_timing@example.com', 'small')
+        assert parcel is not None
+        test_pin, test_hash = PinManager.generate_pin_and_hash()
+        parcel.pin_hash, parcel.pin_lookup = test_hash, PinManager.generate_pin_lookup(test_pin)
+        parcel.otp_expiry = PinManager.generate_expiry_time()
+        db.session.commit()
+        wrong_pin = str((int(test_pin) + 1) % 1000000).zfill(6)
+
+        # "Wrong PIN for an existing parcel" and "no parcel at all" must cost the same single PBKDF2 verify
+        for attempted_pin in (wrong_pin, "000000" if test_pin != "000000" else "111111"):
+            with patch('app.services.parcel_service.PinManager.verify_pin', wraps=PinManager.verify_pin) as verify_spy:
+                picked_parcel, _ = process_pickup(attempted_pin)
+            assert picked_parcel is None
+            assert verify_spy.call_count == 1
+
 # Test for set_locker_status with new parcel status
 def test_set_locker_status_free_fails_for_disputed_locker(init_database, app, test_admin_user):
     with app.app_context():
@@ -862,6 +988,57 @@ def test_report_missing_by_recipient_fail_wrong_state(init_database, app):
         assert error_return_to_sender is not None
         assert "cannot be reported missing by recipient from its current state: 'return_to_sender'" in error_return_to_sender
 
+def test_process_overdue_parcels_in_batches(app):
+    with app.app_context():
+        current_app.config['OVERDUE_PROCESSING_CHUNK_SIZE'] = 1
+        parcel_ids, locker_ids = [], []
+        for i, locker_status in enumerate(['occupied', 'disputed_contents']):
+            locker = Locker(location=f'Overdue Batch {i}', size='small', status=locker_status)
+            db.session.add(locker)
+            db.session.flush()
+            parcel = Parcel(locker_id=locker.id, recipient_email=f'overdue_batch{i}@example.com', status='deposited',
+                            deposited_at=datetime.now(dt.UTC) - timedelta(days=8))
+            db.session.add(parcel)
+            db.session.flush()
+            parcel_ids.append(parcel.id)
+            locker_ids.append(locker.id)
+        db.session.commit()
+
+        try:
+            with patch('app.services.parcel_service.AuditService.log_events_bulk', wraps=AuditService.log_events_bulk) as bulk_spy, \
+                 patch('app.services.parcel_service.LockerRepository.set_statuses_bulk', wraps=LockerRepository.set_statuses_bulk) as locker_spy:
+                processed_count, message = process_overdue_parcels()
+        finally:
+            current_app.config.pop('OVERDUE_PROCESSING_CHUNK_SIZE', None)
+
+        assert processed_count == 2
+        assert message == "2 overdue parcels processed."
+        # One bulk audit write per committed batch, one row per returned parcel
+        return_batches = [call.args[0] for call in bulk_spy.call_args_list
+                          if any(action == "PARCEL_MARKED_RETURN_TO_SENDER" for action, _ in call.args[0])]
+        assert [len(batch) for batch in return_batches] == [1, 1]
+        # Locker transitions are written with one UPDATE per batch
+        assert [call.args[0] for call in locker_spy.call_args_list] == [{locker_ids[0]: 'awaiting_collection'}, {locker_ids[1]: 'free'}]
+        returned_logs = AuditLog.query.filter_by(action="PARCEL_MARKED_RETURN_TO_SENDER").all()
+        assert sorted(json.loads(log.details)['parcel_id'] for log in returned_logs) == parcel_ids
+        for parcel_id in parcel_ids:
+            assert db.session.get(Parcel, parcel_id).status == 'return_to_sender'
+        assert db.session.get(Locker, locker_ids[0]).status == 'awaiting_collection'
+        assert db.session.get(Locker, locker_ids[1]).status == 'free'
+
+def test_overdue_scan_uses_status_deposited_index(app):
+    with app.app_context():
+        overdue_ids = (select(Parcel.id)
+                       .join(Locker, Locker.id == Parcel.locker_id)
+                       .where(Parcel.status == 'deposited', Parcel.deposited_at <= datetime.now(dt.UTC))
+                       .order_by(Parcel.id).limit(500))
+        # Plan with bound parameters, as the overdue batch UPDATE runs it
+        compiled = overdue_ids.compile(db.engine)
+        params = tuple(compiled.construct_params()[name] for name in compiled.positiontup)
+        params = tuple(value.isoformat() if isinstance(value, datetime) else value for value in params)
+        plan = " ".join(row[-1] for row in db.session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params))
+        assert "ix_parcel_status_deposited_at" in plan, f"Overdue scan should bound deposited_at through an index, got: {plan}"
+
 # Tests for mark_parcel_missing_by_admin service function
 def test_mark_missing_by_admin_success_deposited_parcel(init_database, app, test_admin_user):
     with app.app_context():
@@ -981,6 +1158,31 @@ def test_mark_missing_by_admin_already_missing(init_database, app, test_admin_us
         assert message == "Parcel is already marked as missing."
         assert updated_parcel.status == 'missing'
 
+def test_mark_missing_by_admin_single_commit(located_lockers, app):
+    with app.test_request_context():
+        admin = AdminUser(username="test_admin_for_single_commit")
+        admin.set_password("secure_password")
+        db.session.add(admin)
+        db.session.commit()
+        admin_id, admin_username = admin.id, admin.username
+        parcel, _ = assign_locker_and_create_parcel('admin_missing_single_commit@example.com', 'small')
+        assert parcel is not None
+
+        # Status changes and both audit entries are written with a single session commit
+        with patch.object(db.session, 'commit', wraps=db.session.commit) as mock_commit:
+            marked_parcel, error = mark_parcel_missing_by_admin(admin_id, admin_username, parcel.id)
+            assert mock_commit.call_count == 1
+        assert error is None
+        assert marked_parcel.status == 'missing'
+
+        for action in ("ADMIN_MARKED_PARCEL_MISSING", "LOCKER_SET_OUT_OF_SERVICE_FOR_MISSING_PARCEL"):
+            log_entry = AuditLog.query.filter(
+                AuditLog.action == action,
+                AuditLog.details.like(f'%"parcel_id": {parcel.id}%')
+            ).first()
+            assert log_entry is not None
+            assert log_entry.admin_id == admin_id
+
 
 # Tests for LockerSensorData Model
 def test_locker_sensor_data_creation(init_database, app):
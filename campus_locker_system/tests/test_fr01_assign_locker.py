@@ -33,6 +33,7 @@ import time
 import threading
 from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
+from sqlalchemy import event
 
 from app import create_app, db
 from app.persistence.models import Parcel, Locker, AuditLog
@@ -457,6 +458,46 @@ class TestFR01AssignLocker:
             assert final_locker_state is not None, "Final locker state should be retrievable"
             assert final_locker_state.status == "free", "FR-01: Locker status should be rolled back to free after failed commit"
 
+    def test_fr01_claim_fails_fast_when_size_exhausted(self, app, setup_test_lockers):
+        """
+        FR-01: Test that lockers are claimed atomically and exhaustion fails in one statement
+        Verifies each claim takes a different free locker and never an occupied or out-of-service one
+        """
+        with app.app_context():
+            claimed_ids = [LockerRepository.claim_available_locker_by_size("small").id for _ in range(2)]
+            assert claimed_ids == [801, 802], "FR-01: Claims should take the free small lockers in id order"
+
+            statements = []
+            def record_statement(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+            event.listen(db.engine, "before_cursor_execute", record_statement)
+            try:
+                result = assign_locker_and_create_parcel("test-fr01-exhausted@example.com", "small")
+            finally:
+                event.remove(db.engine, "before_cursor_execute", record_statement)
+
+            parcel, message = result
+            assert parcel is None and "no available small lockers" in message.lower()
+            assert len([s for s in statements if "locker" in s.lower()]) == 1, \
+                "FR-01: An exhausted size should be detected with a single locker statement"
+
+            db.session.commit()
+            assert {l.id: l.status for l in Locker.query.filter_by(size="small").all()} == {801: "occupied", 802: "occupied", 807: "occupied"}
+
+    def test_fr01_ready_email_links_to_pin_generation(self, app, setup_test_lockers):
+        """
+        FR-01: Test that the deposit email links to the new parcel's PIN generation page
+        Verifies the link is built from the parcel token by the notification service
+        """
+        with app.app_context():
+            with patch('app.services.notification_service.NotificationService._send_email', return_value=True) as mock_send_email:
+                parcel, _ = assign_locker_and_create_parcel("test-fr01-link@example.com", "medium")
+
+            assert parcel is not None
+            formatted_email = mock_send_email.call_args.args[1]
+            assert f"/generate-pin/{parcel.pin_generation_token}" in formatted_email.body, \
+                "FR-01: Deposit email should link to the parcel's PIN generation page"
+
     # ===== 6. CONCURRENT ASSIGNMENT TESTS =====
 
     def test_fr01_concurrent_assignment_safety(self, app, setup_test_lockers):
@@ -34,6 +34,9 @@ import re
 import time
 import threading
 from unittest.mock import patch, MagicMock
+from datetime import datetime, timedelta
+import datetime as dt
+from sqlalchemy import event, inspect
 
 from app import create_app, db
 from app.business.pin import PinManager
@@ -620,6 +623,141 @@ class TestFR02GeneratePin:
             # This relies on the fact that PinManager.verify_pin(hash2, pin1) will be false.
             assert not PinManager.verify_pin(current_hash, pin1), "FR-02: Previous PIN should not work with new hash"
 
+    def test_fr02_pin_generation_limit_enforced_atomically(self, app):
+        """
+        FR-02: Test that the daily generation limit is re-checked when the PIN is written
+        Verifies a generation that lands between the rule check and the write is not exceeded
+        """
+        with app.app_context():
+            parcel = Parcel(locker_id=999, recipient_email="atomic-fr02@example.com", status="deposited")
+            token = parcel.generate_pin_token()
+            db.session.add(parcel)
+            db.session.commit()
+            parcel_id = parcel.id
+            max_daily = app.config.get('MAX_PIN_GENERATIONS_PER_DAY', 3)
+
+            real_generate = PinManager.generate_pin_and_hash
+            def generate_after_concurrent_requests():
+                # Concurrent requests use up the daily limit after this one passed the rule check
+                db.session.execute(db.update(Parcel).where(Parcel.id == parcel_id).values(pin_generation_count=max_daily))
+                db.session.commit()
+                return real_generate()
+
+            with patch('app.services.notification_service.NotificationService.send_pin_generation_notification') as mock_notify, \
+                 patch.object(PinManager, 'generate_pin_and_hash', side_effect=generate_after_concurrent_requests):
+                result_parcel, message = generate_pin_by_token(token)
+
+            assert result_parcel is None
+            assert "Daily PIN generation limit reached" in message
+            mock_notify.assert_not_called()
+            stored = db.session.get(Parcel, parcel_id)
+            assert stored.pin_hash is None and stored.pin_generation_count == max_daily, \
+                "FR-02: No PIN should be written once the limit is used up"
+
+            # Within the limit the same path issues the PIN and counts it
+            stored.pin_generation_count = 0
+            db.session.commit()
+            with patch('app.services.notification_service.NotificationService.send_pin_generation_notification',
+                       return_value=(True, "sent")):
+                result_parcel, message = generate_pin_by_token(token)
+            assert result_parcel is not None and result_parcel.pin_hash is not None
+            assert result_parcel.pin_generation_count == 1
+
+    def test_fr02_pin_generation_count_restarts_each_day(self, app):
+        """
+        FR-02: Test that the first generation on a new day restarts the daily count
+        """
+        with app.app_context():
+            max_daily = app.config.get('MAX_PIN_GENERATIONS_PER_DAY', 3)
+            parcel = Parcel(locker_id=999, recipient_email="newday-fr02@example.com", status="deposited",
+                            pin_generation_count=max_daily, last_pin_generation=datetime.now(dt.UTC) - timedelta(days=2))
+            token = parcel.generate_pin_token()
+            db.session.add(parcel)
+            db.session.commit()
+
+            with patch('app.services.notification_service.NotificationService.send_pin_generation_notification',
+                       return_value=(True, "sent")):
+                result_parcel, message = generate_pin_by_token(token)
+
+            assert result_parcel is not None, message
+            assert result_parcel.pin_generation_count == 1, "FR-02: A new day should start the count at one generation"
+
+    def test_fr02_invalid_token_audit_omits_token(self, app):
+        """
+        FR-02: Test that failed token attempts are audited with a digest tag, never part of the token
+        """
+        with app.app_context():
+            token = "a1b2c3d4-0000-4000-8000-000000000000"
+            with patch('app.services.pin_service.AuditService.log_event_sampled') as mock_sampled:
+                result_parcel, message = generate_pin_by_token(token)
+
+            assert result_parcel is None
+            details = mock_sampled.call_args.kwargs['details']
+            assert details['token_tag'] == hashlib.blake2b(token.encode('utf-8'), digest_size=4).hexdigest()
+            assert token[:8] not in str(details), "FR-02: No part of the token should reach the audit log"
+
+    def test_fr02_pin_generation_does_not_reload_parcel_after_commit(self, app):
+        """
+        FR-02: Test that the notification after commit uses values read before it, not a refreshed parcel row
+        """
+        with app.app_context():
+            parcel = Parcel(locker_id=999, recipient_email="noreload-fr02@example.com", status="deposited")
+            token = parcel.generate_pin_token()
+            db.session.add(parcel)
+            db.session.commit()
+            db.session.expunge_all()
+
+            selects = []
+            def count_parcel_selects(conn, cursor, statement, parameters, context, executemany):
+                if statement.lstrip().upper().startswith("SELECT") and " parcel" in statement:
+                    selects.append(statement)
+
+            event.listen(db.engine, "before_cursor_execute", count_parcel_selects)
+            try:
+                with patch('app.services.notification_service.NotificationService.send_pin_generation_notification',
+                           return_value=(True, "sent")) as mock_notify:
+                    result_parcel, message = generate_pin_by_token(token)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count_parcel_selects)
+
+            assert result_parcel is not None, message
+            assert mock_notify.call_args.kwargs['recipient_email'] == "noreload-fr02@example.com"
+            assert len(selects) == 1, "FR-02: Only the token lookup should read the parcel row"
+
+    def test_fr02_token_lookup_loads_only_needed_columns(self, app):
+        """
+        FR-02: Test that the token lookup leaves PIN hashes and unrelated timestamps unloaded
+        """
+        with app.app_context():
+            parcel = Parcel(locker_id=999, recipient_email="loadonly-fr02@example.com", status="deposited")
+            token = parcel.generate_pin_token()
+            db.session.add(parcel)
+            db.session.commit()
+            db.session.expunge_all()
+
+            found = ParcelRepository.get_by_pin_generation_token(token)
+
+            assert found is not None and found.pin_generation_token == token
+            assert {'pin_hash', 'pin_lookup', 'otp_expiry', 'picked_up_at', 'reminder_sent_at'} <= inspect(found).unloaded
+
+    def test_fr02_background_delivery_reported_as_queued(self, app):
+        """
+        FR-02: Test that the user is told the PIN email was queued, not sent, when delivery runs in the background
+        """
+        with app.app_context():
+            parcel = Parcel(locker_id=999, recipient_email="queued-fr02@example.com", status="deposited")
+            token = parcel.generate_pin_token()
+            db.session.add(parcel)
+            db.session.commit()
+
+            with patch('app.services.notification_service.NotificationService.send_pin_generation_notification',
+                       return_value=(True, "queued")), \
+                 patch('app.services.notification_service.NotificationService.is_background_delivery_enabled', return_value=True):
+                result_parcel, message = generate_pin_by_token(token)
+
+            assert result_parcel is not None
+            assert message == "PIN generated successfully and queued for delivery to queued-fr02@example.com"
+
 
 # ===== STANDALONE TEST FUNCTIONS =====
 
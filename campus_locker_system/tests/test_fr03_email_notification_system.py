@@ -40,7 +40,7 @@ from app import create_app, db
 from app.business.notification import NotificationManager, NotificationType, EmailTemplate, FormattedEmail
 from app.services.notification_service import NotificationService
 from app.persistence.models import Parcel, Locker
-from app.adapters.email_adapter import EmailMessage, create_email_adapter
+from app.adapters.email_adapter import EmailMessage, create_email_adapter, FlaskMailAdapter
 # Add Repository Imports
 from app.persistence.repositories.locker_repository import LockerRepository
 from app.persistence.repositories.parcel_repository import ParcelRepository
@@ -411,6 +411,125 @@ class TestFR03EmailNotificationSystem:
             # Verify system continues operation
             assert isinstance(message, str), "FR-03: Should return error message string"
 
+    @patch('app.services.notification_service.NotificationService._send_email')
+    def test_fr03_background_delivery_retries(self, mock_send_email, app, test_locker_and_parcel):
+        """
+        FR-03: Test background email delivery
+        Verifies the request path only queues the email and the worker retries failed sends
+        """
+        with app.app_context():
+            app.config['NOTIFICATION_RETRY_BACKOFF_SECONDS'] = 0
+            mock_send_email.side_effect = [False, True]
+            locker, parcel = test_locker_and_parcel
+
+            with patch('app.services.notification_service.NotificationService._background_delivery_enabled', return_value=True):
+                success, message = NotificationService.send_parcel_ready_notification(
+                    "queued@example.com", parcel.id, locker.id, parcel.deposited_at, "http://example.com/pin"
+                )
+
+            assert success is True, "FR-03: Queued email should be reported as accepted"
+
+            # Wait for the queued send and its scheduled retry to finish
+            assert NotificationService.wait_for_deliveries(timeout=10), "FR-03: Background delivery should finish"
+
+            assert mock_send_email.call_count == 2, "FR-03: Failed background send should be retried"
+
+    @patch('app.services.notification_service.NotificationService._send_email')
+    def test_fr03_background_delivery_accounted_at_shutdown(self, mock_send_email, app, test_locker_and_parcel):
+        """
+        FR-03: Test process exit with an email waiting for a retry
+        Verifies shutdown makes one last attempt and audits the email as failed instead of dropping it
+        """
+        from app.persistence.models import AuditLog
+
+        with app.app_context():
+            # The FR-03 app uses the on-disk audit database; count only this test's failure rows
+            AuditLog.query.delete()
+            db.session.commit()
+
+            app.config['NOTIFICATION_RETRY_BACKOFF_SECONDS'] = 60
+            mock_send_email.return_value = False
+            locker, parcel = test_locker_and_parcel
+
+            with patch('app.services.notification_service.NotificationService._background_delivery_enabled', return_value=True):
+                success, _ = NotificationService.send_parcel_ready_notification(
+                    "shutdown@example.com", parcel.id, locker.id, parcel.deposited_at, "http://example.com/pin"
+                )
+            assert success is True
+
+            state = app.extensions['notification_delivery']
+            deadline = time.time() + 10
+            while not state['retry_heap'] and time.time() < deadline:
+                time.sleep(0.01)
+            assert state['retry_heap'], "FR-03: The failed send should be waiting for its retry"
+
+            NotificationService._shutdown_delivery(app, state)
+
+            assert mock_send_email.call_count == 2, "FR-03: Shutdown should make one last attempt instead of waiting"
+            assert NotificationService.wait_for_deliveries(timeout=0), "FR-03: Nothing should be left pending after shutdown"
+            failed = AuditLog.query.filter_by(action="NOTIFICATION_DELIVERY_FAILED").all()
+            assert len(failed) == 1, "FR-03: An email abandoned at shutdown should be audited for reissue"
+            assert '"reason": "shutdown"' in failed[0].details
+
+    @patch('app.services.notification_service.NotificationService._send_email')
+    def test_fr03_background_queue_refuses_when_full(self, mock_send_email, app, test_locker_and_parcel):
+        """
+        FR-03: Test the background delivery bound
+        Verifies a full queue refuses new emails instead of growing, and failed sends do not hold a worker while waiting
+        """
+        with app.app_context():
+            locker, parcel = test_locker_and_parcel
+            app.config['NOTIFICATION_QUEUE_MAX_SIZE'] = 1
+            app.config['NOTIFICATION_RETRY_BACKOFF_SECONDS'] = 0.2
+            app.config['NOTIFICATION_MAX_RETRIES'] = 1
+            mock_send_email.return_value = False
+            other_app = create_app()
+            other_app.config.update(NOTIFICATION_QUEUE_MAX_SIZE=1, NOTIFICATION_MAX_RETRIES=0)
+
+            with patch('app.services.notification_service.NotificationService._background_delivery_enabled', return_value=True):
+                first, _ = NotificationService.send_parcel_ready_notification(
+                    "first@example.com", parcel.id, locker.id, parcel.deposited_at, "http://example.com/pin")
+                second, _ = NotificationService.send_parcel_ready_notification(
+                    "second@example.com", parcel.id, locker.id, parcel.deposited_at, "http://example.com/pin")
+
+                # The bound is per application: another app still accepts email while this one is full
+                with other_app.app_context():
+                    other, _ = NotificationService.send_parcel_ready_notification(
+                        "other@example.com", parcel.id, locker.id, parcel.deposited_at, "http://example.com/pin")
+                    assert NotificationService.wait_for_deliveries(timeout=10)
+
+            assert first is True and second is False, "FR-03: A full notification queue should refuse new emails"
+            assert other is True, "FR-03: Each app should keep its own notification queue"
+            assert NotificationService.wait_for_deliveries(timeout=10)
+            assert mock_send_email.call_count == 3, "FR-03: The queued email should be retried once, then given up on"
+
+    def test_fr03_smtp_session_reused_across_sends(self, app):
+        """
+        FR-03: Test SMTP connection reuse
+        Verifies consecutive emails share one SMTP session, which is re-checked after idling and reopened when dropped
+        """
+        with app.app_context():
+            adapter = FlaskMailAdapter()
+            message = EmailMessage(to="student@example.com", subject="Parcel ready", body="Your parcel is ready")
+            FlaskMailAdapter._close_connection()
+
+            with patch('app.adapters.email_adapter.mail.connect') as mock_connect:
+                dropped, fresh = MagicMock(), MagicMock()
+                mock_connect.side_effect = [dropped, fresh]
+
+                assert adapter.send_email(message)[0] is True
+                assert adapter.send_email(message)[0] is True
+                assert mock_connect.call_count == 1, "FR-03: Back-to-back emails should share one SMTP session"
+                dropped.host.noop.assert_not_called()
+
+                app.config['SMTP_KEEPALIVE_SECONDS'] = -1
+                dropped.host.noop.side_effect = OSError("connection reset")
+                assert adapter.send_email(message)[0] is True
+                assert mock_connect.call_count == 2, "FR-03: A dropped idle session should be reopened"
+                assert fresh.send.call_count == 1
+
+            FlaskMailAdapter._close_connection()
+
     def test_fr03_email_validation_business_rules(self, app):
         """
         FR-03: Test email validation business rules
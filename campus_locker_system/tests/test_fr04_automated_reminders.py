@@ -30,11 +30,14 @@ sys.path.insert(0, str(project_root))
 
 import pytest
 import threading
+import json
 import time
 from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
 import datetime as dt
 
+from sqlalchemy import text, inspect
+
 from app import create_app, db
 from app.persistence.models import Parcel, Locker, AuditLog
 from app.services.parcel_service import process_reminder_notifications
@@ -211,6 +214,46 @@ class TestFR04AutomatedReminders:
             # Verify notification was sent
             mock_send.assert_called()
 
+    @patch('app.services.notification_service.NotificationService.send_24h_reminder_notification')
+    def test_fr04_bulk_processing_streams_in_batches(self, mock_send, app, test_parcel_eligible_for_reminder):
+        """
+        FR-04: Test that eligible parcels are streamed in bounded batches
+        Verifies every parcel is reminded even when the backlog spans several fetches
+        """
+        with app.app_context():
+            mock_send.return_value = (True, "Reminder sent successfully")
+            old_time = datetime.now(dt.UTC) - timedelta(hours=25)
+            extra_parcels = [Parcel(locker_id=999, recipient_email=f"batch{i}-fr04@example.com", status="deposited",
+                                    deposited_at=old_time, pin_hash="test_hash") for i in range(2)]
+            db.session.add_all(extra_parcels)
+            db.session.commit()
+            expected_ids = {test_parcel_eligible_for_reminder.id} | {parcel.id for parcel in extra_parcels}
+
+            app.config['REMINDER_PROCESSING_BATCH_SIZE'] = 2
+            try:
+                with patch('app.services.parcel_service.ParcelRepository.mark_reminders_sent',
+                           wraps=ParcelRepository.mark_reminders_sent) as mark_spy:
+                    processed_count, error_count = process_reminder_notifications()
+            finally:
+                app.config['REMINDER_PROCESSING_BATCH_SIZE'] = 500
+
+            assert processed_count == 3 and error_count == 0, "FR-04: Every eligible parcel should be reminded across batches"
+            assert set(mark_spy.call_args.args[0]) == expected_ids, "FR-04: All streamed parcels should be marked sent"
+            assert {call.kwargs['parcel_id'] for call in mock_send.call_args_list} == expected_ids
+
+    def test_fr04_reminder_scan_loads_only_needed_columns(self, app, test_parcel_eligible_for_reminder):
+        """
+        FR-04: Test that the reminder scan loads only the columns the sweep reads
+        """
+        with app.app_context():
+            db.session.expunge_all()
+            cutoff_time = datetime.now(dt.UTC) - timedelta(hours=24)
+            parcel = next(ParcelRepository.iter_deposited_needing_reminder(cutoff_time, 10))
+
+            unloaded = inspect(parcel).unloaded
+            assert {'pin_hash', 'otp_expiry', 'status'} <= unloaded, "FR-04: Unused parcel columns should not be loaded"
+            assert not {'id', 'locker_id', 'recipient_email', 'deposited_at', 'pin_generation_token'} & unloaded
+
     def test_fr04_bulk_processing_skips_ineligible(self, app, test_parcel_not_eligible):
         """
         FR-04: Test that bulk processing skips ineligible parcels
@@ -298,6 +341,33 @@ class TestFR04AutomatedReminders:
                 # Note: reminder_sent_at might still be None if no parcels were processed
                 # This is acceptable as the test verifies the processing completes without errors
 
+    def test_fr04_reminder_timestamps_batch_updated(self, app, test_parcel_eligible_for_reminder):
+        """
+        FR-04: Test that a reminder batch is marked sent in one statement
+        Verifies every reminded parcel gets the same batch timestamp
+        """
+        with app.app_context():
+            parcel_id = test_parcel_eligible_for_reminder.id
+
+            with patch('app.services.notification_service.NotificationService.send_24h_reminder_notification', return_value=(True, "Sent")), \
+                 patch('app.services.parcel_service.ParcelRepository.mark_reminders_sent', wraps=ParcelRepository.mark_reminders_sent) as mark_spy:
+                processed_count, error_count = process_reminder_notifications()
+
+            assert error_count == 0, "FR-04: Batch update should not report errors"
+            mark_spy.assert_called_once()
+            marked_ids, sent_at = mark_spy.call_args.args
+            assert parcel_id in marked_ids, "FR-04: Eligible parcel should be in the batch update"
+            assert len(marked_ids) == processed_count, "FR-04: Every reminded parcel should be marked"
+
+            db.session.expire_all()
+            # UTCDateTime stores whole seconds
+            assert db.session.get(Parcel, parcel_id).reminder_sent_at == sent_at.replace(microsecond=0), "FR-04: reminder_sent_at should be persisted"
+
+            success_logs = AuditLog.query.filter_by(action="FR-04_REMINDER_SENT_SUCCESS").all()
+            success_details = [json.loads(log.details) for log in success_logs]
+            assert any(d["parcel_id"] == parcel_id and d["recipient_email_domain"] == "example.com" for d in success_details), \
+                "FR-04: Reminder audit should record the recipient email domain"
+
     # ===== 5. ERROR HANDLING AND RESILIENCE TESTS =====
 
     @patch('app.services.notification_service.NotificationService.send_24h_reminder_notification')
@@ -381,6 +451,81 @@ class TestFR04AutomatedReminders:
             assert success is True, "FR-04: Should attempt email delivery"
             assert "sent" in message.lower(), "FR-04: Should confirm email sent"
 
+    @patch('app.services.notification_service.NotificationService._send_email')
+    def test_fr04_reminder_link_built_from_token(self, mock_send_email, app):
+        """
+        FR-04: Test that reminder links are built by the notification service from the parcel token
+        Verifies the reminder job no longer needs to prebuild a hardcoded localhost URL
+        """
+        with app.app_context():
+            mock_send_email.return_value = True
+
+            success, _ = NotificationService.send_24h_reminder_notification(
+                recipient_email="link-fr04@example.com",
+                parcel_id=1,
+                locker_id=1,
+                deposited_time=datetime.now(dt.UTC) - timedelta(hours=25),
+                pin_generation_token="token-fr04"
+            )
+            assert success is True
+            formatted_email = mock_send_email.call_args.args[1]
+            assert "/generate-pin/token-fr04" in formatted_email.body, "FR-04: Reminder should link to the parcel's PIN generation page"
+
+            assert NotificationService._build_pin_generation_url(None).endswith("/request-new-pin"), \
+                "FR-04: Parcels without a token should link to the new-PIN request page"
+
+    @patch('app.services.notification_service.NotificationService._send_email')
+    def test_fr04_bulk_reminder_links_resolved_once(self, mock_send_email, app):
+        """
+        FR-04: Test that the bulk sweep resolves the PIN link once and completes it per parcel
+        """
+        with app.app_context():
+            mock_send_email.return_value = True
+            old_time = datetime.now(dt.UTC) - timedelta(hours=25)
+            parcels = [Parcel(locker_id=999, recipient_email=f"links{i}-fr04@example.com", status="deposited",
+                              deposited_at=old_time, pin_hash="test_hash") for i in range(3)]
+            parcels[0].pin_generation_token = "sweep-token-0"
+            parcels[1].pin_generation_token = "sweep-token-1"
+            db.session.add_all(parcels)
+            db.session.commit()
+
+            with patch.object(NotificationService, '_resolve_pin_generation_url',
+                              wraps=NotificationService._resolve_pin_generation_url) as resolve_spy:
+                processed_count, error_count = process_reminder_notifications()
+                NotificationService._build_pin_generation_url("later-token")
+
+            assert processed_count == 3 and error_count == 0
+            assert resolve_spy.call_count == 2, "FR-04: Link templates should be resolved once and then reused"
+            bodies = {call.args[0]: call.args[1].body for call in mock_send_email.call_args_list}
+            assert "/generate-pin/sweep-token-0" in bodies["links0-fr04@example.com"]
+            assert "/generate-pin/sweep-token-1" in bodies["links1-fr04@example.com"]
+            assert "/request-new-pin" in bodies["links2-fr04@example.com"]
+
+    def test_fr04_reminder_link_cache_keyed_on_server_name(self, app):
+        """
+        FR-04: Test that PIN link templates are cached per SERVER_NAME, never per client Host header,
+        and that the localhost placeholders are not cached
+        """
+        with app.app_context():
+            app.extensions.pop('pin_generation_url_templates', None)
+            with app.test_request_context('/', headers={'Host': 'attacker.example'}):
+                prefix, _ = NotificationService.pin_generation_url_templates()
+            assert prefix == "http://localhost/generate-pin/", "FR-04: Cached links should use SERVER_NAME"
+            assert list(app.extensions['pin_generation_url_templates']) == [('localhost', 'http')]
+
+            app.extensions.pop('pin_generation_url_templates', None)
+            app.config['SERVER_NAME'] = None
+            try:
+                with app.test_request_context('/', headers={'Host': 'campus.example'}):
+                    prefix, _ = NotificationService.pin_generation_url_templates()
+                assert prefix == "http://campus.example/generate-pin/"
+                prefix, fallback = NotificationService.pin_generation_url_templates()
+                assert (prefix, fallback) == ("http://localhost/generate-pin/", "http://localhost/request-new-pin")
+                assert app.extensions['pin_generation_url_templates'] == {}, \
+                    "FR-04: Links without SERVER_NAME and placeholder links should not be cached"
+            finally:
+                app.config['SERVER_NAME'] = 'localhost'
+
     # ===== 7. AUDIT TRAIL AND LOGGING TESTS =====
 
     def test_fr04_audit_trail_logging(self, app, test_parcel_eligible_for_reminder):
@@ -446,6 +591,23 @@ class TestFR04AutomatedReminders:
             # Should complete in reasonable time
             assert processing_time < 10.0, "FR-04: Bulk processing should complete within 10 seconds"
 
+    def test_fr04_reminder_scan_uses_index(self, app):
+        """
+        FR-04: Test that the reminder scan is served by its composite index
+        Verifies every filter column is matched by the index instead of a table scan
+        """
+        with app.app_context():
+            query = Parcel.query.filter(
+                Parcel.status == 'deposited',
+                Parcel.deposited_at <= datetime.now(dt.UTC),
+                Parcel.reminder_sent_at.is_(None)
+            )
+            sql = str(query.statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+            plan = " ".join(row[-1] for row in db.session.execute(text("EXPLAIN QUERY PLAN " + sql)))
+
+            assert "ix_parcel_reminder_scan" in plan, f"FR-04: Reminder scan should use its index, got: {plan}"
+            assert "deposited_at<" in plan.replace(" ", ""), "FR-04: Index should also bound the deposit time range"
+
     def test_fr04_concurrent_processing_safety(self, app):
         """
         FR-04: Test that concurrent processing is handled safely
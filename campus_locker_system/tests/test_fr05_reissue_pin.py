@@ -33,6 +33,8 @@ current_dir = Path(__file__).parent
 project_root = current_dir.parent
 sys.path.insert(0, str(project_root))
 
+from sqlalchemy import text
+from werkzeug.middleware.proxy_fix import ProxyFix
 from app import create_app, db
 from app.business.pin import PinManager
 from app.services.pin_service import (
@@ -239,6 +241,24 @@ class TestFR05ReissuePin:
                 # Verify success
                 assert result_parcel is not None, "FR-05: Case insensitive email should work"
 
+    def test_fr05_email_lookup_has_no_wildcards(self, app, test_locker_and_parcel):
+        """
+        FR-05: Test the recipient lookup is exact apart from case
+        Verifies '_' and '%' in a submitted address do not match other recipients
+        """
+        with app.app_context():
+            locker, parcel = test_locker_and_parcel
+
+            assert ParcelRepository.get_by_email_and_locker_and_status("Test-FR05@Example.com", locker.id, 'deposited') is not None
+            assert ParcelRepository.get_by_email_and_locker_and_status("test_fr05@example.com", locker.id, 'deposited') is None
+            assert ParcelRepository.get_by_email_and_locker_and_status("%@example.com", locker.id, 'deposited') is None
+
+            plan = db.session.execute(text(
+                "EXPLAIN QUERY PLAN SELECT id FROM parcel WHERE lower(recipient_email) = :email AND locker_id = :locker_id AND status = :status"
+            ), {"email": "test-fr05@example.com", "locker_id": locker.id, "status": "deposited"}).all()
+            assert any("ix_parcel_email_lower_locker_status" in row[-1] for row in plan), \
+                "FR-05: Recipient lookup should use the lower(email) index"
+
     # ===== 3. TOKEN REGENERATION TESTS =====
 
     def test_fr05_token_regeneration_success(self, app, test_locker_and_parcel):
@@ -574,6 +594,77 @@ class TestFR05ReissuePin:
             successful_results = [r for r in results if r[0] is True]
             assert len(successful_results) >= 1, "FR-05: At least one regeneration should succeed"
 
+    def test_fr05_pin_requests_rate_limited_per_client(self, app, test_locker_and_parcel):
+        """
+        FR-05: Test that PIN link and re-issue requests are throttled per client before any lookup
+        """
+        locker, parcel = test_locker_and_parcel
+        app.config['PIN_LOOKUP_RPM'] = 2
+        client = app.test_client()
+
+        with patch('app.presentation.routes.request_pin_regeneration_by_recipient_email_and_locker',
+                   return_value=(None, "If your details matched an active parcel, a new PIN would have been sent.")) as mock_request, \
+             patch('app.presentation.routes.generate_pin_by_token', return_value=(None, "Invalid or expired token.")) as mock_generate:
+            form = {'recipient_email': parcel.recipient_email, 'locker_id': str(locker.id)}
+            assert client.post('/request-new-pin', data=form).status_code == 302
+            assert client.get('/generate-pin/unknown-token').status_code == 200
+
+            # Bucket is empty: both endpoints answer without reaching the service layer
+            assert client.post('/request-new-pin', data=form).status_code == 302
+            assert client.get('/generate-pin/unknown-token').status_code == 429
+            assert mock_request.call_count == 1 and mock_generate.call_count == 1
+
+            # Other clients have their own bucket
+            assert client.get('/generate-pin/unknown-token', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+            assert mock_generate.call_count == 2
+
+    def test_fr05_pin_rate_limit_keys_on_forwarded_client(self, app):
+        """
+        FR-05: Test that behind the nginx proxy each forwarded client gets its own bucket
+        """
+        app.config['PIN_LOOKUP_RPM'] = 1
+        # As create_app does with PROXY_FIX_X_FOR=1 (the nginx-fronted deployment)
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+        client = app.test_client()
+        proxy = {'REMOTE_ADDR': '172.18.0.5'}
+
+        with patch('app.presentation.routes.generate_pin_by_token', return_value=(None, "Invalid or expired token.")):
+            first = client.get('/generate-pin/t', environ_base=proxy, headers={'X-Forwarded-For': '203.0.113.7'})
+            repeat = client.get('/generate-pin/t', environ_base=proxy, headers={'X-Forwarded-For': '203.0.113.7'})
+            other = client.get('/generate-pin/t', environ_base=proxy, headers={'X-Forwarded-For': '198.51.100.9'})
+
+        assert first.status_code == 200 and repeat.status_code == 429
+        assert other.status_code == 200, "FR-05: A second client behind the same proxy should not share the first one's bucket"
+
+    def test_fr05_pin_rate_limit_ignores_forwarded_for_by_default(self, app):
+        """
+        FR-05: Test that without a configured proxy a client cannot rotate X-Forwarded-For to get fresh buckets
+        """
+        assert not isinstance(app.wsgi_app, ProxyFix), "FR-05: X-Forwarded-For should not be trusted by default"
+        app.config['PIN_LOOKUP_RPM'] = 1
+        client = app.test_client()
+
+        with patch('app.presentation.routes.generate_pin_by_token', return_value=(None, "Invalid or expired token.")):
+            first = client.get('/generate-pin/t', headers={'X-Forwarded-For': '203.0.113.7'})
+            spoofed = client.get('/generate-pin/t', headers={'X-Forwarded-For': '198.51.100.9'})
+
+        assert first.status_code == 200 and spoofed.status_code == 429, \
+            "FR-05: A direct client should keep its bucket whatever X-Forwarded-For it sends"
+
+    def test_fr05_pin_rate_limit_split_across_workers(self, app):
+        """
+        FR-05: Test that each worker process enforces its share of PIN_LOOKUP_RPM, so the
+        per-client limit holds across all workers rather than per worker
+        """
+        app.config['PIN_LOOKUP_RPM'] = 4
+        app.config['RATE_LIMITER_WORKERS'] = 2
+        client = app.test_client()
+
+        with patch('app.presentation.routes.generate_pin_by_token', return_value=(None, "Invalid or expired token.")):
+            statuses = [client.get('/generate-pin/t').status_code for _ in range(3)]
+
+        assert statuses == [200, 200, 429], "FR-05: With 2 workers each should allow half of PIN_LOOKUP_RPM"
+
 
 # ===== STANDALONE TEST FUNCTIONS =====
 
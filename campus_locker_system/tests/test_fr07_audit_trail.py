@@ -28,6 +28,7 @@ from unittest.mock import patch, MagicMock
 from flask import session
 import json
 from pathlib import Path
+from werkzeug.middleware.proxy_fix import ProxyFix
 import time
 import datetime as dt
 
@@ -38,6 +39,7 @@ sys.path.insert(0, str(project_root))
 
 from app import create_app, db
 from app.services.audit_service import AuditService
+from app.services.audit_writer import AuditWriter
 from app.services.parcel_service import assign_locker_and_create_parcel, process_pickup
 from app.services.admin_auth_service import AdminAuthService
 from app.services.locker_service import set_locker_status
@@ -584,6 +586,260 @@ class TestFR07AuditTrail:
             print(f"   ✅ Original log remains unchanged after additional logs")
             print(f"   ✅ FR-07 Audit Trail Integrity: PASS - Logs maintain integrity and tamper resistance")
 
+    def test_fr07_bulk_audit_events(self, app):
+        """
+        FR-07: Verify batch jobs can record several audit events with a single commit
+        """
+        with app.app_context():
+            print("\n🧪 FR-07: Bulk audit event logging")
+
+            AuditLog.query.delete()
+            db.session.commit()
+
+            events = [
+                ("BULK_TEST_EVENT", {"parcel_id": 1}),
+                ("BULK_TEST_EVENT", {"parcel_id": 2, "admin_id": 7, "admin_username": "batch_admin"}),
+                ("BULK_TEST_EVENT", None)
+            ]
+            with patch.object(db.session, 'commit', wraps=db.session.commit) as mock_commit:
+                AuditService.log_events_bulk(events)
+                assert mock_commit.call_count == 1, "Bulk logging should commit once"
+
+            bulk_logs = AuditLog.query.filter_by(action="BULK_TEST_EVENT").order_by(AuditLog.id).all()
+            assert len(bulk_logs) == 3, "All bulk events should be stored"
+            assert json.loads(bulk_logs[0].details) == {"parcel_id": 1}
+            assert bulk_logs[1].admin_id == 7 and bulk_logs[1].admin_username == "batch_admin"
+            assert "admin_id" not in json.loads(bulk_logs[1].details), "Admin fields should be lifted out of details"
+            assert bulk_logs[2].details is None
+            assert events[1][1] == {"parcel_id": 2, "admin_id": 7, "admin_username": "batch_admin"}, \
+                "The caller's details dict should not be modified"
+
+            # An empty batch is a no-op
+            AuditService.log_events_bulk([])
+            assert AuditLog.query.filter_by(action="BULK_TEST_EVENT").count() == 3
+
+            print("   ✅ FR-07 Bulk Audit Logging: PASS")
+
+    def test_fr07_lazy_audit_details(self, app):
+        """
+        FR-07: Verify lazy audit details are only built when audit logging is enabled
+        """
+        with app.app_context():
+            print("\n🧪 FR-07: Lazy audit details")
+
+            AuditLog.query.delete()
+            db.session.commit()
+
+            factory = MagicMock(return_value={"parcel_id": 1})
+            app.config['AUDIT_LOGGING_ENABLED'] = False
+            try:
+                AuditService.log_event_lazy("LAZY_TEST_EVENT", factory)
+                AuditService.log_events_bulk([("LAZY_TEST_EVENT", factory)])
+                assert factory.call_count == 0, "Details should not be built while audit logging is disabled"
+                assert AuditLog.query.filter_by(action="LAZY_TEST_EVENT").count() == 0
+            finally:
+                app.config['AUDIT_LOGGING_ENABLED'] = True
+
+            AuditService.log_event_lazy("LAZY_TEST_EVENT", factory)
+            AuditService.log_events_bulk([("LAZY_TEST_EVENT", factory)])
+            assert factory.call_count == 2
+            lazy_logs = AuditLog.query.filter_by(action="LAZY_TEST_EVENT").all()
+            assert len(lazy_logs) == 2
+            assert all(json.loads(log.details) == {"parcel_id": 1} for log in lazy_logs)
+
+            print("   ✅ FR-07 Lazy Audit Details: PASS")
+
+    def test_fr07_background_audit_writer(self, app):
+        """
+        FR-07: Verify audit events are queued off the request path and persisted by the writer
+        """
+        with app.app_context():
+            print("\n🧪 FR-07: Background audit writer")
+
+            AuditLog.query.delete()
+            db.session.commit()
+
+            app.config['TESTING'] = False
+            try:
+                with patch.object(AuditLogRepository, 'create_and_save_log', wraps=AuditLogRepository.create_and_save_log) as inline_spy:
+                    AuditService.log_event("QUEUED_TEST_EVENT", details={"parcel_id": 7})
+                    assert inline_spy.call_count == 0, "Committed audit events should be queued, not written inline"
+                AuditWriter.flush()
+            finally:
+                app.config['TESTING'] = True
+
+            db.session.expire_all()
+            queued_logs = AuditLog.query.filter_by(action="QUEUED_TEST_EVENT").all()
+            assert len(queued_logs) == 1
+            assert json.loads(queued_logs[0].details) == {"parcel_id": 7}
+            assert queued_logs[0].timestamp is not None
+
+            print("   ✅ FR-07 Background Audit Writer: PASS")
+
+    def test_fr07_background_audit_writer_flush_deadline(self, app):
+        """
+        FR-07: Verify a batch closes one flush window after its first event, even when
+        events keep arriving just inside the flush window
+        """
+        import queue
+        import threading
+        import time
+
+        print("\n🧪 FR-07: Background audit writer flush deadline")
+        app.config['AUDIT_WRITER_BATCH_SIZE'] = 100
+        app.config['AUDIT_WRITER_FLUSH_SECONDS'] = 0.2
+        entries_queue = queue.Queue()
+        stop = threading.Event()
+
+        def trickle():
+            while not stop.is_set():
+                entries_queue.put({"action": "TRICKLE_EVENT"})
+                time.sleep(0.15)
+
+        producer = threading.Thread(target=trickle, daemon=True)
+        producer.start()
+        try:
+            started = time.monotonic()
+            batch = AuditWriter._drain(app, entries_queue, block=True)
+            elapsed = time.monotonic() - started
+        finally:
+            stop.set()
+            producer.join()
+
+        assert 1 <= len(batch) <= 3
+        assert elapsed < 0.5, f"Batch stayed open {elapsed:.2f}s for a 0.2s flush window"
+
+        print("   ✅ FR-07 Background Audit Writer Flush Deadline: PASS")
+
+    def test_fr07_background_audit_writer_per_app(self, app):
+        """
+        FR-07: Verify each app's queued audit events land in that app's own audit database
+        """
+        import shutil
+        import tempfile
+        from app.config import Config
+
+        print("\n🧪 FR-07: Background audit writer per app")
+        test_dir = tempfile.mkdtemp(prefix='fr07_writer_')
+
+        class OtherAppConfig(Config):
+            TESTING = True
+            DATABASE_DIR = test_dir
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{Path(test_dir) / 'campus_locker.db'}"
+            SQLALCHEMY_BINDS = {'audit': f"sqlite:///{Path(test_dir) / 'campus_locker_audit.db'}"}
+
+        try:
+            other_app = create_app(OtherAppConfig)
+            with app.app_context():
+                AuditLog.query.delete()
+                db.session.commit()
+
+            app.config['TESTING'] = False
+            other_app.config['TESTING'] = False
+            try:
+                with other_app.app_context():
+                    AuditService.log_event("OTHER_APP_EVENT")
+                with app.app_context():
+                    AuditService.log_event("THIS_APP_EVENT")
+                    AuditWriter.flush()
+                with other_app.app_context():
+                    AuditWriter.flush()
+            finally:
+                app.config['TESTING'] = True
+                other_app.config['TESTING'] = True
+
+            assert app.extensions['audit_writer'] is not other_app.extensions['audit_writer']
+            with app.app_context():
+                db.session.expire_all()
+                assert [log.action for log in AuditLog.query.all()] == ["THIS_APP_EVENT"]
+            with other_app.app_context():
+                actions = [log.action for log in AuditLog.query.all()]
+                db.session.remove()
+                for engine in db.engines.values():
+                    engine.dispose()
+            assert "OTHER_APP_EVENT" in actions and "THIS_APP_EVENT" not in actions
+
+            print("   ✅ FR-07 Background Audit Writer Per App: PASS")
+        finally:
+            shutil.rmtree(test_dir, ignore_errors=True)
+
+    def test_fr07_sampled_audit_events(self, app):
+        """
+        FR-07: Verify repeated failures from one source are logged once per window with a suppressed count
+        """
+        with app.app_context():
+            print("\n🧪 FR-07: Sampled audit events")
+
+            AuditLog.query.delete()
+            db.session.commit()
+
+            start = time.time()
+            with patch('app.services.audit_service.time.time', return_value=start):
+                for _ in range(3):
+                    AuditService.log_event_sampled("SAMPLED_TEST_FAIL", {"reason": "x"}, source="10.0.0.1")
+                AuditService.log_event_sampled("SAMPLED_TEST_FAIL", {"reason": "x"}, source="10.0.0.2")
+            assert AuditLog.query.filter_by(action="SAMPLED_TEST_FAIL").count() == 2, \
+                "Only the first event per source should be written within a window"
+
+            with patch('app.services.audit_service.time.time', return_value=start + 61):
+                AuditService.log_event_sampled("SAMPLED_TEST_FAIL", {"reason": "x"}, source="10.0.0.1")
+
+            assert AuditLog.query.filter_by(action="SAMPLED_TEST_FAIL").count() == 3
+            suppressed = AuditLog.query.filter_by(action="SAMPLED_TEST_FAIL_SUPPRESSED").all()
+            assert len(suppressed) == 1, "Only windows with repeats should produce a suppressed summary"
+            assert json.loads(suppressed[0].details)["source"] == "10.0.0.1"
+            assert json.loads(suppressed[0].details)["suppressed_count"] == 2
+
+            print("   ✅ FR-07 Sampled Audit Events: PASS")
+
+    def test_fr07_sampled_audit_events_flushed_after_burst(self, app):
+        """
+        FR-07: Verify the suppressed count of a burst is written by the audit writer once its window
+        closes, even when the source sends nothing more
+        """
+        with app.app_context():
+            AuditLog.query.delete()
+            db.session.commit()
+
+            app.config['TESTING'] = False
+            app.config['AUDIT_SAMPLING_WINDOW_SECONDS'] = 1
+            try:
+                for _ in range(3):
+                    AuditService.log_event_sampled("SAMPLED_BURST_FAIL", {"reason": "x"}, source="10.0.0.3")
+                deadline = time.time() + 10
+                while time.time() < deadline:
+                    db.session.expire_all()
+                    suppressed = AuditLog.query.filter_by(action="SAMPLED_BURST_FAIL_SUPPRESSED").all()
+                    if suppressed:
+                        break
+                    time.sleep(0.1)
+            finally:
+                app.config['TESTING'] = True
+                app.config['AUDIT_SAMPLING_WINDOW_SECONDS'] = 60
+
+            assert len(suppressed) == 1, "The writer should record the suppressed count once the window closes"
+            assert json.loads(suppressed[0].details)["suppressed_count"] == 2
+            assert AuditLog.query.filter_by(action="SAMPLED_BURST_FAIL").count() == 1
+
+    def test_fr07_sampled_audit_events_per_forwarded_client(self, app):
+        """
+        FR-07: Verify clients behind the nginx proxy are sampled and recorded by their forwarded address
+        """
+        with app.app_context():
+            AuditLog.query.delete()
+            db.session.commit()
+
+            # As create_app does with PROXY_FIX_X_FOR=1 (the nginx-fronted deployment)
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+            client = app.test_client()
+            proxy = {'REMOTE_ADDR': '172.18.0.5'}
+            for forwarded in ('203.0.113.7', '203.0.113.7', '198.51.100.9'):
+                client.get('/generate-pin/not-a-real-token', environ_base=proxy, headers={'X-Forwarded-For': forwarded})
+
+            logged = AuditLog.query.filter_by(action="PIN_GENERATION_FAIL_INVALID_TOKEN").all()
+            assert sorted(json.loads(log.details)["source"] for log in logged) == ['198.51.100.9', '203.0.113.7'], \
+                "Each forwarded client should get its own sampled event, not the proxy address"
+
     def test_fr07_comprehensive_coverage_summary(self, app):
         """
         FR-07: Test Category 9 - Comprehensive Coverage Summary
@@ -8,6 +8,7 @@ Test for the reliability and crash safety features including:
 - Health check functionality
 """
 
+import pytest
 import tempfile
 import os
 import sqlite3
@@ -185,6 +186,91 @@ def test_nfr02_crash_safety_verification():
         import shutil
         shutil.rmtree(test_dir, ignore_errors=True)
 
+def test_nfr02_rejects_invalid_synchronous_mode():
+    """Test NFR-02: An unknown SQLITE_SYNCHRONOUS_MODE is rejected before it reaches the PRAGMA"""
+    print("🧪 NFR-02 Reliability Test: Invalid synchronous mode")
+
+    from app.services.database_service import DatabaseService
+    from flask import Flask
+
+    test_dir = tempfile.mkdtemp(prefix='nfr02_sync_')
+
+    try:
+        main_db = Path(test_dir) / 'campus_locker.db'
+        sqlite3.connect(str(main_db)).close()
+
+        app = Flask(__name__)
+        app.config.update({
+            'ENABLE_SQLITE_WAL_MODE': True,
+            'SQLITE_SYNCHRONOUS_MODE': 'NORMAL; DROP TABLE locker',
+            'DATABASE_DIR': test_dir
+        })
+        with app.app_context():
+            with pytest.raises(Exception, match="SQLITE_SYNCHRONOUS_MODE must be one of"):
+                DatabaseService.configure_sqlite_wal_mode()
+
+        conn = sqlite3.connect(str(main_db))
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        conn.close()
+        assert journal_mode.upper() != 'WAL', "No PRAGMA should run with an invalid synchronous mode"
+
+        print("✅ NFR-02: Invalid synchronous mode rejected")
+    finally:
+        import shutil
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+def test_nfr02_schema_upgrade_of_existing_database():
+    """Test NFR-02: Existing databases gain new columns and indexes on startup"""
+    print("🧪 NFR-02 Reliability Test: Schema upgrade of existing database")
+
+    from app import create_app, db
+    from app.config import Config
+
+    test_dir = tempfile.mkdtemp(prefix='nfr02_upgrade_')
+
+    try:
+        main_db = Path(test_dir) / 'campus_locker.db'
+
+        # Parcel table as created by an older release (no PIN lookup column, no indexes)
+        conn = sqlite3.connect(str(main_db))
+        conn.execute("""CREATE TABLE parcel (
+            id INTEGER PRIMARY KEY, locker_id INTEGER, pin_hash VARCHAR(128), otp_expiry DATETIME,
+            recipient_email VARCHAR(120) NOT NULL, status VARCHAR(50) NOT NULL, deposited_at DATETIME NOT NULL,
+            picked_up_at DATETIME, pin_generation_token VARCHAR(128), pin_generation_token_expiry DATETIME,
+            pin_generation_count INTEGER NOT NULL, last_pin_generation DATETIME, reminder_sent_at DATETIME)""")
+        # Older releases could store statuses with stray whitespace
+        conn.execute("""INSERT INTO parcel (recipient_email, status, deposited_at, pin_generation_count)
+            VALUES ('legacy@example.com', ' deposited ', '2024-01-01 00:00:00', 0)""")
+        conn.commit()
+        conn.close()
+
+        class UpgradeTestConfig(Config):
+            TESTING = True
+            DATABASE_DIR = test_dir
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{main_db}"
+            SQLALCHEMY_BINDS = {'audit': f"sqlite:///{Path(test_dir) / 'campus_locker_audit.db'}"}
+
+        app = create_app(UpgradeTestConfig)
+        with app.app_context():
+            assert db.engine.pool.size() == Config.DB_POOL_SIZE, "File databases should use the configured connection pool"
+
+        conn = sqlite3.connect(str(main_db))
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(parcel)")}
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(parcel)")}
+        statuses = [row[0] for row in conn.execute("SELECT status FROM parcel")]
+        conn.close()
+
+        assert 'pin_lookup' in columns, "Missing parcel columns should be added on startup"
+        assert {'ix_parcel_status_locker_id', 'ix_parcel_pin_generation_token', 'ix_parcel_status_pin_lookup', 'ix_parcel_reminder_scan',
+            'ix_parcel_status_deposited_at', 'ix_parcel_email_lower_locker_status'} <= indexes, \
+            "Missing parcel indexes should be created on startup"
+        assert statuses == ['deposited'], "Existing parcel statuses should be trimmed on startup"
+
+        print("✅ NFR-02: Existing database upgraded to current schema")
+    finally:
+        import shutil
+        shutil.rmtree(test_dir, ignore_errors=True)
+
 def test_nfr02_reliability_summary():
     """NFR-02 comprehensive reliability test summary"""
     print("\n" + "="*70)
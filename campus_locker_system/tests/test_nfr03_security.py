@@ -188,6 +188,16 @@ class TestNFR03Security:
                 assert stored_password.startswith('$2b$'), "Should use bcrypt format"
                 print(f"   ✅ Step 3: Password securely hashed with bcrypt (not plain text)")
                 
+                # Test 2.2b: A taken username cannot be registered again
+                duplicate, duplicate_msg = AdminAuthService.create_admin_user(
+                    username=test_username,
+                    password=test_password,
+                    role=AdminRole.ADMIN
+                )
+                assert duplicate is None and duplicate_msg == "Username already exists", "Duplicate usernames should be rejected"
+                assert AdminRepository.username_exists(test_username) is True
+                assert AdminRepository.username_exists("no_such_admin") is False
+                
                 # Test 2.3: Authentication flow security
                 print("   🔄 Step 4: Testing authentication security...")
                 
@@ -16,12 +16,13 @@ import time
 import sys
 from datetime import datetime, timedelta
 from pathlib import Path
+from unittest.mock import patch
 
 # Add the parent directory to sys.path to import from seed_lockers.py
 parent_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(parent_dir))
 
-from seed_lockers import create_backup, add_new_lockers_safely
+from seed_lockers import create_backup, add_new_lockers_safely, admin_reset_with_confirmation, connect_db
 
 
 def test_nfr04_backup_creation():
@@ -250,6 +251,98 @@ def test_nfr04_backup_directory_structure():
         shutil.rmtree(test_dir, ignore_errors=True)
 
 
+def test_nfr04_backup_of_live_wal_database():
+    """Test 4: Backups include committed rows still in the WAL of an open connection"""
+    print("🧪 NFR-04 Test 4: Backup of live WAL database")
+    
+    test_dir = tempfile.mkdtemp(prefix='nfr04_wal_')
+    db_path = Path(test_dir) / 'campus_locker.db'
+    
+    try:
+        # The writer stays open, as the running application would, so nothing is checkpointed
+        writer = sqlite3.connect(str(db_path))
+        writer.execute("PRAGMA journal_mode=WAL")
+        writer.execute("PRAGMA wal_autocheckpoint=0")
+        writer.execute("CREATE TABLE locker (id INTEGER PRIMARY KEY, location TEXT, size TEXT, status TEXT)")
+        writer.executemany("INSERT INTO locker (id, location, size, status) VALUES (?, ?, ?, ?)",
+                           [(i, f"Locker {i}", "small", "free") for i in range(1, 4)])
+        writer.commit()
+        
+        try:
+            backup_path = create_backup(db_path)
+        finally:
+            writer.close()
+        
+        backup_conn = sqlite3.connect(str(backup_path))
+        locker_count = backup_conn.execute("SELECT COUNT(*) FROM locker").fetchone()[0]
+        backup_conn.close()
+        
+        assert locker_count == 3, "Backup should contain rows committed to the WAL"
+        
+        print("✅ NFR-04 Test 4: Backup of live WAL database - PASSED")
+        
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+
+def test_nfr04_admin_reset_rolls_back_on_failure():
+    """Test 5: A failed admin reset leaves the existing lockers in place"""
+    print("🧪 NFR-04 Test 5: Admin reset rollback")
+    
+    test_dir = tempfile.mkdtemp(prefix='nfr04_reset_')
+    db_path = Path(test_dir) / 'campus_locker.db'
+    
+    try:
+        conn = sqlite3.connect(str(db_path))
+        conn.execute("CREATE TABLE locker (id INTEGER PRIMARY KEY, location TEXT, size TEXT, status TEXT)")
+        conn.execute("CREATE TABLE parcel (id INTEGER PRIMARY KEY, locker_id INTEGER)")
+        conn.execute("CREATE TABLE locker_sensor_data (id INTEGER PRIMARY KEY, locker_id INTEGER)")
+        conn.execute("INSERT INTO locker (id, location, size, status) VALUES (1, 'Existing', 'small', 'free')")
+        conn.commit()
+        conn.close()
+        
+        # Duplicate IDs make the reseed fail after the deletes have run
+        config = {'lockers': [{'id': 7, 'location': 'New', 'size': 'small', 'status': 'free'}] * 2}
+        with patch('builtins.input', side_effect=['DELETE ALL LOCKERS', 'YES DELETE']):
+            with pytest.raises(sqlite3.IntegrityError):
+                admin_reset_with_confirmation(config, db_path)
+        
+        conn = sqlite3.connect(str(db_path))
+        lockers = conn.execute("SELECT id, location FROM locker").fetchall()
+        conn.close()
+        
+        assert lockers == [(1, 'Existing')], "Failed reset should keep the existing lockers"
+        
+        print("✅ NFR-04 Test 5: Admin reset rollback - PASSED")
+        
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+
+def test_nfr04_connect_db_rejects_invalid_synchronous_mode():
+    """Test 6: Seed connections only accept SQLite's synchronous modes"""
+    print("🧪 NFR-04 Test 6: Seed connection synchronous mode")
+    
+    test_dir = tempfile.mkdtemp(prefix='nfr04_sync_')
+    db_path = Path(test_dir) / 'campus_locker.db'
+    
+    try:
+        with patch.dict(os.environ, {'ENABLE_SQLITE_WAL_MODE': 'true', 'SQLITE_SYNCHRONOUS_MODE': 'full'}):
+            conn = connect_db(db_path)
+            sync_mode = conn.execute("PRAGMA synchronous").fetchone()[0]
+            conn.close()
+        assert sync_mode == 2, "Valid modes should be applied case-insensitively"
+        
+        with patch.dict(os.environ, {'ENABLE_SQLITE_WAL_MODE': 'true', 'SQLITE_SYNCHRONOUS_MODE': 'NORMAL; DROP TABLE locker'}):
+            with pytest.raises(ValueError):
+                connect_db(db_path)
+        
+        print("✅ NFR-04 Test 6: Seed connection synchronous mode - PASSED")
+        
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+
 def run_nfr04_standalone_tests():
     """Run all standalone NFR-04 tests"""
     print("=" * 80)
@@ -274,6 +367,15 @@ def run_nfr04_standalone_tests():
         test_nfr04_backup_directory_structure()
         test_results.append(("Directory Structure", True))
         
+        test_nfr04_backup_of_live_wal_database()
+        test_results.append(("Live WAL Backup", True))
+        
+        test_nfr04_admin_reset_rolls_back_on_failure()
+        test_results.append(("Admin Reset Rollback", True))
+        
+        test_nfr04_connect_db_rejects_invalid_synchronous_mode()
+        test_results.append(("Synchronous Mode Validation", True))
+        
     except Exception as e:
         print(f"❌ Test failed: {str(e)}")
         test_results.append(("Failed Test", False))
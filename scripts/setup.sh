@@ -56,6 +56,8 @@ if [ ! -f .env ]; then
 # Application
 FLASK_ENV=production
 SECRET_KEY=your-secret-key-change-in-production
+# Keep this value across deployments: issued PINs are looked up by an HMAC under it
+PIN_LOOKUP_KEY=$(openssl rand -hex 32)
 
 # Database
 DATABASE_URL=sqlite:///databases/campus_locker.db